@@ -0,0 +1,148 @@
+# backend/admission.py
+import logging
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+from telegram import Update
+
+from notifier import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Причины отказа, они же имена счетчиков admission_rejected
+REJECT_OVERLOADED = 'overloaded'
+REJECT_RATE_LIMITED = 'rate_limited'
+REJECT_DUPLICATE = 'duplicate'
+
+
+class AdmissionController:
+    """Допуск обновлений к обработчикам
+
+    Проверки идут от дешевых к дорогим и не трогают БД: общий лимит
+    обновлений в работе (сверх него обновления сбрасываются, а не копятся
+    в очереди), повтор того же заказа из Web App в пределах duplicate_window
+    секунд и token bucket пользователя - rate обновлений в секунду с запасом
+    burst. Администраторы из exempt_ids не ограничиваются. Нулевой rate,
+    max_in_flight или duplicate_window отключают соответствующую проверку.
+
+    Заказ запоминается как уже полученный, только когда он допущен; если
+    обработчик не справился, forget() снимает отметку, и повтор пройдет.
+    on_notice(update, reason) вызывается, когда об отказе стоит сообщить
+    пользователю: всегда для заказа из Web App, для прочих обновлений - не
+    чаще раза в notice_interval секунд на пользователя.
+    """
+
+    def __init__(self, rate: float, burst: float, max_in_flight: int,
+                 duplicate_window: float, max_buckets: int = 10000,
+                 exempt_ids: Iterable[int] = (),
+                 on_reject: Optional[Callable[[str], None]] = None,
+                 on_notice: Optional[Callable[[Update, str], None]] = None,
+                 notice_interval: float = 30.0, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.duplicate_window = duplicate_window
+        self.max_buckets = max_buckets
+        self.exempt_ids = frozenset(exempt_ids)
+        self.on_reject = on_reject
+        self.on_notice = on_notice
+        self.notice_interval = notice_interval
+        self.clock = clock
+        self.in_flight = 0
+        self._buckets: Dict[int, TokenBucket] = {}
+        # Отпечаток заказа -> момент, до которого повтор отбрасывается; порядок вставки
+        # совпадает с порядком истечения, поэтому просроченные всегда в начале
+        self._recent: Dict[int, float] = {}
+        # Пользователь -> момент, до которого об отказах ему не сообщаем; устроено так же
+        self._noticed: Dict[int, float] = {}
+
+    @property
+    def buckets(self) -> int:
+        return len(self._buckets)
+
+    def admit(self, update: object) -> bool:
+        """Решить, обрабатывать ли обновление; допущенное нужно закрыть release()"""
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is not None and user.id in self.exempt_ids:
+            self.in_flight += 1
+            return True
+
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return self._reject(REJECT_OVERLOADED, update, user)
+
+        if user is not None:
+            fingerprint = self._fingerprint(update, user.id) if self.duplicate_window else None
+            if fingerprint is not None and fingerprint in self._recent:
+                return self._reject(REJECT_DUPLICATE, update, user)
+            if self.rate and not self._bucket(user.id).try_acquire():
+                return self._reject(REJECT_RATE_LIMITED, update, user)
+            # Отклоненный по лимиту заказ не запоминается: повтор после паузы должен пройти
+            if fingerprint is not None:
+                self._recent[fingerprint] = self.clock() + self.duplicate_window
+
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+    def forget(self, update: object):
+        """Обработка не удалась: повтор того же заказа больше не считается дублем"""
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is not None and self.duplicate_window:
+            fingerprint = self._fingerprint(update, user.id)
+            if fingerprint is not None:
+                self._recent.pop(fingerprint, None)
+
+    def _reject(self, reason: str, update: object, user) -> bool:
+        logger.debug(f"Update from {user.id if user else None} rejected: {reason}")
+        if self.on_reject is not None:
+            self.on_reject(reason)
+        if self.on_notice is not None and user is not None and self._notice_due(update, user.id):
+            self.on_notice(update, reason)
+        return False
+
+    def _notice_due(self, update: Update, user_id: int) -> bool:
+        message = update.effective_message
+        if message is not None and message.web_app_data is not None:
+            return True
+        now = self.clock()
+        self._expire(self._noticed, now)
+        if user_id in self._noticed:
+            return False
+        self._noticed[user_id] = now + self.notice_interval
+        return True
+
+    def _fingerprint(self, update: Update, user_id: int) -> Optional[int]:
+        """Отпечаток заказа из Web App (None для прочих обновлений); заодно чистит просроченные"""
+        message = update.effective_message
+        if message is None or message.web_app_data is None:
+            return None
+        self._expire(self._recent, self.clock())
+        return hash((user_id, message.web_app_data.data))
+
+    @staticmethod
+    def _expire(deadlines: Dict[int, float], now: float):
+        while deadlines:
+            key, expires = next(iter(deadlines.items()))
+            if expires > now:
+                break
+            del deadlines[key]
+
+    def _bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._evict_buckets()
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, capacity=self.burst, clock=self.clock)
+        return bucket
+
+    def _evict_buckets(self):
+        """Освободить место: сначала полные (простаивающие) ведра, затем самые старые"""
+        for user_id in [uid for uid, bucket in self._buckets.items() if bucket.is_idle()]:
+            del self._buckets[user_id]
+        # Если активны почти все, сносим десятую часть, чтобы не сканировать таблицу на каждом
+        # новом пользователе; такой пользователь просто начнет с полного ведра
+        if len(self._buckets) >= self.max_buckets:
+            for user_id in list(self._buckets)[:max(1, self.max_buckets // 10)]:
+                del self._buckets[user_id]
@@ -0,0 +1,63 @@
+# backend/benchmarks/bench_db_pool.py
+"""Сравнение задержки вызовов Database: соединение на вызов против пула"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import aiosqlite
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+ITERATIONS = 2000
+
+
+async def legacy_get_user(db_path: str, user_id: int):
+    """Старое поведение: новое соединение на каждый вызов"""
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+        return await cursor.fetchone()
+
+
+async def legacy_create_order(db_path: str, user_id: int) -> int:
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute(
+            '''INSERT INTO orders
+               (user_id, items, total_amount, delivery_type, scheduled_time, address, notes)
+               VALUES (?, ?, ?, ?, ?, ?, ?)''',
+            (user_id, json.dumps([{'id': 101, 'quantity': 1}]), 150, 'pickup', None, None, '')
+        )
+        await db.commit()
+        return cursor.lastrowid
+
+
+async def measure(name: str, func, iterations: int = ITERATIONS):
+    start = time.perf_counter()
+    for i in range(iterations):
+        await func(i)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<34} {elapsed / iterations * 1e6:10.1f} us/call")
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        db = Database(db_path)
+        await db.connect()
+        await db.create_user(1, 'bench', 'Bench', 'User')
+
+        await measure('get_user (connect per call)', lambda i: legacy_get_user(db_path, 1))
+        await measure('get_user (pool)', lambda i: db.get_user(1))
+        await measure('create_order (connect per call)', lambda i: legacy_create_order(db_path, 1), 500)
+        await measure('create_order (pool)',
+                      lambda i: db.create_order(1, [{'id': 101, 'name': 'Эспрессо', 'price': 150, 'quantity': 1}], 150), 500)
+
+        await db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+# backend/benchmarks/bench_export.py
+"""Потоковая выгрузка заказов: пиковая память на растущих периодах
+
+Синтетическая таблица из --rows заказов равномерно покрывает --days дней.
+Выгружаются периоды разной длины; при потоковой выгрузке пик памяти Python
+(tracemalloc) должен оставаться одинаковым, а расти - только размер файла.
+tracemalloc замедляет выгрузку в несколько раз; с --no-tracemalloc печатается
+только пиковый RSS процесса. В RSS входят страницы файла БД, отображенные
+через mmap (до mmap_size на каждое соединение-читатель), - это общий кэш
+страниц ОС, а не память выгрузки.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+from export import write_orders  # noqa: E402
+
+START = datetime(2024, 1, 1)
+ITEMS = [
+    {'id': 101, 'name': 'Эспрессо', 'price': 150, 'quantity': 2, 'options': {'Размер': 'Стандартный'}},
+    {'id': 203, 'name': 'Круассан', 'price': 120, 'quantity': 1, 'options': {}},
+]
+
+
+def populate(db_path: str, rows: int, days: int):
+    """Заполнить таблицы напрямую, минуя очередь записи"""
+    step = days * 86400 / rows
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(
+            '''INSERT INTO orders (id, user_id, total_amount, status, delivery_type,
+                                   scheduled_time, address, notes, created_at)
+               VALUES (?, ?, 420, 'completed', 'takeaway', 'Как можно скорее', '', 'Без сахара', ?)''',
+            ((i, 10000 + i % 5000, (START + timedelta(seconds=i * step)).strftime('%Y-%m-%d %H:%M:%S'))
+             for i in range(1, rows + 1))
+        )
+        conn.executemany(
+            '''INSERT INTO order_items (order_id, position, menu_item_id, name, quantity, unit_price, options)
+               VALUES (?, ?, ?, ?, ?, ?, ?)''',
+            ((i, position, item['id'], item['name'], item['quantity'], item['price'],
+              json.dumps(item['options'], ensure_ascii=False))
+             for i in range(1, rows + 1) for position, item in enumerate(ITEMS))
+        )
+    conn.close()
+
+
+async def export(db: Database, days: int, fmt: str, trace: bool):
+    since = START.date().isoformat()
+    until = (START + timedelta(days=days)).date().isoformat()
+    with tempfile.TemporaryFile() as out:
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        count = await write_orders(db.iter_orders(since, until), fmt, out)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace else None
+        tracemalloc.stop()
+        size = out.tell()
+
+    # ru_maxrss в Linux - в килобайтах, за все время жизни процесса
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{fmt:<6} {days:4d} days {count:9d} rows {elapsed:7.2f} s {count / elapsed:9.0f} rows/s "
+          f"file {size / 2 ** 20:8.1f} MiB  "
+          + (f"peak {peak / 2 ** 20:6.2f} MiB  " if trace else '')
+          + f"max rss {rss:7.1f} MiB")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=100)
+    parser.add_argument('--formats', default='csv,jsonl')
+    parser.add_argument('--no-tracemalloc', dest='trace', action='store_false')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        # Схему создают миграции при connect(), заполняем уже после
+        db = Database(db_path)
+        await db.connect()
+        start = time.perf_counter()
+        populate(db_path, args.rows, args.days)
+        print(f"populated {args.rows} orders in {time.perf_counter() - start:.1f} s")
+
+        try:
+            for fmt in args.formats.split(','):
+                for days in sorted({1, max(1, args.days // 10), args.days}):
+                    await export(db, days, fmt, args.trace)
+        finally:
+            await db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,238 @@
+# backend/benchmarks/bench_handlers.py
+"""Нагрузочный бенчмарк обработчиков CoffeeShopBot с поддельным Bot API
+
+Синтетические обновления прогоняются через настоящие обработчики на временной
+базе. Для каждого обработчика считаются пропускная способность, задержки
+p50/p95/p99 и число SQL-операторов на обновление. Результаты пишутся в JSON,
+чтобы сравнивать их между коммитами.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# HTTP-эндпоинты метрик и меню бенчмарку не нужны
+os.environ.setdefault('METRICS_PORT', '0')
+os.environ.setdefault('MENU_PORT', '0')
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application, ContextTypes  # noqa: E402
+
+from bot import CoffeeShopBot  # noqa: E402
+from database import Database  # noqa: E402
+from fakes import FakeRequest, callback_update, text_update, web_app_update  # noqa: E402
+from notifier import NotificationDispatcher  # noqa: E402
+
+ADMIN_ID = 1
+FIRST_USER_ID = 10000
+ORDER = {
+    'items': [{'id': 101, 'name': 'Эспрессо', 'price': 150, 'quantity': 2,
+               'options': {'Размер': 'Стандартный', 'Молоко': 'Соевое'}},
+              {'id': 203, 'name': 'Круассан', 'price': 120, 'quantity': 1, 'options': {}}],
+    'total': 420,
+    'delivery_type': 'takeaway',
+    'scheduled_time': 'Как можно скорее',
+    'address': '',
+    'notes': 'Без сахара'
+}
+# Доля каждого обработчика в смешанной нагрузке по умолчанию
+DEFAULT_MIX = 'start=2,handle_message=3,handle_web_app_data=2,update_order_status=1,show_order_history=2'
+
+
+class StatementCounter:
+    """Счетчик SQL-операторов на всех соединениях пула"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, statement: str):
+        self.count += 1
+
+    async def attach(self, db: Database):
+        for conn in [db._writer, *db._reader_conns]:
+            await conn.set_trace_callback(self)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class HandlerBenchmark:
+    def __init__(self, users: int, history: int, concurrency: int, latency: float):
+        self.users = users
+        self.history = history
+        self.concurrency = concurrency
+        self.latency = latency
+        self.update_id = 0
+        self.order_ids: List[int] = []
+        self.rng = random.Random(42)
+
+    async def setup(self, tmp: str):
+        self.db = Database(os.path.join(tmp, 'bench.db'))
+        self.shop = CoffeeShopBot(
+            db=self.db, notifier=NotificationDispatcher(global_rate=1e6, per_chat_rate=1e6))
+        self.request = FakeRequest(latency=self.latency)
+        self.application = self.shop.build_application(
+            Application.builder().token('123456:BENCH').request(self.request))
+        await self.application.initialize()
+        await self.shop.on_startup(self.application)
+
+        # Зарегистрированные пользователи с историей заказов
+        for user_id in self.user_ids():
+            await self.db.create_user(user_id, f'user{user_id}', 'Bench', 'User')
+            await self.db.update_user_profile(user_id, name='Bench', phone='+70000000000')
+        self.order_ids = await asyncio.gather(*(
+            self.db.create_order(user_id, ORDER['items'], ORDER['total'])
+            for user_id in self.user_ids() for _ in range(self.history)
+        ))
+
+        self.counter = StatementCounter()
+        await self.counter.attach(self.db)
+
+    async def teardown(self):
+        await self.shop.on_shutdown(self.application)
+        await self.application.shutdown()
+
+    def user_ids(self) -> range:
+        return range(FIRST_USER_ID, FIRST_USER_ID + self.users)
+
+    def next_update_id(self) -> int:
+        self.update_id += 1
+        return self.update_id
+
+    def make_update(self, handler: str) -> Dict:
+        """Синтетическое обновление для указанного обработчика"""
+        user_id = self.rng.choice(self.user_ids())
+        update_id = self.next_update_id()
+        if handler == 'start':
+            return text_update(update_id, user_id, '/start')
+        if handler == 'handle_message':
+            return text_update(update_id, user_id, self.rng.choice(
+                ['👤 Мой профиль', '📞 Связаться с нами', 'ℹ️ О нас']))
+        if handler == 'show_order_history':
+            return text_update(update_id, user_id, '📋 История заказов')
+        if handler == 'handle_web_app_data':
+            return web_app_update(update_id, user_id, ORDER)
+        if handler == 'update_order_status':
+            status = self.rng.choice(['preparing', 'ready', 'completed'])
+            return callback_update(update_id, ADMIN_ID, f"status_{status}_{self.rng.choice(self.order_ids)}")
+        raise ValueError(f"Unknown handler {handler}")
+
+    def handler(self, name: str) -> Callable:
+        return getattr(self.shop, name)
+
+    async def run_phase(self, plan: List[str]) -> Dict[str, Dict]:
+        """Прогнать список обработчиков с заданной параллельностью"""
+        latencies: Dict[str, List[float]] = {name: [] for name in plan}
+        work = iter([(name, self.make_update(name)) for name in plan])
+        statements_before = self.counter.count
+
+        async def worker():
+            for name, data in work:
+                update = Update.de_json(data, self.application.bot)
+                context = ContextTypes.DEFAULT_TYPE.from_update(update, self.application)
+                start = time.perf_counter()
+                await self.handler(name)(update, context)
+                latencies[name].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        elapsed = time.perf_counter() - start
+
+        statements = self.counter.count - statements_before
+        return {
+            'updates': len(plan),
+            'seconds': elapsed,
+            'throughput': len(plan) / elapsed,
+            'statements_per_update': statements / len(plan),
+            'latency_ms': {
+                name: {
+                    'count': len(values),
+                    'p50': percentile(values, 50) * 1000,
+                    'p95': percentile(values, 95) * 1000,
+                    'p99': percentile(values, 99) * 1000,
+                }
+                for name, values in latencies.items() if values
+            },
+        }
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for part in mix.split(','):
+        name, weight = part.split('=')
+        weights[name.strip()] = int(weight)
+    return weights
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--history', type=int, default=50, help='заказов в истории каждого пользователя')
+    parser.add_argument('--updates', type=int, default=2000, help='обновлений на каждый этап')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--latency', type=float, default=0.0, help='имитация задержки Bot API, секунды')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='веса обработчиков: name=weight,...')
+    parser.add_argument('--output', default='bench_handlers.json')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # Меню читается относительно корня репозитория
+    os.chdir(os.path.dirname(BACKEND_DIR))
+
+    mix = parse_mix(args.mix)
+    bench = HandlerBenchmark(args.users, args.history, args.concurrency, args.latency)
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'params': vars(args),
+        'handlers': {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        await bench.setup(tmp)
+        try:
+            # Каждый обработчик отдельно, затем смешанная нагрузка
+            for name in mix:
+                phase = await bench.run_phase([name] * args.updates)
+                results['handlers'][name] = phase
+                latency = phase['latency_ms'][name]
+                print(f"{name:<22} {phase['throughput']:9.1f} upd/s  "
+                      f"p50 {latency['p50']:7.2f} ms  p95 {latency['p95']:7.2f} ms  "
+                      f"p99 {latency['p99']:7.2f} ms  {phase['statements_per_update']:5.1f} stmt/upd")
+
+            plan = bench.rng.choices(list(mix), weights=list(mix.values()), k=args.updates)
+            results['mixed'] = await bench.run_phase(plan)
+            print(f"{'mixed':<22} {results['mixed']['throughput']:9.1f} upd/s  "
+                  f"{results['mixed']['statements_per_update']:5.1f} stmt/upd")
+        finally:
+            await bench.teardown()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
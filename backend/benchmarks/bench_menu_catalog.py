@@ -0,0 +1,75 @@
+# backend/benchmarks/bench_menu_catalog.py
+"""Скорость проверки и пересчета заказов по индексам снимка MenuCatalog
+
+Заказы приходят строкой web_app_data, поэтому оба пути начинают с разбора
+JSON; индексированный путь - decode_order, как в обработчике заказа.
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from menu import MenuCatalog  # noqa: E402
+from order_schema import decode_order  # noqa: E402
+
+MENU_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'menu.json')
+ORDERS = 20000
+
+
+def synthetic_orders(catalog: MenuCatalog, count: int):
+    """Случайные корректные заказы из 1-6 позиций с опциями в виде web_app_data"""
+    rng = random.Random(42)
+    items = list(catalog.snapshot.items.values())
+    orders = []
+    for _ in range(count):
+        order = []
+        for item in rng.sample(items, rng.randint(1, 6)):
+            options = {o['name']: rng.choice(o['choices']) for o in item.get('options', [])}
+            order.append({'id': item['id'], 'name': item['name'], 'price': 1,
+                          'quantity': rng.randint(1, 3), 'options': options})
+        orders.append(json.dumps({'items': order, 'delivery_type': 'pickup'}, ensure_ascii=False))
+    return orders
+
+
+def naive_validate(menu: dict, payload: str):
+    """Проверка линейным поиском по вложенному dict, как без индексов"""
+    total = 0
+    for raw in json.loads(payload)['items']:
+        for category in menu['categories']:
+            match = next((i for i in category['items'] if i['id'] == raw['id']), None)
+            if match:
+                break
+        else:
+            raise ValueError(raw['id'])
+        for name, choice in raw['options'].items():
+            option = next(o for o in match.get('options', []) if o['name'] == name)
+            if choice not in option['choices']:
+                raise ValueError(choice)
+        total += match['price'] * raw['quantity']
+    return total
+
+
+def main():
+    catalog = MenuCatalog(MENU_PATH)
+    orders = synthetic_orders(catalog, ORDERS)
+
+    start = time.perf_counter()
+    for order in orders:
+        naive_validate(catalog.data, order)
+    naive = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for order in orders:
+        decode_order(order, catalog.snapshot)
+    indexed = time.perf_counter() - start
+
+    print(f"orders: {ORDERS}")
+    print(f"nested dict scan: {naive / ORDERS * 1e6:8.2f} us/order")
+    print(f"decode_order:     {indexed / ORDERS * 1e6:8.2f} us/order  ({ORDERS / indexed:,.0f} orders/s)")
+
+
+if __name__ == '__main__':
+    main()
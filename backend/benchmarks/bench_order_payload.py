@@ -0,0 +1,136 @@
+# backend/benchmarks/bench_order_payload.py
+"""Заказ из Web App: разбор, проверка и запись - прежний путь против order_schema
+
+Прежний путь: json.loads, проверка по снимку меню со сборкой новых
+словарей (прежний MenuCatalog.validate_order), выборка полей
+через .get() и create_order, который кодирует позиции повторным json.dumps.
+Новый путь: decode_order за один проход и save_order с уже закодированными
+позициями. Оба пути пишут одно и то же (заказ, позиции, баллы, строку
+поиска), так что разница - только в разборе и кодировании. Сначала
+меряется только процессорная часть (разбор + проверка + кодирование),
+затем вместе с записью в БД через групповой коммит.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+from menu import MAX_QUANTITY, MenuCatalog, MenuSnapshot, MenuValidationError  # noqa: E402
+from order_schema import decode_order, encode_lines  # noqa: E402
+
+MENU_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'menu.json')
+
+
+def synthetic_payloads(catalog: MenuCatalog, count: int):
+    """Строки web_app_data.data в том виде, как их шлет frontend/app.js"""
+    rng = random.Random(42)
+    items = list(catalog.snapshot.items.values())
+    payloads = []
+    for _ in range(count):
+        lines = []
+        for item in rng.sample(items, rng.randint(1, 6)):
+            options = {o['name']: rng.choice(o['choices']) for o in item.get('options', [])}
+            lines.append({'id': item['id'], 'name': item['name'], 'price': item['price'],
+                          'quantity': rng.randint(1, 3), 'options': options})
+        payloads.append(json.dumps({
+            'user_id': '1000', 'items': lines, 'total': sum(l['price'] * l['quantity'] for l in lines),
+            'delivery_type': 'pickup', 'scheduled_time': 'Как можно скорее', 'address': '',
+            'notes': 'Без сахара'
+        }, ensure_ascii=False))
+    return payloads
+
+
+def legacy_validate(snapshot: MenuSnapshot, items):
+    """Прежняя проверка: новые словари позиций с ценами из меню и сумма"""
+    if not isinstance(items, list) or not items:
+        raise MenuValidationError("Заказ пуст")
+    validated = []
+    total = 0
+    for raw in items:
+        item = snapshot.items.get(raw.get('id'))
+        if item is None:
+            raise MenuValidationError(f"Позиция {raw.get('id')!r} отсутствует в меню")
+        quantity = raw.get('quantity')
+        if type(quantity) is not int or not 1 <= quantity <= MAX_QUANTITY:
+            raise MenuValidationError(f"Некорректное количество для «{item['name']}»")
+        options = raw.get('options') or {}
+        allowed = snapshot.options[item['id']]
+        for name, choice in options.items():
+            choices = allowed.get(name)
+            if choices is None or choice not in choices:
+                raise MenuValidationError(f"Недопустимая опция {name}: {choice} для «{item['name']}»")
+        validated.append({'id': item['id'], 'name': item['name'], 'price': item['price'],
+                          'quantity': quantity, 'options': options})
+        total += item['price'] * quantity
+    return validated, total
+
+
+def legacy_prepare(catalog: MenuCatalog, raw: str):
+    data = json.loads(raw)
+    items, total = legacy_validate(catalog.snapshot, data.get('items'))
+    return items, total, data
+
+
+def legacy_prepare_encoded(catalog: MenuCatalog, raw: str):
+    items, _, _ = legacy_prepare(catalog, raw)
+    return encode_lines(items)
+
+
+def schema_prepare(catalog: MenuCatalog, raw: str):
+    return decode_order(raw, catalog.snapshot)
+
+
+async def legacy_store(db: Database, catalog: MenuCatalog, user_id: int, raw: str) -> int:
+    items, total, data = legacy_prepare(catalog, raw)
+    return await db.create_order(user_id, items, total, data.get('delivery_type', 'pickup'),
+                                 data.get('scheduled_time'), data.get('address'), data.get('notes', ''))
+
+
+async def schema_store(db: Database, catalog: MenuCatalog, user_id: int, raw: str) -> int:
+    return (await db.save_order(user_id, decode_order(raw, catalog.snapshot))).id
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    args = parser.parse_args()
+
+    catalog = MenuCatalog(MENU_PATH)
+    payloads = synthetic_payloads(catalog, args.orders)
+
+    print(f"orders: {args.orders}")
+    for name, prepare in (('legacy', legacy_prepare_encoded), ('schema', schema_prepare)):
+        start = time.perf_counter()
+        for raw in payloads:
+            prepare(catalog, raw)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<7} decode+validate+encode {elapsed / args.orders * 1e6:8.2f} us/order")
+
+    for name, store in (('legacy', legacy_store), ('schema', schema_store)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Database(os.path.join(tmp, 'bench.db'))
+            await db.connect()
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def place(i: int):
+                async with semaphore:
+                    await store(db, catalog, 1000 + i % 500, payloads[i])
+
+            start = time.perf_counter()
+            await asyncio.gather(*(place(i) for i in range(args.orders)))
+            elapsed = time.perf_counter() - start
+            await db.close()
+        print(f"{name:<7} decode+validate+store  {elapsed / args.orders * 1e6:8.2f} us/order "
+              f"({args.orders / elapsed:,.0f} orders/s)")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
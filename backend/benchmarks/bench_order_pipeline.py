@@ -0,0 +1,141 @@
+# backend/benchmarks/bench_order_pipeline.py
+"""Оформление заказа с баллами: отдельные шаги против одной единицы записи
+
+Раздельный путь - то, что потребовалось бы без save_order с баллами:
+транзакция заказа (заказ, позиции, строка поиска), вторая транзакция с
+начислением и списанием баллов и чтение профиля для сообщения
+администраторам через пул читателей (кэш профиля после смены баланса
+недействителен). Конвейер - save_order: все то же одной единицей записи,
+профиль возвращает RETURNING. Для каждого пути печатается число обращений
+к потокам соединений aiosqlite на заказ, задержка одного заказа без
+конкуренции и пропускная способность при --concurrency одновременных
+заказах, плюс сверка баланса с суммой начислений и списаний.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import aiosqlite
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+from menu import MenuCatalog  # noqa: E402
+from order_schema import decode_order  # noqa: E402
+from search import SEARCH_INSERT, items_text  # noqa: E402
+
+MENU_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'menu.json')
+FIRST_USER_ID = 1000
+PAYLOAD = json.dumps({
+    'items': [{'id': 101, 'quantity': 2, 'options': {}}, {'id': 203, 'quantity': 1, 'options': {}}],
+    'delivery_type': 'pickup', 'scheduled_time': 'Как можно скорее', 'notes': 'Без сахара',
+    'redeem_points': 50
+}, ensure_ascii=False)
+
+# Каждое обращение к соединению aiosqlite - переход в его поток и обратно
+calls = 0
+_execute = aiosqlite.Connection._execute
+
+
+async def _counting_execute(self, fn, *args, **kwargs):
+    global calls
+    calls += 1
+    return await _execute(self, fn, *args, **kwargs)
+
+
+aiosqlite.Connection._execute = _counting_execute
+
+
+async def separate(db: Database, user_id: int, order):
+    """Заказ, баллы и профиль - три отдельных обращения к БД"""
+    order_id, _ = await db._submit_writes([
+        ('''INSERT INTO orders (user_id, total_amount, delivery_type, scheduled_time, address, notes)
+            VALUES (?, ?, ?, ?, ?, ?)''',
+         (user_id, order.total, order.delivery_type, order.scheduled_time, order.address, order.notes)),
+        ('''INSERT INTO order_items (order_id, position, menu_item_id, name, quantity, unit_price, options)
+            SELECT last_insert_rowid(), key, json_extract(value, '$[0]'), json_extract(value, '$[1]'),
+                   json_extract(value, '$[3]'), json_extract(value, '$[2]'), json_extract(value, '$[4]')
+            FROM json_each(?)''', (order.items_json,)),
+        (SEARCH_INSERT, (order.scheduled_time, order.address, order.notes, items_text(order.line_items), user_id)),
+    ])
+    # Списание и начисление по тому же правилу; относительный UPDATE, чтобы не терять начисления
+    rule = db.loyalty
+    await db._submit_writes([
+        ('''UPDATE orders SET points_redeemed = MIN(?, (SELECT bonus_points FROM users WHERE user_id = ?),
+                                                     CAST(total_amount * ? / 100 AS INTEGER))
+            WHERE id = ?''', (order.redeem_points, user_id, rule.max_redeem_percent, order_id)),
+        ('''UPDATE orders SET points_earned = CAST((total_amount - points_redeemed) * ? / 100 AS INTEGER)
+            WHERE id = ?''', (rule.accrual_percent, order_id)),
+        ('''UPDATE users SET bonus_points = bonus_points
+                + (SELECT points_earned - points_redeemed FROM orders WHERE id = ?)
+            WHERE user_id = ?''', (order_id, user_id)),
+    ])
+    db.user_cache.invalidate(user_id)
+    return order_id, await db.get_user(user_id)
+
+
+async def pipeline(db: Database, user_id: int, order):
+    placed = await db.save_order(user_id, order)
+    return placed.id, placed.customer
+
+
+async def measure(path, args, catalog: MenuCatalog):
+    global calls
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        await db.connect()
+        for user_id in range(FIRST_USER_ID, FIRST_USER_ID + args.users):
+            await db.create_user(user_id, f'user{user_id}', 'Bench', 'User')
+            await db.update_user_profile(user_id, name='Bench', phone='+70000000000')
+        await db._submit_write('UPDATE users SET bonus_points = 1000', ())
+
+        calls = 0
+        latencies = []
+        for i in range(args.sequential):
+            order = decode_order(PAYLOAD, catalog.snapshot)
+            start = time.perf_counter()
+            await path(db, FIRST_USER_ID + i % args.users, order)
+            latencies.append(time.perf_counter() - start)
+        calls_per_order = calls / args.sequential
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def place(i: int):
+            async with semaphore:
+                await path(db, FIRST_USER_ID + i % args.users, decode_order(PAYLOAD, catalog.snapshot))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(place(i) for i in range(args.orders)))
+        throughput = args.orders / (time.perf_counter() - start)
+
+        async with db._read() as conn:
+            cursor = await conn.execute(
+                '''SELECT (SELECT SUM(bonus_points) FROM users) - 1000 * COUNT(DISTINCT user_id),
+                          SUM(points_earned - points_redeemed) FROM orders''')
+            balance, ledger = await cursor.fetchone()
+        await db.close()
+    return calls_per_order, statistics.median(latencies) * 1e6, throughput, balance == ledger
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--sequential', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    args = parser.parse_args()
+
+    catalog = MenuCatalog(MENU_PATH)
+    print(f"{'path':<10} {'db calls':>9} {'latency, us':>12} {'orders/s':>9}  balance = ledger")
+    for name, path in (('separate', separate), ('pipeline', pipeline)):
+        calls_per_order, latency, throughput, consistent = await measure(path, args, catalog)
+        print(f"{name:<10} {calls_per_order:9.1f} {latency:12.0f} {throughput:9.0f}  {consistent}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+# backend/benchmarks/bench_records.py
+"""Записи со слотами против словарей на истории заказов
+
+Для пользователей с историей в --sizes заказов сравниваются прежняя сборка
+словарей (json.loads опций и strptime даты для каждой строки) и ленивые
+записи get_user_orders. Два сценария доступа: только сводка (id, статус,
+сумма) и полный обход с датой и опциями. Печатаются время вызова, объем
+выделенной памяти (tracemalloc) и размер результата.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, ORDER_COLUMNS  # noqa: E402
+
+ITEMS = [
+    {'id': 101, 'name': 'Эспрессо', 'price': 150, 'quantity': 2,
+     'options': {'Размер': 'Стандартный', 'Молоко': 'Соевое'}},
+    {'id': 203, 'name': 'Круассан', 'price': 120, 'quantity': 1, 'options': {}},
+    {'id': 305, 'name': 'Латте', 'price': 220, 'quantity': 1, 'options': {'Сироп': 'Ваниль'}},
+]
+
+
+async def legacy_user_orders(db: Database, user_id: int):
+    """Прежняя реализация: словари и разбор всех полей сразу"""
+    async with db._read() as conn:
+        cursor = await conn.execute(
+            f'SELECT {ORDER_COLUMNS} FROM orders WHERE user_id = ? ORDER BY created_at DESC', (user_id,))
+        rows = await cursor.fetchall()
+        cursor = await conn.execute(
+            '''SELECT order_id, menu_item_id, name, unit_price, quantity, options FROM order_items
+               WHERE order_id IN (SELECT id FROM orders WHERE user_id = ?) ORDER BY order_id, position''',
+            (user_id,))
+        items = {}
+        for row in await cursor.fetchall():
+            items.setdefault(row[0], []).append({
+                'id': row[1], 'name': row[2], 'price': row[3], 'quantity': row[4],
+                'options': json.loads(row[5]) if row[5] else {}
+            })
+
+    orders = []
+    for row in rows:
+        orders.append({
+            'id': row[0], 'user_id': row[1], 'total_amount': row[2], 'status': row[3],
+            'delivery_type': row[4], 'scheduled_time': row[5], 'address': row[6], 'notes': row[7],
+            'created_at': datetime.strptime(row[8], '%Y-%m-%d %H:%M:%S'), 'scheduled_at': row[9],
+            'items': items.get(row[0], [])
+        })
+    return orders
+
+
+def summary(orders):
+    return [(order['id'], order['status'], order['total_amount']) for order in orders]
+
+
+def full(orders):
+    return [
+        (order['id'], order['created_at'].strftime('%d.%m.%Y'),
+         [(item['name'], item['options']) for item in order['items']])
+        for order in orders
+    ]
+
+
+async def measure(fetch, access, iterations: int):
+    # Время без tracemalloc, память - отдельным проходом
+    start = time.perf_counter()
+    for _ in range(iterations):
+        access(await fetch())
+    elapsed = (time.perf_counter() - start) / iterations
+
+    tracemalloc.start()
+    orders = await fetch()
+    access(orders)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, retained
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100,500,2000')
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        await db.connect()
+        sizes = [int(size) for size in args.sizes.split(',')]
+        for user_id, size in enumerate(sizes, 1):
+            await asyncio.gather(*(db.create_order(user_id, ITEMS, 710) for _ in range(size)))
+
+        print(f"{'orders':>6} {'access':<8} {'impl':<8} {'ms/call':>8} {'peak KiB':>9} {'result KiB':>10}")
+        for user_id, size in enumerate(sizes, 1):
+            for access in (summary, full):
+                for name, fetch in (('dicts', lambda: legacy_user_orders(db, user_id)),
+                                    ('records', lambda: db.get_user_orders(user_id))):
+                    elapsed, peak, retained = await measure(fetch, access, args.iterations)
+                    print(f"{size:6d} {access.__name__:<8} {name:<8} {elapsed * 1000:8.2f} "
+                          f"{peak / 1024:9.1f} {retained / 1024:10.1f}")
+
+        await db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+# backend/benchmarks/bench_search.py
+"""Поиск заказов: индекс FTS5 (search_orders) против LIKE по всем полям
+
+Синтетическая база из --rows заказов --users клиентов с именами, телефонами,
+позициями, опциями и комментариями. Прежний способ найти «заказ Ивана с
+овсяным молоком» - LIKE по комментарию, адресу, позициям и профилю, то есть
+полный просмотр таблиц. Для каждого запроса печатается медиана по --repeat
+запускам и число найденных заказов (первая страница).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+from search import search_rebuild  # noqa: E402
+
+START = datetime(2024, 1, 1)
+NAMES = ['Иван', 'Мария', 'Алексей', 'Ольга', 'Дмитрий', 'Анна', 'Сергей', 'Елена', 'Павел', 'Наталья']
+SURNAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов']
+ITEMS = [
+    (101, 'Эспрессо', 150, {'Размер': ['Стандартный', 'Двойной']}),
+    (102, 'Капучино', 200, {'Молоко': ['Обычное', 'Овсяное', 'Миндальное'], 'Сироп': ['Нет', 'Ваниль']}),
+    (103, 'Латте', 220, {'Молоко': ['Обычное', 'Овсяное', 'Кокосовое']}),
+    (203, 'Круассан', 120, {}),
+    (204, 'Чизкейк', 250, {}),
+]
+NOTES = ['', '', '', 'Без сахара', 'Погорячее', 'Позвоните, как будет готово', 'С собой в крафтовом пакете']
+TIMES = ['Как можно скорее', 'Через 30 минут', '08:45', '09:30', '12:15', '18:00']
+
+# Запрос -> условие для LIKE-поиска тем же смыслом
+QUERIES = {
+    'иван овсяное 9:30': ("(u.name LIKE '%Иван%' OR u.first_name LIKE '%Иван%') AND o.scheduled_time = '09:30' "
+                          "AND EXISTS (SELECT 1 FROM order_items oi WHERE oi.order_id = o.id "
+                          "AND oi.options LIKE '%Овсяное%')"),
+    'позвоните': "o.notes LIKE '%позвоните%'",
+    'чизкейк смирнов': ("u.name LIKE '%Смирнов%' AND EXISTS (SELECT 1 FROM order_items oi "
+                        "WHERE oi.order_id = o.id AND oi.name LIKE '%Чизкейк%')"),
+    '4567': "u.phone LIKE '%4567'",
+    'латте': "EXISTS (SELECT 1 FROM order_items oi WHERE oi.order_id = o.id AND oi.name LIKE '%Латте%')",
+}
+
+
+def populate(db_path: str, rows: int, users: int):
+    """Заполнить таблицы напрямую, минуя очередь записи, и построить индекс поиска"""
+    rng = random.Random(7)
+    conn = sqlite3.connect(db_path)
+    conn.execute('ATTACH DATABASE ? AS archive', (f"{os.path.splitext(db_path)[0]}_archive.db",))
+    with conn:
+        conn.executemany(
+            'INSERT INTO users (user_id, first_name, name, phone) VALUES (?, ?, ?, ?)',
+            ((user_id, rng.choice(NAMES), f"{rng.choice(NAMES)} {rng.choice(SURNAMES)}",
+              f"+7 (9{rng.randint(10, 99)}) {rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10, 99)}")
+             for user_id in range(1, users + 1))
+        )
+        conn.executemany(
+            '''INSERT INTO orders (id, user_id, total_amount, status, delivery_type,
+                                   scheduled_time, address, notes, created_at)
+               VALUES (?, ?, 420, 'completed', 'pickup', ?, '', ?, ?)''',
+            ((i, rng.randint(1, users), rng.choice(TIMES), rng.choice(NOTES),
+              (START + timedelta(seconds=i * 30)).strftime('%Y-%m-%d %H:%M:%S'))
+             for i in range(1, rows + 1))
+        )
+        lines = []
+        for i in range(1, rows + 1):
+            for position, (item_id, name, price, options) in enumerate(rng.sample(ITEMS, rng.randint(1, 3))):
+                chosen = {option: rng.choice(choices) for option, choices in options.items()}
+                lines.append((i, position, item_id, name, 1, price, json.dumps(chosen, ensure_ascii=False)))
+        conn.executemany(
+            '''INSERT INTO order_items (order_id, position, menu_item_id, name, quantity, unit_price, options)
+               VALUES (?, ?, ?, ?, ?, ?, ?)''',
+            lines
+        )
+    start = time.perf_counter()
+    with conn:
+        conn.execute('DELETE FROM order_search')
+        conn.execute(search_rebuild('main'))
+    print(f"order_search rebuilt in {time.perf_counter() - start:.1f} s")
+    conn.close()
+
+
+async def like_search(db: Database, condition: str, limit: int):
+    async with db._read() as conn:
+        cursor = await conn.execute(
+            f'''SELECT o.id FROM orders o LEFT JOIN users u ON u.user_id = o.user_id
+                WHERE {condition} ORDER BY o.created_at DESC LIMIT ?''',
+            (limit + 1,)
+        )
+        return await cursor.fetchall()
+
+
+async def timed(repeat: int, call):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await call()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=300_000)
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--page', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        # Схему создают миграции при connect(), заполняем уже после
+        db = Database(db_path)
+        await db.connect()
+        start = time.perf_counter()
+        populate(db_path, args.rows, args.users)
+        print(f"populated {args.rows} orders in {time.perf_counter() - start:.1f} s")
+
+        try:
+            print(f"{'query':<20} {'LIKE, ms':>10} {'FTS5, ms':>10} {'found':>6}")
+            for query, condition in QUERIES.items():
+                like_ms, _ = await timed(args.repeat, lambda: like_search(db, condition, args.page))
+                fts_ms, (orders, _) = await timed(args.repeat, lambda: db.search_orders(query, limit=args.page))
+                print(f"{query:<20} {like_ms:10.2f} {fts_ms:10.2f} {len(orders):6d}")
+        finally:
+            await db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,131 @@
+# backend/benchmarks/bench_workers.py
+"""Многопроцессный режим: пропускная способность в зависимости от числа воркеров
+
+Супервизор из cluster.py раздает синтетические обновления (профиль, история,
+заказы из Web App, /start) воркерам по user_id; воркеры - настоящие
+CoffeeShopBot с поддельным Bot API на общей временной базе. Для каждого
+числа воркеров база создается заново, время считается от первой раздачи до
+момента, когда все воркеры обработали все обновления (drain). Рост
+возможен только на машине с несколькими ядрами: число ядер печатается.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# HTTP-эндпоинты метрик и меню бенчмарку не нужны
+os.environ.setdefault('METRICS_PORT', '0')
+os.environ.setdefault('MENU_PORT', '0')
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+
+from admission import AdmissionController  # noqa: E402
+from bot import CoffeeShopBot  # noqa: E402
+from cluster import ClusterClient, Supervisor, worker_command  # noqa: E402
+from database import Database  # noqa: E402
+from fakes import FakeRequest, text_update, web_app_update  # noqa: E402
+from notifier import NotificationDispatcher  # noqa: E402
+
+FIRST_USER_ID = 10000
+ORDER = {
+    'items': [{'id': 101, 'quantity': 2, 'options': {'Размер': 'Стандартный'}},
+              {'id': 203, 'quantity': 1, 'options': {}}],
+    'delivery_type': 'pickup',
+    'scheduled_time': 'Как можно скорее',
+    'notes': 'Без сахара'
+}
+TEXTS = ['/start', '👤 Мой профиль', '📋 История заказов', 'ℹ️ О нас', '📞 Связаться с нами']
+
+
+def run_worker(db_path: str):
+    """Процесс-воркер: настоящие обработчики, поддельный Bot API"""
+    # Предупреждения о медленных запросах под нагрузкой бенчмарка ожидаемы
+    logging.getLogger().setLevel(logging.ERROR)
+    shop = CoffeeShopBot(
+        db=Database(db_path),
+        notifier=NotificationDispatcher(global_rate=1e6, per_chat_rate=1e6),
+        admission=AdmissionController(rate=0, burst=0, max_in_flight=0, duplicate_window=0),
+        cluster=ClusterClient(os.environ['SUPERVISOR_SOCKET'], int(os.environ['WORKER_INDEX']),
+                              int(os.environ['WORKERS']))
+    )
+    application = shop.build_application(
+        Application.builder().token('123456:BENCH').request(FakeRequest()).updater(None))
+    asyncio.run(shop.run_worker(application))
+
+
+async def populate(db_path: str, users: int, history: int):
+    db = Database(db_path)
+    await db.connect()
+    for user_id in range(FIRST_USER_ID, FIRST_USER_ID + users):
+        await db.create_user(user_id, f'user{user_id}', 'Bench', 'User')
+        await db.update_user_profile(user_id, name='Bench', phone='+70000000000')
+    await asyncio.gather(*(
+        db.create_order(user_id, [{'id': 101, 'name': 'Эспрессо', 'price': 150, 'quantity': 2}], 300)
+        for user_id in range(FIRST_USER_ID, FIRST_USER_ID + users) for _ in range(history)
+    ))
+    await db.close()
+
+
+def make_updates(count: int, users: int):
+    rng = random.Random(42)
+    updates = []
+    for update_id in range(1, count + 1):
+        user_id = FIRST_USER_ID + rng.randrange(users)
+        if rng.random() < 0.3:
+            data = web_app_update(update_id, user_id, ORDER)
+        else:
+            data = text_update(update_id, user_id, rng.choice(TEXTS))
+        updates.append(Update.de_json(data, None))
+    return updates
+
+
+async def measure(workers: int, args) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        await populate(db_path, args.users, args.history)
+        supervisor = Supervisor(worker_command(__file__) + ['--worker', db_path], workers,
+                                os.path.join(tmp, 'bench.sock'))
+        await supervisor.start()
+        try:
+            updates = make_updates(args.updates, args.users)
+            start = time.perf_counter()
+            for update in updates:
+                await supervisor.dispatch(update)
+            await supervisor.drain()
+            return args.updates / (time.perf_counter() - start)
+        finally:
+            await supervisor.stop()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--history', type=int, default=10, help='заказов в истории каждого пользователя')
+    parser.add_argument('--updates', type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # Меню читается относительно корня репозитория, воркеры наследуют каталог
+    os.chdir(os.path.dirname(BACKEND_DIR))
+    print(f"cpu cores: {os.cpu_count()}, updates: {args.updates}")
+    baseline = None
+    for workers in args.workers:
+        throughput = await measure(workers, args)
+        baseline = baseline or throughput
+        print(f"workers {workers:3d}   {throughput:9.1f} updates/s   x{throughput / baseline:.2f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == '--worker':
+        run_worker(sys.argv[2])
+    else:
+        asyncio.run(main())
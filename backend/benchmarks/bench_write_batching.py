@@ -0,0 +1,48 @@
+# backend/benchmarks/bench_write_batching.py
+"""Пропускная способность create_order с групповым коммитом и без него"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+ORDERS = 5000
+CONCURRENCY = 200
+ITEMS = [{'id': 101, 'name': 'Эспрессо', 'price': 150, 'quantity': 2}]
+
+
+async def run(batch_writes: bool, synchronous: str) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'), batch_writes=batch_writes)
+        await db.connect()
+        await db._writer.execute(f'PRAGMA synchronous = {synchronous}')
+
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+
+        async def place(i: int):
+            async with semaphore:
+                order_id = await db.create_order(i % 500, ITEMS, 300)
+                await db.update_order_status(order_id, 'preparing')
+
+        start = time.perf_counter()
+        await asyncio.gather(*(place(i) for i in range(ORDERS)))
+        elapsed = time.perf_counter() - start
+
+        await db.close()
+        return ORDERS / elapsed
+
+
+async def main():
+    for synchronous in ('NORMAL', 'FULL'):
+        off = await run(False, synchronous)
+        on = await run(True, synchronous)
+        print(f"synchronous={synchronous:<6} batching off: {off:8.0f} orders/s   "
+              f"batching on: {on:8.0f} orders/s   x{on / off:.2f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
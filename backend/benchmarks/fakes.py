@@ -0,0 +1,129 @@
+# backend/benchmarks/fakes.py
+"""Подмена Telegram Bot API для нагрузочных тестов без сети"""
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'CoffeeTime', 'username': 'coffee_time_bot',
+            'can_join_groups': False, 'can_read_all_group_messages': False,
+            'supports_inline_queries': False}
+
+# Методы, которые возвращают отправленное сообщение
+MESSAGE_METHODS = {'sendMessage', 'editMessageText', 'sendDocument'}
+
+
+class FakeRequest(BaseRequest):
+    """Отвечает на запросы Bot API локально и записывает все вызовы
+
+    latency - имитация задержки сети до Telegram в секундах.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: List[Tuple[str, Dict]] = []
+        self.counts: Counter = Counter()
+        self._message_id = 0
+        self._waiters: List[Tuple[str, int, asyncio.Future]] = []
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def wait_for(self, method: str, count: int):
+        """Дождаться, пока метод будет вызван count раз"""
+        if self.counts[method] >= count:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((method, count, future))
+        await future
+
+    def _message(self, params: Dict) -> Dict:
+        self._message_id += 1
+        return {
+            'message_id': params.get('message_id', self._message_id),
+            'date': int(time.time()),
+            'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+            'text': params.get('text', ''),
+        }
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls.append((api_method, params))
+        self.counts[api_method] += 1
+
+        for waiter in list(self._waiters):
+            method, count, future = waiter
+            if method == api_method and self.counts[method] >= count and not future.done():
+                future.set_result(None)
+                self._waiters.remove(waiter)
+
+        if api_method == 'getMe':
+            result = BOT_USER
+        elif api_method in MESSAGE_METHODS:
+            result = self._message(params)
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def web_app_update(update_id: int, user_id: int, payload: Dict) -> Dict:
+    """Обновление с данными заказа из Web App"""
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+            'web_app_data': {'data': json.dumps(payload), 'button_text': '🛒 Сделать заказ'},
+        },
+    }
+
+
+def text_update(update_id: int, user_id: int, text: str) -> Dict:
+    """Обычное текстовое сообщение или команда"""
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> Dict:
+    """Нажатие inline-кнопки"""
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'chat_instance': str(user_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+            'data': data,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'text': '',
+            },
+        },
+    }
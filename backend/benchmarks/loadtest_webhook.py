@@ -0,0 +1,121 @@
+# backend/benchmarks/loadtest_webhook.py
+"""Нагрузочный тест webhook: синтетические заказы из Web App через локальный HTTP
+
+Бот запускается в webhook-режиме с подменой Bot API (FakeRequest с задержкой),
+после чего тест отправляет обновления POST-запросами и измеряет, за сколько
+они будут полностью обработаны при последовательной и параллельной обработке.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# HTTP-эндпоинты метрик и меню бенчмарку не нужны
+os.environ.setdefault('METRICS_PORT', '0')
+os.environ.setdefault('MENU_PORT', '0')
+
+from telegram.ext import Application  # noqa: E402
+
+from admission import AdmissionController  # noqa: E402
+from bot import CoffeeShopBot  # noqa: E402
+from config import ADMIN_IDS  # noqa: E402
+from database import Database  # noqa: E402
+from fakes import FakeRequest, web_app_update  # noqa: E402
+from notifier import NotificationDispatcher  # noqa: E402
+
+SECRET = 'loadtest-secret'
+CLIENT_CONNECTIONS = 8
+ORDER = {
+    'items': [{'id': 101, 'name': 'Эспрессо', 'price': 150, 'quantity': 1,
+               'options': {'Размер': 'Стандартный'}},
+              {'id': 201, 'name': 'Тирамису', 'price': 280, 'quantity': 1, 'options': {}}],
+    'total': 430,
+    'delivery_type': 'takeaway',
+    'scheduled_time': 'Как можно скорее',
+    'address': '',
+    'notes': ''
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def run(concurrency: int, updates: int, users: int, latency: float) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        shop = CoffeeShopBot(
+            db=Database(os.path.join(tmp, 'loadtest.db')),
+            notifier=NotificationDispatcher(global_rate=1e6, per_chat_rate=1e6),
+            # Тест шлет одинаковые заказы от немногих пользователей, лимиты допуска ему мешают
+            admission=AdmissionController(rate=0, burst=0, max_in_flight=0, duplicate_window=0)
+        )
+        request = FakeRequest(latency=latency)
+        builder = Application.builder().token('123456:LOADTEST').request(request)
+        application = shop.build_application(builder, max_concurrent_updates=concurrency)
+
+        port = free_port()
+        await application.initialize()
+        await shop.on_startup(application)
+        await application.updater.start_webhook(
+            listen='127.0.0.1', port=port, url_path='telegram', secret_token=SECRET)
+        await application.start()
+
+        url = f'http://127.0.0.1:{port}/telegram'
+        headers = {'X-Telegram-Bot-Api-Secret-Token': SECRET}
+        # Ответ клиенту и уведомление каждому администратору
+        expected = updates * (1 + len(ADMIN_IDS))
+
+        start = time.perf_counter()
+        pending = iter(range(updates))
+
+        async def sender(client: httpx.AsyncClient):
+            # Каждый отправитель держит свое соединение и шлет обновления по одному
+            for i in pending:
+                response = await client.post(
+                    url, json=web_app_update(i + 1, 1000 + i % users, ORDER), headers=headers)
+                response.raise_for_status()
+
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=CLIENT_CONNECTIONS)) as client:
+            await asyncio.gather(*(sender(client) for _ in range(CLIENT_CONNECTIONS)))
+        await request.wait_for('sendMessage', expected)
+        elapsed = time.perf_counter() - start
+
+        await application.updater.stop()
+        await application.stop()
+        await shop.on_shutdown(application)
+        await application.shutdown()
+        return updates / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--updates', type=int, default=500)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='имитация задержки Bot API, секунды')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+    args = parser.parse_args()
+
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    # Меню читается относительно корня репозитория
+    os.chdir(os.path.dirname(BACKEND_DIR))
+
+    for concurrency in args.concurrency:
+        throughput = await run(concurrency, args.updates, args.users, args.latency)
+        print(f"concurrent updates: {concurrency:>4}   {throughput:8.1f} updates/s")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,24 +1,51 @@
 # backend/bot.py
 import os
-import json
 import logging
-from datetime import datetime, timedelta
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
 from typing import Dict, List, Optional
+import signal
 import asyncio
+import tempfile
+from urllib.parse import urlencode
+from zoneinfo import ZoneInfo
 
 from telegram import (
-    Update, InlineKeyboardButton, InlineKeyboardMarkup,
+    Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile,
     WebAppInfo, KeyboardButton, ReplyKeyboardMarkup,
     ReplyKeyboardRemove
 )
 from telegram.ext import (
-    Application, CommandHandler, CallbackQueryHandler,
+    Application, ApplicationBuilder, CommandHandler, CallbackQueryHandler, Updater,
     MessageHandler, filters, ContextTypes, ConversationHandler
 )
 from telegram.constants import ParseMode
+from telegram.helpers import escape_markdown
 
+from admission import AdmissionController, REJECT_DUPLICATE, REJECT_OVERLOADED, REJECT_RATE_LIMITED
+from cluster import UPDATER_QUEUE_SIZE, ClusterClient, Supervisor, worker_command
 from database import Database
-from config import BOT_TOKEN, ADMIN_IDS
+from export import EXPORT_FORMATS, write_orders
+from order_board import OPEN_STATUSES, STATUS_TRANSITIONS
+from menu import MenuCatalog, MenuValidationError
+from menu_endpoint import MenuEndpoint
+from order_schema import DEFAULT_DELIVERY_TYPE, DELIVERY_TYPES, OrderPayload, decode_order
+from records import PlacedOrderRecord
+from notifier import GLOBAL_RATE, NotificationDispatcher
+from outbox import OutboxWorker
+from scheduler import PreorderScheduler, parse_scheduled_time
+from update_processor import PerUserUpdateProcessor
+from metrics import Metrics
+from http_server import HTTPServer
+from config import (
+    BOT_TOKEN, ADMIN_IDS, WEB_APP_URL, MENU_HOST, MENU_PORT, BOT_MODE, MAX_CONCURRENT_UPDATES,
+    WORKERS, WORKER_INDEX, SUPERVISOR_SOCKET,
+    ADMISSION_RATE, ADMISSION_BURST, ADMISSION_MAX_IN_FLIGHT, DUPLICATE_ORDER_WINDOW,
+    WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+    METRICS_ENABLED, METRICS_HOST, METRICS_PORT, SLOW_QUERY_MS,
+    ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL, ARCHIVE_BATCH_SIZE, SHOP_TIMEZONE, PREP_LEAD_MINUTES,
+    PREP_MISSED_GRACE_MINUTES
+)
 
 # Настройка логирования
 logging.basicConfig(
@@ -30,16 +57,164 @@ logger = logging.getLogger(__name__)
 # Состояния для ConversationHandler
 PROFILE_NAME, PROFILE_PHONE = range(2)
 
+STATUS_EMOJI = {
+    'new': '🆕',
+    'preparing': '👨‍🍳',
+    'ready': '✅',
+    'completed': '🏁',
+    'cancelled': '❌'
+}
+
+# Периоды /stats: название, начало (дней назад от сегодня), длительность в днях
+STATS_PERIODS = {
+    'today': ('сегодня', 0, 1),
+    'yesterday': ('вчера', 1, 1),
+    'week': ('7 дней', 6, 7),
+    'month': ('30 дней', 29, 30),
+}
+
+# Кнопки смены статуса у администратора
+STATUS_BUTTONS = {
+    'preparing': '👨‍🍳 В приготовлении',
+    'ready': '✅ Готов',
+    'completed': '🏁 Выполнен',
+    'cancelled': '❌ Отменить'
+}
+
+# Уведомления клиенту при смене статуса заказа
+STATUS_NOTIFICATIONS = {
+    'preparing': '👨‍🍳 Ваш заказ начали готовить',
+    'ready': '✅ Ваш заказ готов!',
+    'completed': '🏁 Заказ выполнен',
+    'cancelled': '❌ Заказ отменен'
+}
+
+# Ответ пользователю, чье обновление не допущено к обработке
+REJECT_NOTICES = {
+    REJECT_OVERLOADED: '⏳ Бот сейчас перегружен, повторите через минуту.',
+    REJECT_RATE_LIMITED: '⏳ Слишком много сообщений подряд, подождите немного.',
+    REJECT_DUPLICATE: 'ℹ️ Этот заказ уже получен, повторно он не оформляется.',
+}
+
+# Количество заказов на одной странице истории
+HISTORY_PAGE_SIZE = 10
+
+# Количество заказов на одной странице результатов /find
+FIND_PAGE_SIZE = 10
+
+# Ограничение длины сообщения Telegram с запасом
+MAX_MESSAGE_LENGTH = 4000
+
+# Выгрузка держится в памяти до этого размера, дальше пишется во временный файл
+EXPORT_SPOOL_BYTES = 1024 * 1024
+
 
 class CoffeeShopBot:
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, db: Optional[Database] = None,
+                 notifier: Optional[NotificationDispatcher] = None,
+                 admission: Optional[AdmissionController] = None,
+                 cluster: Optional[ClusterClient] = None):
+        self.db = db or Database()
+        # В многопроцессном режиме - связь с супервизором, см. cluster.py
+        self.cluster = cluster
+        if cluster is not None:
+            self.db.on_change = cluster.publish
         self.menu = self.load_menu()
+        self.menu_endpoint = MenuEndpoint(self.menu)
+        self.menu_server: Optional[HTTPServer] = None
+        # Общий лимит Telegram делится между воркерами поровну
+        self.notifier = notifier or NotificationDispatcher(
+            global_rate=GLOBAL_RATE / (cluster.workers if cluster is not None else 1))
+        self.admission = admission or AdmissionController(
+            rate=ADMISSION_RATE,
+            burst=ADMISSION_BURST,
+            max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+            duplicate_window=DUPLICATE_ORDER_WINDOW,
+            exempt_ids=ADMIN_IDS
+        )
+        self.metrics = Metrics(enabled=METRICS_ENABLED, slow_threshold=SLOW_QUERY_MS / 1000)
+        self.metrics_server: Optional[HTTPServer] = None
+        self.setup_metrics()
+        self.outbox = OutboxWorker(self.db, self.notifier.send)
+        self.timezone = ZoneInfo(SHOP_TIMEZONE)
+        self.scheduler = PreorderScheduler(self.notify_preorder)
+
+    def setup_metrics(self):
+        """Замеры задержек запросов к БД и вызовов Telegram API; обработчики - в instrument_handlers"""
+        self.metrics.instrument(self.db, 'db', slow_log=True, exclude=('connect', 'close'))
+        self.metrics.instrument(self.notifier, 'telegram', names=['send'])
+        self.metrics.gauge('db_write_queue_depth', self.db.write_queue_depth)
+        self.metrics.gauge('notifications_in_flight', lambda: self.notifier.pending)
+        self.metrics.gauge('active_orders', lambda: len(self.db.active_orders))
+        self.metrics.gauge('scheduled_orders', lambda: len(self.scheduler))
+        # Отказы допуска по причинам: overloaded, rate_limited, duplicate
+        self.admission.on_reject = lambda reason: self.metrics.inc('admission_rejected', reason)
+        self.admission.on_notice = self.notify_rejected
+        self.metrics.gauge('updates_in_flight', lambda: self.admission.in_flight)
+        self.metrics.gauge('admission_buckets', lambda: self.admission.buckets)
+
+    def notify_rejected(self, update: Update, reason: str):
+        """Сообщить пользователю, что его обновление не обработано, а не молчать"""
+        chat = update.effective_chat
+        if chat is None:
+            return
+        text = REJECT_NOTICES[reason]
+        message = update.effective_message
+        if reason != REJECT_DUPLICATE and message is not None and message.web_app_data is not None:
+            text += "\nЗаказ не оформлен - отправьте его еще раз."
+        self.notifier.broadcast([chat.id], text)
+
+    async def handle_error(self, update: object, context: ContextTypes.DEFAULT_TYPE):
+        """Ошибка в обработчике: заказ, который не удалось оформить, можно отправить повторно"""
+        logger.error(f"Error while handling update: {context.error}", exc_info=context.error)
+        if update is not None:
+            self.admission.forget(update)
+
+    @property
+    def leader(self) -> bool:
+        """Выполняет ли процесс фоновые задачи: outbox, напоминания, архивацию"""
+        return self.cluster is None or self.cluster.leader
+
+    def wake_outbox(self):
+        """Сообщить воркеру outbox о новых записях, в каком бы процессе он ни работал"""
+        if self.leader:
+            self.outbox.wake()
+        else:
+            self.cluster.publish('outbox')
 
-    def load_menu(self) -> Dict:
+    def schedule_prep(self, order_id: int, due: float):
+        if self.leader:
+            self.scheduler.schedule(order_id, due)
+        else:
+            self.cluster.publish('schedule', order_id, due)
+
+    def cancel_prep(self, order_id: int):
+        if self.leader:
+            self.scheduler.cancel(order_id)
+        else:
+            self.cluster.publish('unschedule', order_id)
+
+    async def apply_event(self, kind: str, args: list):
+        """Событие от другого воркера: инвалидация кэшей или поручение ведущему"""
+        if kind in ('user', 'order'):
+            await self.db.apply_change(kind, *args)
+        elif not self.leader:
+            return
+        elif kind == 'outbox':
+            self.outbox.wake()
+        elif kind == 'schedule':
+            self.scheduler.schedule(*args)
+        elif kind == 'unschedule':
+            self.scheduler.cancel(*args)
+
+    def load_menu(self) -> MenuCatalog:
         """Загрузка меню из JSON файла"""
-        with open('menu.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return MenuCatalog('menu.json')
+
+    def web_app_url(self, user_id: int, **params) -> str:
+        """Адрес Web App; версия меню в нем меняется только вместе с самим меню"""
+        query = urlencode({'user_id': user_id, 'menu_version': self.menu_endpoint.version, **params})
+        return f"{WEB_APP_URL.rstrip('/')}/index.html?{query}"
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды /start"""
@@ -65,7 +240,7 @@ class CoffeeShopBot:
             keyboard = [
                 [
                     KeyboardButton("🛒 Сделать заказ",
-                                   web_app=WebAppInfo(url=f"https://yourdomain.com/index.html?user_id={user.id}")),
+                                   web_app=WebAppInfo(url=self.web_app_url(user.id))),
                     KeyboardButton("👤 Мой профиль")
                 ],
                 [
@@ -120,7 +295,7 @@ class CoffeeShopBot:
         keyboard = [
             [
                 KeyboardButton("🛒 Сделать заказ",
-                               web_app=WebAppInfo(url=f"https://yourdomain.com/index.html?user_id={user_id}"))
+                               web_app=WebAppInfo(url=self.web_app_url(user_id)))
             ]
         ]
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
@@ -160,24 +335,12 @@ class CoffeeShopBot:
 
         await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
 
-    async def show_order_history(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Показать историю заказов"""
-        user_id = update.effective_user.id
-        orders = await self.db.get_user_orders(user_id)
-
-        if not orders:
-            return await update.message.reply_text("У вас еще нет заказов.")
-
+    def render_order_history(self, orders: List[Dict], next_cursor, prev_cursor):
+        """Текст и клавиатура одной страницы истории заказов"""
         text = "📋 **История ваших заказов:**\n\n"
 
-        for order in orders[:10]:  # Последние 10 заказов
-            status_emoji = {
-                'new': '🆕',
-                'preparing': '👨‍🍳',
-                'ready': '✅',
-                'completed': '🏁',
-                'cancelled': '❌'
-            }.get(order['status'], '📝')
+        for order in orders:
+            status_emoji = STATUS_EMOJI.get(order['status'], '📝')
 
             text += (
                 f"**Заказ #{order['id']}** {status_emoji}\n"
@@ -187,125 +350,203 @@ class CoffeeShopBot:
                 f"{'-' * 20}\n"
             )
 
+        # Курсор страницы кодируется в callback_data: history_<направление>_<id>_<created_at>
+        navigation = []
+        if prev_cursor:
+            navigation.append(InlineKeyboardButton(
+                "⬅️ Новее", callback_data=f"history_prev_{prev_cursor[1]}_{prev_cursor[0]}"))
+        if next_cursor:
+            navigation.append(InlineKeyboardButton(
+                "Старее ➡️", callback_data=f"history_next_{next_cursor[1]}_{next_cursor[0]}"))
+
         keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        if navigation:
+            keyboard.insert(0, navigation)
 
+        return text, InlineKeyboardMarkup(keyboard)
+
+    async def show_order_history(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Показать историю заказов"""
+        user_id = update.effective_user.id
+        orders, next_cursor, prev_cursor = await self.db.get_user_orders_page(
+            user_id, limit=HISTORY_PAGE_SIZE)
+
+        if not orders:
+            return await update.message.reply_text("У вас еще нет заказов.")
+
+        text, reply_markup = self.render_order_history(orders, next_cursor, prev_cursor)
         await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
 
-    async def handle_web_app_data(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработка данных из Web App"""
-        try:
-            data = json.loads(update.effective_message.web_app_data.data)
-            user_id = update.effective_user.id
+    async def show_order_history_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Листание истории заказов по inline-кнопкам"""
+        query = update.callback_query
+        await query.answer()
 
-            # Создаем заказ
-            order_id = await self.create_order(user_id, data)
+        _, direction, order_id, created_at = query.data.split('_', 3)
+        orders, next_cursor, prev_cursor = await self.db.get_user_orders_page(
+            query.from_user.id,
+            limit=HISTORY_PAGE_SIZE,
+            cursor=(created_at, int(order_id)),
+            direction=direction
+        )
 
-            # Отправляем подтверждение
-            await update.message.reply_text(
-                f"✅ Заказ #{order_id} принят!\n"
-                f"Сумма: {data['total']} руб.\n"
-                f"Ожидайте уведомлений о статусе заказа."
-            )
+        if not orders:
+            return
 
-            # Отправляем заказ администраторам
-            await self.send_order_to_admins(order_id, data, user_id)
+        text, reply_markup = self.render_order_history(orders, next_cursor, prev_cursor)
+        await query.edit_message_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
 
-        except Exception as e:
-            logger.error(f"Error handling web app data: {e}")
-            await update.message.reply_text("❌ Произошла ошибка при оформлении заказа.")
+    async def handle_web_app_data(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка данных из Web App"""
+        user_id = update.effective_user.id
+        try:
+            # Разбор, проверка по актуальному меню и пересчет цен - за один проход;
+            # цены и сумму от клиента не принимаем
+            self.menu.maybe_reload()
+            order = decode_order(update.effective_message.web_app_data.data, self.menu.snapshot)
+        except MenuValidationError as e:
+            logger.warning(f"Rejected web app order from {user_id}: {e}")
+            # Исправленный заказ может совпасть с отклоненным, если меню успело обновиться
+            self.admission.forget(update)
+            await update.message.reply_text(f"❌ Заказ не принят: {e}")
+            return
 
-    async def create_order(self, user_id: int, order_data: Dict) -> int:
+        try:
+            placed = await self.create_order(user_id, order)
+        except sqlite3.Error as e:
+            logger.error(f"Error saving web app order from {user_id}: {e}")
+            self.admission.forget(update)
+            await update.message.reply_text("❌ Произошла ошибка при оформлении заказа.")
+            return
+
+        # Отправляем подтверждение
+        text = f"✅ Заказ #{placed.id} принят!\n"
+        if placed.points_redeemed:
+            text += f"Оплачено баллами: {placed.points_redeemed}\n"
+        text += f"Сумма: {placed.amount_due} руб.\n"
+        if placed.points_earned:
+            text += f"Начислено баллов: {placed.points_earned}\n"
+        text += "Ожидайте уведомлений о статусе заказа."
+        await update.message.reply_text(text)
+
+        # Отправляем заказ администраторам
+        await self.send_order_to_admins(placed, order)
+
+    async def create_order(self, user_id: int, order: OrderPayload) -> PlacedOrderRecord:
         """Создание заказа в базе данных"""
-        order_id = await self.db.create_order(
-            user_id=user_id,
-            items=order_data['items'],
-            total_amount=order_data['total'],
-            delivery_type=order_data.get('delivery_type', 'pickup'),
-            scheduled_time=order_data.get('scheduled_time'),
-            address=order_data.get('address'),
-            notes=order_data.get('notes', '')
+        scheduled_at = parse_scheduled_time(order.scheduled_time, datetime.now(timezone.utc), self.timezone)
+        placed = await self.db.save_order(user_id, order, scheduled_at=scheduled_at)
+        order_id = placed.id
+
+        # Напоминание начать готовить; если этот момент уже наступил, хватит сообщения о новом заказе
+        if scheduled_at is not None:
+            prep_at = scheduled_at - PREP_LEAD_MINUTES * 60
+            if prep_at > self.scheduler.clock():
+                self.schedule_prep(order_id, prep_at)
+        return placed
+
+    def format_local_time(self, timestamp: float) -> str:
+        """Время в часовом поясе кофейни"""
+        return datetime.fromtimestamp(timestamp, self.timezone).strftime('%d.%m %H:%M')
+
+    async def notify_preorder(self, order_id: int):
+        """Напомнить администраторам, что пора готовить заказ ко времени"""
+        order = await self.db.get_order(order_id)
+        if order is None or order['status'] != 'new':
+            return
+
+        text = (
+            f"⏰ Пора готовить заказ #{order_id}\n"
+            f"Ко времени: {self.format_local_time(order['scheduled_at'])}\n"
         )
-        return order_id
+        for item in order['items']:
+            text += f"- {item['name']} x{item['quantity']}\n"
+
+        # Через outbox: с повторами и без дублей после перезапуска
+        await self.db.enqueue_notifications([
+            (admin_id, text, f"prep:{order_id}:{admin_id}") for admin_id in ADMIN_IDS
+        ])
+        self.wake_outbox()
 
-    async def send_order_to_admins(self, order_id: int, order_data: Dict, user_id: int):
+    async def send_order_to_admins(self, placed: PlacedOrderRecord, order: OrderPayload):
         """Отправка заказа администраторам"""
-        user_data = await self.db.get_user(user_id)
+        # Профиль клиента вернула транзакция заказа, отдельный запрос не нужен
+        order_id = placed.id
+        user_data = placed.customer or {}
 
         order_text = (
             f"🆕 **Новый заказ #{order_id}**\n\n"
             f"**Клиент:** {user_data.get('name', 'Не указано')}\n"
             f"**Телефон:** {user_data.get('phone', 'Не указан')}\n"
-            f"**Тип заказа:** {'С собой' if order_data.get('delivery_type') == 'takeaway' else 'На месте'}\n"
-            f"**Адрес:** {order_data.get('address', 'Не указан')}\n"
-            f"**Время:** {order_data.get('scheduled_time', 'Как можно скорее')}\n"
-            f"**Примечания:** {order_data.get('notes', 'Нет')}\n\n"
+            f"**Тип заказа:** {DELIVERY_TYPES[order.delivery_type]}\n"
+            f"**Адрес:** {order.address or 'Не указан'}\n"
+            f"**Время:** {order.scheduled_time or 'Как можно скорее'}\n"
+            f"**Примечания:** {order.notes or 'Нет'}\n\n"
             f"**Состав заказа:**\n"
         )
 
-        for item in order_data['items']:
-            order_text += f"- {item['name']} x{item['quantity']}: {item['price'] * item['quantity']} руб.\n"
+        for line in order.line_items:
+            order_text += f"- {line.name} x{line.quantity}: {line.price * line.quantity} руб.\n"
 
-        order_text += f"\n**Итого:** {order_data['total']} руб."
+        if placed.points_redeemed:
+            order_text += f"\n**Оплачено баллами:** {placed.points_redeemed}"
+        order_text += f"\n**Итого:** {placed.amount_due} руб."
 
-        keyboard = [
-            [
-                InlineKeyboardButton("👨‍🍳 В приготовлении", callback_data=f"status_preparing_{order_id}"),
-                InlineKeyboardButton("✅ Готов", callback_data=f"status_ready_{order_id}")
-            ],
-            [
-                InlineKeyboardButton("🏁 Выполнен", callback_data=f"status_completed_{order_id}"),
-                InlineKeyboardButton("❌ Отменить", callback_data=f"status_cancelled_{order_id}")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = self.status_keyboard(order_id, 'new')
 
-        # Отправка всем администраторам
-        for admin_id in ADMIN_IDS:
-            try:
-                await context.bot.send_message(
-                    chat_id=admin_id,
-                    text=order_text,
-                    parse_mode=ParseMode.MARKDOWN,
-                    reply_markup=reply_markup
-                )
-            except Exception as e:
-                logger.error(f"Error sending to admin {admin_id}: {e}")
+        # Сообщение собрано один раз и рассылается всем администраторам параллельно в фоне
+        self.notifier.broadcast(
+            ADMIN_IDS,
+            order_text,
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=reply_markup
+        )
+
+    @staticmethod
+    def status_keyboard(order_id: int, status: str) -> Optional[InlineKeyboardMarkup]:
+        """Кнопки только тех статусов, в которые заказ можно перевести из текущего"""
+        buttons = [
+            InlineKeyboardButton(STATUS_BUTTONS[target], callback_data=f"status_{target}_{order_id}")
+            for target in STATUS_TRANSITIONS[status]
+        ]
+        if not buttons:
+            return None
+        return InlineKeyboardMarkup([buttons[i:i + 2] for i in range(0, len(buttons), 2)])
 
     async def update_order_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обновление статуса заказа"""
         query = update.callback_query
-        await query.answer()
 
         data = query.data
-        if data.startswith('status_'):
-            _, status, order_id = data.split('_')
-
-            # Обновляем статус в базе данных
-            await self.db.update_order_status(int(order_id), status)
-
-            # Получаем информацию о заказе
-            order = await self.db.get_order(int(order_id))
-            if order:
-                # Отправляем уведомление клиенту
-                status_texts = {
-                    'preparing': '👨‍🍳 Ваш заказ начали готовить',
-                    'ready': '✅ Ваш заказ готов!',
-                    'completed': '🏁 Заказ выполнен',
-                    'cancelled': '❌ Заказ отменен'
-                }
-
-                if status in status_texts:
-                    await context.bot.send_message(
-                        chat_id=order['user_id'],
-                        text=f"{status_texts[status]}\nЗаказ #{order_id}"
-                    )
-
-                # Обновляем сообщение у администратора
-                await query.edit_message_text(
-                    text=f"✅ Статус заказа #{order_id} обновлен на: {status}",
-                    reply_markup=None
-                )
+        if not data.startswith('status_'):
+            await query.answer()
+            return
+        _, status, order_id = data.split('_')
+        order_id = int(order_id)
+
+        # Переход, история и уведомление клиенту записываются одной транзакцией,
+        # само уведомление отправит фоновый воркер outbox. Если несколько
+        # администраторов нажали одновременно, переход выполнит только один
+        notification = STATUS_NOTIFICATIONS.get(status)
+        changed = await self.db.update_order_status(
+            order_id,
+            status,
+            notification=f"{notification}\nЗаказ #{order_id}" if notification else None
+        )
+        if not changed:
+            await query.answer(f"Заказ #{order_id} уже нельзя перевести в статус {status}", show_alert=True)
+            return
+
+        await query.answer()
+        self.wake_outbox()
+        # Любой переход уводит заказ из 'new': напоминание начать готовить больше не нужно
+        self.cancel_prep(order_id)
+
+        # Обновляем сообщение у администратора: остаются кнопки следующих переходов
+        await query.edit_message_text(
+            text=f"{STATUS_EMOJI.get(status, '📝')} Статус заказа #{order_id} обновлен на: {status}",
+            reply_markup=self.status_keyboard(order_id, status)
+        )
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка текстовых сообщений"""
@@ -317,7 +558,7 @@ class CoffeeShopBot:
             await self.show_order_history(update, context)
         elif text == "🕐 Заказать ко времени":
             keyboard = [[InlineKeyboardButton("🛒 Открыть меню", web_app=WebAppInfo(
-                url=f"https://yourdomain.com/index.html?user_id={update.effective_user.id}&scheduled=true"))]]
+                url=self.web_app_url(update.effective_user.id, scheduled='true')))]]
             reply_markup = InlineKeyboardMarkup(keyboard)
             await update.message.reply_text(
                 "Вы можете выбрать время получения заказа при оформлении в меню:",
@@ -344,6 +585,189 @@ class CoffeeShopBot:
                 "Ждем вас в гости!"
             )
 
+    async def show_metrics(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Сводка метрик для администраторов (/metrics)"""
+        if update.effective_user.id not in ADMIN_IDS:
+            return
+
+        # Лимит длины сообщения Telegram - 4096 символов
+        await update.message.reply_text(self.metrics.summary()[:4000])
+
+    async def show_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Статистика продаж для администраторов (/stats [today|yesterday|week|month])"""
+        if update.effective_user.id not in ADMIN_IDS:
+            return
+
+        period = context.args[0].lower() if context.args else 'today'
+        if period not in STATS_PERIODS:
+            return await update.message.reply_text(
+                "Использование: /stats [today|yesterday|week|month]")
+
+        # Агрегаты ведутся по датам created_at в UTC
+        title, start_offset, days = STATS_PERIODS[period]
+        since = datetime.utcnow().date() - timedelta(days=start_offset)
+        until = since + timedelta(days=days)
+        stats = await self.db.get_sales_stats(since.isoformat(), until.isoformat())
+
+        text = (
+            f"📊 **Статистика: {title}**\n\n"
+            f"**Заказов:** {stats['orders']}\n"
+            f"**Выручка:** {stats['revenue']:.0f} руб.\n"
+        )
+        if stats['statuses']:
+            text += "\n**По статусам:**\n"
+            for status, count in sorted(stats['statuses'].items(), key=lambda s: -s[1]):
+                text += f"{STATUS_EMOJI.get(status, '📝')} {status}: {count}\n"
+        if stats['top_items']:
+            text += "\n**Популярные позиции:**\n"
+            for position, item in enumerate(stats['top_items'], 1):
+                text += f"{position}. {item['name']} — {item['quantity']} шт., {item['revenue']:.0f} руб.\n"
+        if stats['busiest_hour']:
+            hour, count = stats['busiest_hour']
+            text += f"\n**Пиковый час (UTC):** {hour}:00, заказов: {count}\n"
+
+        await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
+
+    async def rebuild_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Пересчет агрегатов продаж с нуля (/rebuild_stats)"""
+        if update.effective_user.id not in ADMIN_IDS:
+            return
+
+        await self.db.rebuild_rollups()
+        await update.message.reply_text("✅ Статистика пересчитана.")
+
+    async def vacuum_database(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Сжатие файла базы (/vacuum); первый раз - полный VACUUM, на время которого запись стоит"""
+        if update.effective_user.id not in ADMIN_IDS:
+            return
+
+        result = await self.db.vacuum()
+        kind = "Полный VACUUM" if result['full'] else "Incremental vacuum"
+        await update.message.reply_text(
+            f"✅ {kind}: освобождено страниц {result['freed_pages']} за {result['seconds']:.1f} с.")
+
+    async def show_queue(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Очередь открытых заказов для кухни (/queue [new|preparing|ready])"""
+        if update.effective_user.id not in ADMIN_IDS:
+            return
+
+        board = self.db.active_orders
+        status = context.args[0].lower() if context.args else None
+        if status is not None and status not in OPEN_STATUSES:
+            return await update.message.reply_text(
+                f"Использование: /queue [{'|'.join(OPEN_STATUSES)}]")
+
+        # Доска хранится в памяти, запросов к БД здесь нет
+        orders = board.orders(status)
+        counts = board.counts()
+        text = "📋 **Очередь заказов**\n" + " ".join(
+            f"{STATUS_EMOJI[name]} {counts[name]}" for name in OPEN_STATUSES) + "\n\n"
+        if not orders:
+            text += "Открытых заказов нет."
+
+        for shown, order in enumerate(orders):
+            entry = (
+                f"{STATUS_EMOJI.get(order['status'], '📝')} **#{order['id']}** "
+                f"{order['created_at'][11:16]} UTC, "
+                f"{DELIVERY_TYPES.get(order['delivery_type'], DELIVERY_TYPES[DEFAULT_DELIVERY_TYPE]).lower()}"
+                f"{', ко времени: ' + self.format_local_time(order['scheduled_at']) if order['scheduled_at'] else ''}\n"
+            )
+            for item in order['items']:
+                entry += f"  - {escape_markdown(item['name'])} x{item['quantity']}\n"
+            if order['notes']:
+                # Комментарий пишет клиент: один лишний _ или * ломает разметку всего сообщения
+                entry += f"  _{escape_markdown(order['notes'])}_\n"
+
+            if len(text) + len(entry) > MAX_MESSAGE_LENGTH:
+                text += f"… и еще {len(orders) - shown}"
+                break
+            text += entry
+
+        await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
+
+    async def export_orders(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Выгрузка заказов файлом (/export [from] [to] [csv|jsonl])"""
+        if update.effective_user.id not in ADMIN_IDS:
+            return
+
+        args = list(context.args or [])
+        fmt = args.pop().lower() if args and args[-1].lower() in EXPORT_FORMATS else 'csv'
+        try:
+            # Даты включительно, в UTC, как и created_at
+            dates = [date.fromisoformat(arg) for arg in args]
+        except ValueError:
+            dates = None
+        if dates is None or len(dates) > 2:
+            return await update.message.reply_text(
+                "Использование: /export [YYYY-MM-DD] [YYYY-MM-DD] [csv|jsonl]")
+
+        since = dates[0].isoformat() if dates else None
+        until = (dates[1] + timedelta(days=1)).isoformat() if len(dates) == 2 else None
+        filename = f"orders_{since or 'all'}_{dates[1].isoformat() if until else 'now'}.{fmt}"
+
+        with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as out:
+            count = await write_orders(self.db.iter_orders(since, until), fmt, out)
+            out.seek(0)
+            await update.message.reply_document(
+                # Файл не читается в память целиком, а отдается HTTP-клиенту как поток
+                document=InputFile(out, filename=filename, read_file_handle=False),
+                caption=f"📦 Заказов в выгрузке: {count}"
+            )
+
+    async def render_find_page(self, query: str, page: int):
+        """Текст и клавиатура одной страницы результатов поиска"""
+        orders, has_more = await self.db.search_orders(query, limit=FIND_PAGE_SIZE, offset=page * FIND_PAGE_SIZE)
+        if not orders:
+            return ("Ничего не найдено." if page == 0 else "Больше результатов нет."), None
+
+        text = f"🔎 **Поиск:** {escape_markdown(query)}\n\n"
+        for order in orders:
+            text += (
+                f"{STATUS_EMOJI.get(order['status'], '📝')} **#{order['id']}** "
+                f"{order['created_at'].strftime('%d.%m.%Y %H:%M')}, {order['total_amount']} руб.\n"
+                f"  {escape_markdown(order['customer'] or 'Без имени')}\n"
+            )
+            if order['items']:
+                text += f"  {escape_markdown(order['items'])}\n"
+            if order['notes']:
+                text += f"  _{escape_markdown(order['notes'])}_\n"
+
+        # Сам запрос в callback_data не помещается (64 байта), он хранится в user_data
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"find_{page - 1}"))
+        if has_more:
+            navigation.append(InlineKeyboardButton("Дальше ➡️", callback_data=f"find_{page + 1}"))
+        return text, InlineKeyboardMarkup([navigation]) if navigation else None
+
+    async def find_orders(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Поиск заказов для администраторов (/find <запрос>)"""
+        if update.effective_user.id not in ADMIN_IDS:
+            return
+
+        query = ' '.join(context.args or [])
+        if not query:
+            return await update.message.reply_text(
+                "Использование: /find <имя, телефон, напиток, комментарий, адрес или время>")
+
+        context.user_data['find_query'] = query
+        text, reply_markup = await self.render_find_page(query, 0)
+        await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+
+    async def show_find_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Листание результатов /find по inline-кнопкам"""
+        query = update.callback_query
+        if query.from_user.id not in ADMIN_IDS:
+            return await query.answer()
+
+        search = context.user_data.get('find_query')
+        if search is None:
+            return await query.answer("Повторите поиск командой /find", show_alert=True)
+        await query.answer()
+
+        text, reply_markup = await self.render_find_page(search, int(query.data.split('_', 1)[1]))
+        await query.edit_message_text(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+
     async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Отмена текущего действия"""
         await update.message.reply_text(
@@ -352,9 +776,81 @@ class CoffeeShopBot:
         )
         return ConversationHandler.END
 
-    def run(self):
-        """Запуск бота"""
-        application = Application.builder().token(BOT_TOKEN).build()
+    async def archive_orders_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Периодический перенос старых завершенных заказов в архив"""
+        cutoff = (datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            moved = await self.db.archive_orders(cutoff, batch_size=ARCHIVE_BATCH_SIZE)
+        except Exception as e:
+            logger.error(f"Error archiving orders: {e}")
+            return
+        if moved:
+            logger.info(f"Archived {moved} orders created before {cutoff}")
+
+    async def on_startup(self, application: Application):
+        """Открытие пула соединений с БД при старте приложения"""
+        await self.db.connect()
+        self.notifier.start(application.bot)
+
+        if self.leader:
+            await self.start_background(application)
+
+        if self.metrics.enabled and METRICS_PORT:
+            # У каждого воркера свой порт метрик: METRICS_PORT + номер воркера
+            port = METRICS_PORT + (self.cluster.index if self.cluster is not None else 0)
+            self.metrics_server = HTTPServer(METRICS_HOST, port)
+            self.metrics_server.route('/metrics', self.metrics.http_handler)
+            await self.metrics_server.start()
+
+    async def start_background(self, application: Application):
+        """Фоновые задачи, которые в кластере выполняет только воркер 0"""
+        self.outbox.start()
+
+        # Куча планировщика восстанавливается из БД; пропущенные за время простоя напоминания
+        # сработают сразу, но только для заказов, время которых еще не прошло (с запасом)
+        since = self.scheduler.clock() - PREP_MISSED_GRACE_MINUTES * 60
+        self.scheduler.load(
+            (order_id, scheduled_at - PREP_LEAD_MINUTES * 60)
+            for order_id, scheduled_at in await self.db.get_scheduled_orders(since)
+        )
+        self.scheduler.start()
+
+        if ARCHIVE_AFTER_DAYS > 0:
+            if application.job_queue is None:
+                logger.warning("Job queue is not available, order archiving is disabled")
+            else:
+                application.job_queue.run_repeating(
+                    self.archive_orders_job, interval=ARCHIVE_INTERVAL, first=60, name='archive_orders')
+
+        if MENU_PORT:
+            self.menu_server = HTTPServer(MENU_HOST, MENU_PORT)
+            self.menu_server.route('/menu.json', self.menu_endpoint.http_handler)
+            await self.menu_server.start()
+
+    async def on_shutdown(self, application: Application):
+        """Закрытие соединений с БД при остановке приложения"""
+        if self.menu_server is not None:
+            await self.menu_server.stop()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.scheduler.stop()
+        await self.outbox.stop()
+        await self.notifier.stop()
+        await self.db.close()
+
+    def build_application(self, builder: Optional[ApplicationBuilder] = None,
+                          max_concurrent_updates: int = MAX_CONCURRENT_UPDATES) -> Application:
+        """Сборка приложения с обработчиками"""
+        if builder is None:
+            builder = Application.builder().token(BOT_TOKEN)
+
+        application = (
+            builder
+            .post_init(self.on_startup)
+            .post_shutdown(self.on_shutdown)
+            .concurrent_updates(PerUserUpdateProcessor(max_concurrent_updates, admission=self.admission))
+            .build()
+        )
 
         # ConversationHandler для профиля
         profile_conv = ConversationHandler(
@@ -368,14 +864,85 @@ class CoffeeShopBot:
 
         # Обработчики
         application.add_handler(CommandHandler('start', self.start))
+        application.add_handler(CommandHandler('metrics', self.show_metrics))
+        application.add_handler(CommandHandler('stats', self.show_stats))
+        application.add_handler(CommandHandler('rebuild_stats', self.rebuild_stats))
+        application.add_handler(CommandHandler('vacuum', self.vacuum_database))
+        application.add_handler(CommandHandler('queue', self.show_queue))
+        application.add_handler(CommandHandler('export', self.export_orders))
+        application.add_handler(CommandHandler('find', self.find_orders))
         application.add_handler(profile_conv)
         application.add_handler(MessageHandler(filters.StatusUpdate.WEB_APP_DATA, self.handle_web_app_data))
         application.add_handler(CallbackQueryHandler(self.update_order_status, pattern='^status_'))
+        application.add_handler(CallbackQueryHandler(self.show_order_history_page, pattern='^history_'))
+        application.add_handler(CallbackQueryHandler(self.show_find_page, pattern=r'^find_\d+$'))
         application.add_handler(CallbackQueryHandler(self.handle_callback))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        application.add_error_handler(self.handle_error)
+        self.instrument_handlers(application)
+
+        return application
+
+    def instrument_handlers(self, application: Application):
+        """Замер задержек каждого зарегистрированного обработчика, включая шаги диалогов"""
+        pending = [handler for group in application.handlers.values() for handler in group]
+        while pending:
+            handler = pending.pop()
+            if isinstance(handler, ConversationHandler):
+                pending.extend(handler.entry_points)
+                pending.extend(step for steps in handler.states.values() for step in steps)
+                pending.extend(handler.fallbacks)
+            else:
+                handler.callback = self.metrics.wrap('handler', handler.callback)
+
+    async def run_worker(self, application: Application):
+        """Воркер кластера: обновления приходят от супервизора, а не от Telegram
+
+        По SIGTERM (или когда супервизор закрыл соединение) воркер дорабатывает
+        полученные обновления и останавливается.
+        """
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        await self.cluster.connect()
+        await application.initialize()
+        await self.on_startup(application)
+        await application.start()
+
+        serving = asyncio.create_task(self.cluster.serve(application, self.apply_event))
+        stopping = asyncio.create_task(stop.wait())
+        await asyncio.wait((serving, stopping), return_when=asyncio.FIRST_COMPLETED)
+        serving.cancel()
+        stopping.cancel()
+
+        await application.update_queue.join()
+        await application.stop()
+        await self.on_shutdown(application)
+        await application.shutdown()
+        await self.cluster.close()
 
-        # Запуск бота
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+    def run(self):
+        """Запуск бота"""
+        if self.cluster is not None:
+            application = self.build_application(Application.builder().token(BOT_TOKEN).updater(None))
+            asyncio.run(self.run_worker(application))
+            return
+
+        application = self.build_application()
+
+        if BOT_MODE == 'webhook':
+            application.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
 
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка callback запросов"""
@@ -388,7 +955,7 @@ class CoffeeShopBot:
             keyboard = [
                 [
                     KeyboardButton("🛒 Сделать заказ", web_app=WebAppInfo(
-                        url=f"https://yourdomain.com/index.html?user_id={query.from_user.id}")),
+                        url=self.web_app_url(query.from_user.id))),
                     KeyboardButton("👤 Мой профиль")
                 ],
             ]
@@ -396,6 +963,39 @@ class CoffeeShopBot:
             await query.message.reply_text("Главное меню:", reply_markup=reply_markup)
 
 
+async def start_updates(updater: Updater):
+    """Получение обновлений супервизором: тот же режим, что и у одиночного бота"""
+    if BOT_MODE == 'webhook':
+        await updater.start_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        await updater.start_polling(allowed_updates=Update.ALL_TYPES)
+
+
+async def migrate_database():
+    """Привести схему к последней версии до запуска воркеров, чтобы миграции не шли параллельно"""
+    db = Database()
+    await db.connect()
+    await db.close()
+
+
+def run_supervisor():
+    asyncio.run(migrate_database())
+    updater = Updater(Bot(BOT_TOKEN), asyncio.Queue(UPDATER_QUEUE_SIZE))
+    Supervisor(worker_command(__file__), WORKERS, SUPERVISOR_SOCKET).run(updater, start_updates)
+
+
 if __name__ == '__main__':
-    bot = CoffeeShopBot()
-    bot.run()
\ No newline at end of file
+    if WORKER_INDEX is not None:
+        CoffeeShopBot(cluster=ClusterClient(SUPERVISOR_SOCKET, WORKER_INDEX, WORKERS)).run()
+    elif WORKERS > 1:
+        run_supervisor()
+    else:
+        bot = CoffeeShopBot()
+        bot.run()
\ No newline at end of file
@@ -0,0 +1,72 @@
+# backend/cache.py
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Маркер отсутствия записи в кэше (None - допустимое закэшированное значение)
+MISSING = object()
+
+
+class LRUCache:
+    """Ограниченный по размеру LRU-кэш с TTL и счетчиками попаданий"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        # Растет при каждой инвалидации: чтение из БД, начатое до нее, не попадет в кэш
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Вернуть значение или MISSING"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return MISSING
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None,
+            generation: Optional[int] = None):
+        """Сохранить значение; устаревшее чтение (другое поколение) отбрасывается"""
+        if generation is not None and generation != self.generation:
+            return
+
+        self._data[key] = (self.clock() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """Удалить запись из кэша"""
+        self.generation += 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        self.generation += 1
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики кэша"""
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
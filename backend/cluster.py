@@ -0,0 +1,335 @@
+# backend/cluster.py
+"""Многопроцессный режим: супервизор и воркеры
+
+Супервизор получает обновления от Telegram (polling или webhook через
+Updater из PTB) и раздает их WORKERS процессам-обработчикам по user_id:
+все обновления одного пользователя попадают в один и тот же воркер, так
+что состояние диалогов, user_data и допуск обновлений остаются локальными.
+Воркеры работают с общей базой SQLite в режиме WAL.
+
+Связь - Unix-сокет, по сокету на воркер; сообщения - строки JSON:
+    {"hello": номер}              воркер -> супервизор, воркер готов
+    {"update": {...}}             супервизор -> воркер
+    {"event": [вид, аргументы]}   в обе стороны: супервизор рассылает событие
+                                  воркера всем остальным воркерам
+    {"drain": n} / {"drained": n} дождаться обработки всех отправленных обновлений
+
+События - инвалидация кэшей процессов (профили, доска заказов) и поручения
+воркеру 0, который один выполняет фоновые задачи: outbox, напоминания о
+заказах ко времени, архивацию. Сообщения для воркера, который еще не
+подключился или перезапускается, копятся в его очереди и достаются новому
+процессу. Очередь обновлений ограничена: когда она полна, супервизор
+перестает забирать обновления у Updater, его ограниченная очередь
+UPDATER_QUEUE_SIZE тоже заполняется, и Updater перестает запрашивать
+Telegram (в режиме webhook - отвечать на запросы), так что обновления
+ждут на стороне Telegram, а не теряются.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application, Updater
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений копится для занятого или недоступного воркера, прежде чем супервизор
+# перестанет забирать новые; события и drain не ограничены - их мало, и терять их нельзя
+MAX_PENDING_UPDATES = 10000
+# Очередь Updater супервизора: когда она полна, новые обновления остаются в Telegram
+UPDATER_QUEUE_SIZE = 100
+# Пауза перед перезапуском упавшего воркера
+RESTART_DELAY = 1.0
+# Сколько ждать завершения воркеров при остановке, прежде чем убить их
+STOP_TIMEOUT = 30.0
+# Предел длины одной строки протокола (обновление с длинным текстом или данными Web App)
+LINE_LIMIT = 2 ** 22
+
+EventHandler = Callable[[str, list], Awaitable[None]]
+
+
+def partition(update: Update, workers: int) -> int:
+    """Номер воркера для обновления; обновления без пользователя - воркеру 0"""
+    user = update.effective_user
+    return user.id % workers if user is not None else 0
+
+
+def encode(message: Dict) -> bytes:
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class WorkerChannel:
+    """Очередь сообщений одного воркера на стороне супервизора
+
+    Переживает перезапуск воркера: все, что еще не записано в сокет,
+    получит следующий процесс. Элемент очереди - (строка, обновление ли это).
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.connected = asyncio.Event()
+        self._update_slots = asyncio.Semaphore(MAX_PENDING_UPDATES)
+        # Взятое из очереди, но не отправленное: соединение к этому моменту уже закрылось
+        self._unsent: Optional[Tuple[bytes, bool]] = None
+
+    def put(self, line: bytes):
+        """Служебное сообщение (событие, drain) - без ограничения"""
+        self.queue.put_nowait((line, False))
+
+    async def put_update(self, line: bytes):
+        """Обновление; ждет, пока в очереди меньше MAX_PENDING_UPDATES обновлений"""
+        await self._update_slots.acquire()
+        self.queue.put_nowait((line, True))
+
+    async def get(self) -> Tuple[bytes, bool]:
+        if self._unsent is not None:
+            item, self._unsent = self._unsent, None
+            return item
+        return await self.queue.get()
+
+    def sent(self, item: Tuple[bytes, bool]):
+        if item[1]:
+            self._update_slots.release()
+
+    def unsent(self, item: Tuple[bytes, bool]):
+        """Вернуть сообщение в голову очереди для следующего подключения"""
+        self._unsent = item
+
+    @property
+    def pending(self) -> int:
+        return self.queue.qsize() + (self._unsent is not None)
+
+
+class Supervisor:
+    """Запускает воркеры, раздает им обновления и пересылает события между ними
+
+    command - команда запуска воркера; номер воркера, их число и путь к
+    сокету передаются ему в переменных окружения WORKER_INDEX, WORKERS и
+    SUPERVISOR_SOCKET. Упавший воркер перезапускается.
+    """
+
+    def __init__(self, command: List[str], workers: int, socket_path: str,
+                 env: Optional[Dict[str, str]] = None):
+        self.command = command
+        self.workers = workers
+        self.socket_path = socket_path
+        self.env = env or {}
+        self.channels = [WorkerChannel(index) for index in range(workers)]
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._monitors: List[asyncio.Task] = []
+        self._drains: Dict[int, asyncio.Future] = {}
+        self._drain_id = 0
+        self._stopping = False
+
+    async def start(self, timeout: float = 60.0):
+        """Открыть сокет, запустить воркеры и дождаться готовности каждого"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle, self.socket_path, limit=LINE_LIMIT)
+        for channel in self.channels:
+            self._monitors.append(asyncio.create_task(self._monitor(channel)))
+        await asyncio.wait_for(
+            asyncio.gather(*(channel.connected.wait() for channel in self.channels)), timeout)
+        logger.info(f"Supervisor started {self.workers} workers")
+
+    async def stop(self):
+        """Остановить воркеры: они дорабатывают полученные обновления и выходят"""
+        self._stopping = True
+        for channel in self.channels:
+            if channel.process is not None and channel.process.returncode is None:
+                channel.process.send_signal(signal.SIGTERM)
+        for channel in self.channels:
+            if channel.process is None:
+                continue
+            try:
+                await asyncio.wait_for(channel.process.wait(), STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.error(f"Worker {channel.index} did not stop in time, killing it")
+                channel.process.kill()
+                await channel.process.wait()
+        for task in self._monitors:
+            task.cancel()
+        await asyncio.gather(*self._monitors, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    async def dispatch(self, update: Update):
+        """Отправить обновление воркеру, отвечающему за его пользователя
+
+        Если у воркера уже MAX_PENDING_UPDATES неотправленных обновлений, ждет места.
+        """
+        channel = self.channels[partition(update, self.workers)]
+        await channel.put_update(encode({'update': update.to_dict()}))
+
+    async def drain(self):
+        """Дождаться, пока воркеры обработают все уже отправленные им обновления"""
+        loop = asyncio.get_running_loop()
+        waiters = []
+        for channel in self.channels:
+            self._drain_id += 1
+            future = self._drains[self._drain_id] = loop.create_future()
+            channel.put(encode({'drain': self._drain_id}))
+            waiters.append(future)
+        await asyncio.gather(*waiters)
+
+    def broadcast(self, event: list, source: Optional[int] = None):
+        """Разослать событие всем воркерам, кроме источника"""
+        line = encode({'event': event})
+        for channel in self.channels:
+            if channel.index != source:
+                channel.put(line)
+
+    async def _monitor(self, channel: WorkerChannel):
+        env = {**os.environ, **self.env, 'WORKER_INDEX': str(channel.index),
+               'WORKERS': str(self.workers), 'SUPERVISOR_SOCKET': self.socket_path}
+        while True:
+            channel.process = await asyncio.create_subprocess_exec(*self.command, env=env)
+            code = await channel.process.wait()
+            channel.connected.clear()
+            if self._stopping:
+                return
+            logger.error(f"Worker {channel.index} exited with code {code}, restarting")
+            await asyncio.sleep(RESTART_DELAY)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        hello = json.loads(await reader.readline())
+        channel = self.channels[hello['hello']]
+        channel.connected.set()
+        sender = asyncio.create_task(self._send(channel, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if 'event' in message:
+                    self.broadcast(message['event'], source=channel.index)
+                elif 'drained' in message:
+                    future = self._drains.pop(message['drained'], None)
+                    if future is not None and not future.done():
+                        future.set_result(None)
+        except (ConnectionError, ValueError) as e:
+            logger.error(f"Lost connection to worker {channel.index}: {e}")
+        finally:
+            sender.cancel()
+            writer.close()
+
+    @staticmethod
+    async def _send(channel: WorkerChannel, writer: asyncio.StreamWriter):
+        while True:
+            item = await channel.get()
+            if writer.is_closing():
+                # Воркер отключился: сообщение получит перезапущенный процесс
+                channel.unsent(item)
+                return
+            writer.write(item[0])
+            channel.sent(item)
+            # Пока воркер занят, буфер сокета не растет: ждем, пока он прочитает
+            if channel.queue.empty():
+                await writer.drain()
+
+    async def serve(self, updater: Updater, start_updates: Callable[[Updater], Awaitable]):
+        """Основной цикл: получать обновления через updater до SIGINT/SIGTERM"""
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        await self.start()
+        async with updater:
+            await start_updates(updater)
+            fetcher = asyncio.create_task(self._fetch(updater.update_queue))
+            await stop.wait()
+            await updater.stop()
+            fetcher.cancel()
+        await self.stop()
+
+    async def _fetch(self, queue: asyncio.Queue):
+        # Пока dispatch ждет места у воркера, очередь Updater не разбирается
+        while True:
+            await self.dispatch(await queue.get())
+
+    def run(self, updater: Updater, start_updates: Callable[[Updater], Awaitable]):
+        asyncio.run(self.serve(updater, start_updates))
+
+
+class ClusterClient:
+    """Связь воркера с супервизором"""
+
+    def __init__(self, socket_path: str, index: int, workers: int):
+        self.socket_path = socket_path
+        self.index = index
+        self.workers = workers
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    @property
+    def leader(self) -> bool:
+        """Воркер 0 выполняет фоновые задачи за весь кластер"""
+        return self.index == 0
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path, limit=LINE_LIMIT)
+
+    def _write(self, message: Dict):
+        if self._writer is not None and not self._writer.is_closing():
+            self._writer.write(encode(message))
+
+    def publish(self, kind: str, *args):
+        """Отправить событие остальным воркерам"""
+        self._write({'event': [kind, *args]})
+
+    async def serve(self, application: Application, on_event: EventHandler):
+        """Получать обновления и события, пока супервизор не закроет соединение
+
+        Обновления кладутся в очередь приложения, как это делает Updater.
+        События обрабатываются по одному в порядке поступления.
+        """
+        self._write({'hello': self.index})
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    return
+                message = json.loads(line)
+                if 'update' in message:
+                    await application.update_queue.put(Update.de_json(message['update'], application.bot))
+                elif 'event' in message:
+                    kind, *args = message['event']
+                    try:
+                        await on_event(kind, args)
+                    except Exception as e:
+                        logger.error(f"Error handling cluster event {kind}: {e}")
+                elif 'drain' in message:
+                    asyncio.create_task(self._drained(application, message['drain']))
+        except (ConnectionError, ValueError) as e:
+            logger.error(f"Lost connection to supervisor: {e}")
+
+    async def _drained(self, application: Application, token: int):
+        # Application отмечает task_done, когда обработчики обновления завершились
+        await application.update_queue.join()
+        self._write({'drained': token})
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+            self._writer = None
+
+
+def worker_command(script: str) -> List[str]:
+    """Команда запуска воркера тем же интерпретатором"""
+    return [sys.executable, os.path.abspath(script)]
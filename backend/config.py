@@ -6,4 +6,62 @@ load_dotenv()
 
 BOT_TOKEN = os.getenv('BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
 ADMIN_IDS = [int(id.strip()) for id in os.getenv('ADMIN_IDS', '').split(',') if id.strip()]
-WEB_APP_URL = os.getenv('WEB_APP_URL', 'https://yourdomain.com')
\ No newline at end of file
+WEB_APP_URL = os.getenv('WEB_APP_URL', 'https://yourdomain.com')
+# Эндпоинт меню для Web App; снаружи должен быть доступен как WEB_APP_URL/menu.json (0 - не запускать)
+MENU_HOST = os.getenv('MENU_HOST', '127.0.0.1')
+MENU_PORT = int(os.getenv('MENU_PORT', '8081'))
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+# Многопроцессный режим: WORKERS процессов-обработчиков под управлением супервизора (1 - один процесс);
+# обновления распределяются по user_id, супервизор и воркеры связаны Unix-сокетом SUPERVISOR_SOCKET
+WORKERS = int(os.getenv('WORKERS', '1'))
+SUPERVISOR_SOCKET = os.getenv('SUPERVISOR_SOCKET', 'coffee_shop.sock')
+# Номер воркера; задается супервизором при запуске процесса
+WORKER_INDEX = int(os.environ['WORKER_INDEX']) if os.getenv('WORKER_INDEX') else None
+# Сколько обновлений обрабатывается одновременно (обновления одного пользователя - по очереди)
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '64'))
+# Допуск обновлений: ADMISSION_RATE обновлений в секунду на пользователя с запасом ADMISSION_BURST,
+# не больше ADMISSION_MAX_IN_FLIGHT обновлений в работе (остальные сбрасываются),
+# повтор того же заказа из Web App в течение DUPLICATE_ORDER_WINDOW секунд отбрасывается; 0 - без ограничения
+ADMISSION_RATE = float(os.getenv('ADMISSION_RATE', '2'))
+ADMISSION_BURST = float(os.getenv('ADMISSION_BURST', '10'))
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '256'))
+DUPLICATE_ORDER_WINDOW = float(os.getenv('DUPLICATE_ORDER_WINDOW', '10'))
+
+# Размер пачки при переносе данных в миграциях схемы
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', '1000'))
+
+# Метрики: гистограммы задержек обработчиков и запросов к БД
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+# Порт HTTP-эндпоинта /metrics в формате Prometheus, 0 - не запускать
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '100'))
+
+# Архивация: завершенные и отмененные заказы старше ARCHIVE_AFTER_DAYS дней (0 - не архивировать)
+# раз в ARCHIVE_INTERVAL секунд переносятся в архивный файл пачками по ARCHIVE_BATCH_SIZE
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_INTERVAL = int(os.getenv('ARCHIVE_INTERVAL', '3600'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '500'))
+
+# Бонусные баллы (1 балл = 1 руб.): начисляется LOYALTY_ACCRUAL_PERCENT процентов оплаченной деньгами суммы,
+# баллами можно оплатить не больше LOYALTY_MAX_REDEEM_PERCENT процентов заказа
+LOYALTY_ACCRUAL_PERCENT = float(os.getenv('LOYALTY_ACCRUAL_PERCENT', '5'))
+LOYALTY_MAX_REDEEM_PERCENT = float(os.getenv('LOYALTY_MAX_REDEEM_PERCENT', '50'))
+
+# Отправленные и брошенные уведомления хранятся OUTBOX_RETENTION_DAYS дней (0 - не удалять);
+# все это время повтор с тем же ключом дедупликации не отправляется
+OUTBOX_RETENTION_DAYS = float(os.getenv('OUTBOX_RETENTION_DAYS', '7'))
+
+# Часовой пояс кофейни: в нем клиент указывает время заказа
+SHOP_TIMEZONE = os.getenv('SHOP_TIMEZONE', 'Europe/Moscow')
+# За сколько минут до времени заказа администраторам приходит напоминание начать готовить
+PREP_LEAD_MINUTES = int(os.getenv('PREP_LEAD_MINUTES', '15'))
+# Напоминание, пропущенное за время простоя, приходит после старта, если время заказа
+# прошло не больше чем PREP_MISSED_GRACE_MINUTES минут назад
+PREP_MISSED_GRACE_MINUTES = int(os.getenv('PREP_MISSED_GRACE_MINUTES', '5'))
@@ -1,137 +1,346 @@
 # backend/database.py
+import os
 import sqlite3
-import json
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
 import aiosqlite
 import asyncio
 
+from cache import LRUCache, MISSING
+from config import SHOP_TIMEZONE
+from loyalty import BALANCE_UPDATE, ORDER_INSERT, LoyaltyRule
+from migrations import OPEN_ORDERS_WHERE, migrate
+from order_board import ActiveOrderBoard, OPEN_STATUSES, STATUS_SOURCES
+from order_schema import OrderPayload, encode_lines
+from records import HistoryOrderRecord, ItemRecord, OrderRecord, PlacedOrderRecord, USER_COLUMNS, UserRecord
+from rollups import ROLLUP_REBUILD
+from search import (
+    ARCHIVE_SEARCH_PROFILE_UPDATE, SEARCH_CANDIDATES, SEARCH_COLUMNS, SEARCH_INSERT, SEARCH_WEIGHTS,
+    items_text, match_query, scheduled_text
+)
+
+# Колонки заказа без устаревшего JSON-поля items, в порядке полей OrderRecord
+ORDER_COLUMNS = ('id, user_id, total_amount, status, delivery_type, '
+                 'scheduled_time, address, notes, created_at, scheduled_at')
+
+# Позиции заказа из JSON-массива order_schema.encode_lines одним оператором. order_items -
+# WITHOUT ROWID таблица, поэтому last_insert_rowid() все время указывает на только что вставленный заказ
+ORDER_ITEMS_INSERT = '''
+    INSERT INTO order_items (order_id, position, menu_item_id, name, quantity, unit_price, options)
+    SELECT last_insert_rowid(), key, json_extract(value, '$[0]'), json_extract(value, '$[1]'),
+           json_extract(value, '$[3]'), json_extract(value, '$[2]'), json_extract(value, '$[4]')
+    FROM json_each(?)
+'''
+
+# Завершенные заказы, которые можно переносить в архив
+ARCHIVABLE_STATUSES = ('completed', 'cancelled')
+
+# Настройки соединений: WAL позволяет читателям не ждать коммитов писателя
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -8000',
+    'PRAGMA mmap_size = 134217728',
+)
+
 
 class Database:
-    def __init__(self, db_path='coffee_shop.db'):
+    def __init__(self, db_path='coffee_shop.db', readers: int = 4,
+                 batch_writes: bool = True, batch_size: int = 64,
+                 batch_max_latency: float = 0.002, user_cache_size: int = 10000,
+                 user_cache_ttl: float = 300.0, user_cache_negative_ttl: float = 60.0,
+                 archive_path: Optional[str] = None, loyalty: Optional[LoyaltyRule] = None):
         self.db_path = db_path
-        self.init_db()
-
-    def init_db(self):
-        """Инициализация базы данных"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Таблица пользователей
-        cursor.execute('''
-                       CREATE TABLE IF NOT EXISTS users
-                       (
-                           user_id
-                           INTEGER
-                           PRIMARY
-                           KEY,
-                           username
-                           TEXT,
-                           first_name
-                           TEXT,
-                           last_name
-                           TEXT,
-                           name
-                           TEXT,
-                           phone
-                           TEXT,
-                           address
-                           TEXT,
-                           bonus_points
-                           INTEGER
-                           DEFAULT
-                           0,
-                           created_at
-                           TIMESTAMP
-                           DEFAULT
-                           CURRENT_TIMESTAMP
-                       )
-                       ''')
-
-        # Таблица заказов
-        cursor.execute('''
-                       CREATE TABLE IF NOT EXISTS orders
-                       (
-                           id
-                           INTEGER
-                           PRIMARY
-                           KEY
-                           AUTOINCREMENT,
-                           user_id
-                           INTEGER,
-                           items
-                           TEXT,
-                           total_amount
-                           REAL,
-                           status
-                           TEXT
-                           DEFAULT
-                           'new',
-                           delivery_type
-                           TEXT,
-                           scheduled_time
-                           TEXT,
-                           address
-                           TEXT,
-                           notes
-                           TEXT,
-                           created_at
-                           TIMESTAMP
-                           DEFAULT
-                           CURRENT_TIMESTAMP,
-                           FOREIGN
-                           KEY
-                       (
-                           user_id
-                       ) REFERENCES users
-                       (
-                           user_id
-                       )
-                           )
-                       ''')
-
-        conn.commit()
-        conn.close()
-
-    async def get_user(self, user_id: int) -> Optional[Dict]:
-        """Получить пользователя по ID"""
-        async with aiosqlite.connect(self.db_path) as db:
+        # Архив старых заказов - отдельный файл, подключаемый к каждому соединению как archive
+        self.archive_path = archive_path or f"{os.path.splitext(db_path)[0]}_archive.db"
+        self.readers = readers
+        self.batch_writes = batch_writes
+        self.batch_size = batch_size
+        self.batch_max_latency = batch_max_latency
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._reader_pool: Optional[asyncio.Queue] = None
+        self._reader_conns: List[aiosqlite.Connection] = []
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._write_task: Optional[asyncio.Task] = None
+        self.user_cache = LRUCache(maxsize=user_cache_size, ttl=user_cache_ttl)
+        self.user_cache_negative_ttl = user_cache_negative_ttl
+        self.active_orders = ActiveOrderBoard()
+        self.loyalty = loyalty or LoyaltyRule()
+        # Часовой пояс кофейни: в нем индексируется время заказа для поиска
+        self.timezone = ZoneInfo(SHOP_TIMEZONE)
+        # Примененные при connect() миграции: (версия, название, секунды)
+        self.migrations: List[Tuple[int, str, float]] = []
+        # Вызывается после записи, которая делает устаревшими кэши других процессов:
+        # ('user', user_id) или ('order', order_id), см. apply_change
+        self.on_change: Optional[Callable[[str, int], None]] = None
+
+    async def _open_connection(self, read_only: bool = False) -> aiosqlite.Connection:
+        """Открыть долгоживущее соединение с настроенными PRAGMA"""
+        conn = await aiosqlite.connect(self.db_path)
+        # Режим auto_vacuum меняется только до первой записи в файл, а journal_mode = WAL ее делает:
+        # новая база сразу создается в режиме incremental, у существующей PRAGMA ничего не меняет
+        await conn.execute('PRAGMA main.auto_vacuum = INCREMENTAL')
+        # Архив подключается до PRAGMA, чтобы journal_mode применился и к нему
+        await conn.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+        for pragma in CONNECTION_PRAGMAS:
+            await conn.execute(pragma)
+        if read_only:
+            await conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    async def connect(self):
+        """Открыть пул соединений: один писатель и несколько читателей"""
+        if self._writer is not None:
+            return
+
+        self._writer = await self._open_connection()
+        # Схема приводится к последней версии до того, как откроются читатели
+        self.migrations = await migrate(self._writer)
+        self._reader_pool = asyncio.Queue()
+        for _ in range(max(1, self.readers)):
+            conn = await self._open_connection(read_only=True)
+            self._reader_conns.append(conn)
+            self._reader_pool.put_nowait(conn)
+
+        if self.batch_writes:
+            self._write_queue = asyncio.Queue()
+            self._write_task = asyncio.create_task(self._write_loop())
+
+        self.active_orders.load(await self.get_open_orders())
+
+    async def close(self):
+        """Закрыть все соединения пула"""
+        if self._write_task is not None:
+            # Дожидаемся записи всего, что уже стоит в очереди
+            self._write_queue.put_nowait(None)
+            await self._write_task
+            self._write_task = None
+            self._write_queue = None
+
+        for conn in self._reader_conns:
+            await conn.close()
+        self._reader_conns = []
+        self._reader_pool = None
+
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+
+    def _changed(self, kind: str, key: int):
+        if self.on_change is not None:
+            self.on_change(kind, key)
+
+    async def apply_change(self, kind: str, key: int):
+        """Учесть запись, сделанную другим процессом: сбросить профиль или перечитать заказ"""
+        if kind == 'user':
+            self.user_cache.invalidate(key)
+        elif kind == 'order':
+            order = await self.get_order(key)
+            if order is None or order.status not in OPEN_STATUSES:
+                self.active_orders.remove(key)
+            else:
+                self.active_orders.add(order)
+
+    @asynccontextmanager
+    async def _read(self):
+        """Взять соединение для чтения из пула"""
+        if self._reader_pool is None:
+            raise RuntimeError('Database is not connected, call connect() first')
+        conn = await self._reader_pool.get()
+        try:
+            yield conn
+        finally:
+            self._reader_pool.put_nowait(conn)
+
+    @asynccontextmanager
+    async def _write(self):
+        """Эксклюзивный доступ к соединению-писателю"""
+        if self._writer is None:
+            raise RuntimeError('Database is not connected, call connect() first')
+        async with self._write_lock:
+            try:
+                yield self._writer
+            except Exception:
+                await self._writer.rollback()
+                raise
+
+    def write_queue_depth(self) -> int:
+        """Количество записей, ожидающих группового коммита"""
+        return self._write_queue.qsize() if self._write_queue is not None else 0
+
+    async def _submit_write(self, query: str, params: tuple) -> int:
+        """Выполнить запись через групповую очередь и вернуть lastrowid"""
+        lastrowid, _ = await self._submit_writes([(query, params)])
+        return lastrowid
+
+    async def _submit_writes(self, statements: List[Tuple[str, tuple]]) -> Tuple[int, object]:
+        """Атомарно выполнить несколько операторов через групповую очередь
+
+        Возвращает lastrowid и rowcount первого оператора. Если первый оператор
+        с RETURNING, возвращается None и список его строк.
+        """
+        return (await self._submit_unit(statements))[0]
+
+    async def _submit_unit(self, statements: List[Tuple[str, tuple]]) -> List[Tuple[int, object]]:
+        """То же, что _submit_writes, но с результатом каждого оператора"""
+        if self._write_queue is None:
+            async with self._write() as db:
+                result = await self._execute_unit(db, statements)
+                await db.commit()
+                return result
+
+        future = asyncio.get_running_loop().create_future()
+        self._write_queue.put_nowait((statements, future))
+        return await future
+
+    @staticmethod
+    async def _execute_unit(db: aiosqlite.Connection,
+                            statements: List[Tuple[str, tuple]]) -> List[Tuple[int, object]]:
+        results = []
+        for query, params in statements:
+            if 'RETURNING' in query:
+                # Выполнение и чтение строк - одно обращение к потоку соединения вместо двух;
+                # lastrowid у таких операторов не нужен, id возвращает сам RETURNING
+                results.append((None, await db.execute_fetchall(query, params)))
+            else:
+                cursor = await db.execute(query, params)
+                results.append((cursor.lastrowid, cursor.rowcount))
+        return results
+
+    async def _write_loop(self):
+        """Фоновая задача: собирает записи в пачки и коммитит их одной транзакцией"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            item = await self._write_queue.get()
+            if item is None:
+                break
+
+            # Пачка закрывается по размеру или по сроку ожидания первой записи. Если за первой
+            # записью никого нет, ждать не из-за чего: одиночная запись коммитится сразу, а под
+            # нагрузкой записи и так копятся в очереди, пока идет коммит предыдущей пачки
+            batch = [item]
+            deadline = loop.time() + self.batch_max_latency
+            while len(batch) < self.batch_size:
+                if self._write_queue.empty():
+                    if len(batch) == 1:
+                        break
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._write_queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._write_queue.get_nowait()
+
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush_writes(batch)
+
+    async def _flush_writes(self, batch: List[tuple]):
+        """Записать пачку в одной транзакции, раздав результаты по future"""
+        results = []
+        try:
+            async with self._write() as db:
+                await db.execute('BEGIN')
+                for statements, future in batch:
+                    # Одиночный оператор и так атомарен, для нескольких нужен savepoint
+                    savepoint = len(statements) > 1
+                    if savepoint:
+                        await db.execute('SAVEPOINT write_unit')
+                    try:
+                        result = await self._execute_unit(db, statements)
+                    except sqlite3.Error as e:
+                        # Ошибка откатывает только эту запись, если транзакция жива
+                        if not db.in_transaction:
+                            raise
+                        if savepoint:
+                            await db.execute('ROLLBACK TO write_unit')
+                            await db.execute('RELEASE write_unit')
+                        results.append((future, None, e))
+                    else:
+                        if savepoint:
+                            await db.execute('RELEASE write_unit')
+                        results.append((future, result, None))
+                await db.commit()
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _cache_user(self, user_id: int, user: Optional[UserRecord], generation: Optional[int] = None):
+        """Положить пользователя (или факт его отсутствия) в кэш"""
+        ttl = None if user is not None else self.user_cache_negative_ttl
+        self.user_cache.put(user_id, user, ttl=ttl, generation=generation)
+
+    async def get_user(self, user_id: int) -> Optional[UserRecord]:
+        """Получить пользователя по ID (копию записи из кэша)"""
+        cached = self.user_cache.get(user_id)
+        if cached is not MISSING:
+            return cached.copy() if cached is not None else None
+
+        generation = self.user_cache.generation
+        async with self._read() as db:
             cursor = await db.execute(
-                'SELECT * FROM users WHERE user_id = ?',
+                f'SELECT {USER_COLUMNS} FROM users WHERE user_id = ?',
                 (user_id,)
             )
-            row = await cursor.fetchone()
-            if row:
-                return {
-                    'user_id': row[0],
-                    'username': row[1],
-                    'first_name': row[2],
-                    'last_name': row[3],
-                    'name': row[4],
-                    'phone': row[5],
-                    'address': row[6],
-                    'bonus_points': row[7],
-                    'created_at': row[8]
-                }
-            return None
+            cursor.row_factory = UserRecord
+            user = await cursor.fetchone()
+
+        self._cache_user(user_id, user, generation)
+        return user.copy() if user is not None else None
+
+    def user_cache_stats(self) -> Dict[str, int]:
+        """Счетчики кэша профилей: попадания, промахи, вытеснения"""
+        return self.user_cache.stats()
 
     async def create_user(self, user_id: int, username: str = None,
                           first_name: str = None, last_name: str = None):
         """Создать нового пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
+        async with self._write() as db:
+            cursor = await db.execute(
                 '''INSERT
                 OR IGNORE INTO users 
                 (user_id, username, first_name, last_name) 
-                VALUES (?, ?, ?, ?)''',
+                VALUES (?, ?, ?, ?) RETURNING ''' + USER_COLUMNS,
                 (user_id, username, first_name, last_name)
             )
+            cursor.row_factory = UserRecord
+            user = await cursor.fetchone()
             await db.commit()
 
+        # Новая запись сразу попадает в кэш вместо отрицательного результата
+        self.user_cache.invalidate(user_id)
+        if user:
+            self._cache_user(user_id, user)
+            self._changed('user', user_id)
+
     async def update_user_profile(self, user_id: int, name: str = None,
                                   phone: str = None, address: str = None):
         """Обновить профиль пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             updates = []
             params = []
 
@@ -147,78 +356,615 @@ class Database:
 
             if updates:
                 params.append(user_id)
-                query = f"UPDATE users SET {', '.join(updates)} WHERE user_id = ?"
-                await db.execute(query, params)
+                query = f"UPDATE users SET {', '.join(updates)} WHERE user_id = ? RETURNING {USER_COLUMNS}"
+                cursor = await db.execute(query, params)
+                cursor.row_factory = UserRecord
+                user = await cursor.fetchone()
+                if user and (name or phone):
+                    # Живые заказы в поиске обновляет триггер, архивные - только этот запрос
+                    await db.execute(ARCHIVE_SEARCH_PROFILE_UPDATE, (user_id, user_id))
                 await db.commit()
 
+                self.user_cache.invalidate(user_id)
+                if user:
+                    self._cache_user(user_id, user)
+                    self._changed('user', user_id)
+
     async def create_order(self, user_id: int, items: List[Dict], total_amount: float,
                            delivery_type: str = 'pickup', scheduled_time: str = None,
-                           address: str = None, notes: str = '') -> int:
-        """Создать новый заказ"""
-        async with aiosqlite.connect(self.db_path) as db:
+                           address: str = None, notes: str = '',
+                           scheduled_at: Optional[float] = None, redeem_points: int = 0) -> int:
+        """Создать новый заказ вместе с его позициями"""
+        placed = await self._insert_order(
+            user_id, items, encode_lines(items), total_amount, delivery_type,
+            scheduled_time, address, notes, scheduled_at, redeem_points
+        )
+        return placed.id
+
+    async def save_order(self, user_id: int, order: OrderPayload,
+                         scheduled_at: Optional[float] = None) -> PlacedOrderRecord:
+        """Сохранить проверенный заказ из Web App; позиции уже закодированы в order.items_json
+
+        Заказ, позиции, строка поиска и баллы клиента (списание order.redeem_points
+        и начисление по правилу self.loyalty) записываются одной единицей записи.
+        Возвращает сумму к оплате, баллы и профиль клиента уже после заказа.
+        """
+        return await self._insert_order(
+            user_id, order.line_items, order.items_json, order.total, order.delivery_type,
+            order.scheduled_time, order.address, order.notes, scheduled_at, order.redeem_points
+        )
+
+    async def _insert_order(self, user_id: int, items: List, items_json: str, total_amount: float,
+                            delivery_type: str, scheduled_time: Optional[str], address: Optional[str],
+                            notes: str, scheduled_at: Optional[float], redeem_points: int) -> PlacedOrderRecord:
+        (_, order_rows), _, (_, user_rows), _ = await self._submit_unit([
+            (ORDER_INSERT, {
+                'user_id': user_id, 'total': total_amount, 'redeem': redeem_points,
+                'delivery_type': delivery_type, 'scheduled_time': scheduled_time, 'address': address,
+                'notes': notes, 'scheduled_at': scheduled_at,
+                'accrual': self.loyalty.accrual_percent, 'max_redeem': self.loyalty.max_redeem_percent,
+            }),
+            (ORDER_ITEMS_INSERT, (items_json,)),
+            # Ни UPDATE, ни вставка позиций не меняют last_insert_rowid(): баланс и строка поиска берут из него id заказа
+            (BALANCE_UPDATE, (user_id,)),
+            (SEARCH_INSERT, (scheduled_text(scheduled_time, scheduled_at, self.timezone), address, notes,
+                             items_text(items), user_id)),
+        ])
+        if not order_rows:
+            # INSERT ... SELECT из однострочного подзапроса всегда вставляет заказ; если нет -
+            # сломан сам запрос, и продолжать с чужим last_insert_rowid() нельзя
+            raise sqlite3.IntegrityError(f"Order for user {user_id} was not inserted")
+        placed = PlacedOrderRecord(None, order_rows[0])
+        if user_rows:
+            # Профиль с новым балансом уже прочитан в транзакции заказа: кэш обновляется без запроса
+            placed.customer = UserRecord(None, user_rows[0])
+            self.user_cache.invalidate(user_id)
+            self._cache_user(user_id, placed.customer.copy())
+            self._changed('user', user_id)
+
+        order_id = placed.id
+        self.active_orders.add({
+            'id': order_id,
+            'user_id': user_id,
+            'total_amount': total_amount,
+            'status': 'new',
+            'delivery_type': delivery_type,
+            'scheduled_time': scheduled_time,
+            'address': address,
+            'notes': notes,
+            'created_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+            'scheduled_at': scheduled_at,
+            'items': items
+        })
+        self._changed('order', order_id)
+        return placed
+
+    async def _get_items(self, db: aiosqlite.Connection, where: str, params: tuple,
+                         schema: str = 'main', items: Optional[Dict[int, List[ItemRecord]]] = None
+                         ) -> Dict[int, List[ItemRecord]]:
+        """Позиции заказов, сгруппированные по order_id
+
+        schema='archive' читает позиции архивных заказов; переданный items дополняется.
+        """
+        cursor = await db.execute(
+            f'''SELECT order_id, menu_item_id, name, unit_price, quantity, options
+                FROM {schema}.order_items WHERE {where} ORDER BY order_id, position''',
+            params
+        )
+        cursor.row_factory = ItemRecord
+        if items is None:
+            items = {}
+        for item in await cursor.fetchall():
+            items.setdefault(item.order_id, []).append(item)
+        return items
+
+    async def get_order(self, order_id: int) -> Optional[OrderRecord]:
+        """Получить заказ по ID (если его нет среди живых заказов - из архива)"""
+        async with self._read() as db:
+            for schema in ('main', 'archive'):
+                cursor = await db.execute(
+                    f'SELECT {ORDER_COLUMNS} FROM {schema}.orders WHERE id = ?',
+                    (order_id,)
+                )
+                cursor.row_factory = OrderRecord
+                order = await cursor.fetchone()
+                if order:
+                    break
+            else:
+                return None
+            items = await self._get_items(db, 'order_id = ?', (order_id,), schema=schema)
+
+        order.line_items = items.get(order_id, [])
+        return order
+
+    async def get_open_orders(self) -> List[OrderRecord]:
+        """Открытые заказы с позициями (по частичному индексу idx_orders_open)"""
+        async with self._read() as db:
+            cursor = await db.execute(
+                f'SELECT {ORDER_COLUMNS} FROM orders WHERE {OPEN_ORDERS_WHERE} ORDER BY created_at, id'
+            )
+            cursor.row_factory = OrderRecord
+            orders = await cursor.fetchall()
+            items = {}
+            if orders:
+                items = await self._get_items(
+                    db, f'order_id IN (SELECT id FROM orders WHERE {OPEN_ORDERS_WHERE})', ())
+
+        for order in orders:
+            order.line_items = items.get(order.id, [])
+        return orders
+
+    async def iter_orders(self, since: Optional[str] = None, until: Optional[str] = None,
+                          chunk_size: int = 500) -> AsyncIterator[OrderRecord]:
+        """Потоково перебрать заказы с позициями за период [since, until)
+
+        Строки читаются курсором порциями по chunk_size, позиции - отдельным
+        запросом на каждую порцию, так что в памяти не больше одной порции.
+        """
+        conditions, params = [], []
+        if since:
+            conditions.append('created_at >= ?')
+            params.append(since)
+        if until:
+            conditions.append('created_at < ?')
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        async with self._read() as db:
+            # Живые и архивные заказы сливаются по индексам created_at, сортировки в памяти нет
+            cursor = await db.execute(
+                f'''SELECT {ORDER_COLUMNS} FROM main.orders {where}
+                    UNION ALL
+                    SELECT {ORDER_COLUMNS} FROM archive.orders {where}
+                    ORDER BY created_at, id''',
+                params * 2
+            )
+            cursor.row_factory = OrderRecord
+            try:
+                while True:
+                    orders = await cursor.fetchmany(chunk_size)
+                    if not orders:
+                        break
+                    order_ids = tuple(order.id for order in orders)
+                    where_ids = f"order_id IN ({', '.join('?' * len(order_ids))})"
+                    items = await self._get_items(db, where_ids, order_ids)
+                    await self._get_items(db, where_ids, order_ids, schema='archive', items=items)
+                    for order in orders:
+                        order.line_items = items.get(order.id, [])
+                        yield order
+            finally:
+                await cursor.close()
+
+    async def get_scheduled_orders(self, since: float) -> List[Tuple[int, float]]:
+        """Новые заказы ко времени не раньше since: (id, scheduled_at)
+
+        Диапазон по частичному индексу idx_orders_scheduled; давно прошедшие
+        заказы (в том числе заполненные миграцией старые) не возвращаются.
+        """
+        async with self._read() as db:
             cursor = await db.execute(
-                '''INSERT INTO orders
-                   (user_id, items, total_amount, delivery_type, scheduled_time, address, notes)
-                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                (user_id, json.dumps(items), total_amount, delivery_type,
-                 scheduled_time, address, notes)
+                "SELECT id, scheduled_at FROM orders WHERE status = 'new' AND scheduled_at >= ?",
+                (since,)
             )
+            return [(row[0], row[1]) for row in await cursor.fetchall()]
+
+    async def get_user_orders(self, user_id: int, with_items: bool = True) -> List[HistoryOrderRecord]:
+        """Получить все заказы пользователя, включая архивные
+
+        with_items=False не читает позиции заказов, если они не нужны.
+        Дата заказа (ключ created_at) разбирается при первом обращении.
+        """
+        async with self._read() as db:
+            cursor = await db.execute(
+                f'''SELECT {ORDER_COLUMNS} FROM main.orders WHERE user_id = ?
+                    UNION ALL
+                    SELECT {ORDER_COLUMNS} FROM archive.orders WHERE user_id = ?
+                    ORDER BY created_at DESC''',
+                (user_id, user_id)
+            )
+            cursor.row_factory = HistoryOrderRecord
+            orders = await cursor.fetchall()
+            if with_items and orders:
+                items = {}
+                for schema in ('main', 'archive'):
+                    await self._get_items(
+                        db, f'order_id IN (SELECT id FROM {schema}.orders WHERE user_id = ?)',
+                        (user_id,), schema=schema, items=items)
+                for order in orders:
+                    order.line_items = items.get(order.id, [])
+        return orders
+
+    async def rebuild_rollups(self):
+        """Пересчитать агрегаты продаж с нуля"""
+        async with self._write() as db:
+            for statement in ROLLUP_REBUILD:
+                await db.execute(statement)
             await db.commit()
-            return cursor.lastrowid
 
-    async def get_order(self, order_id: int) -> Optional[Dict]:
-        """Получить заказ по ID"""
-        async with aiosqlite.connect(self.db_path) as db:
+    async def get_sales_stats(self, since_day: str, until_day: str, top: int = 5) -> Dict:
+        """Статистика продаж за дни [since_day, until_day) в формате 'YYYY-MM-DD'
+
+        Читает только агрегаты, поэтому время не зависит от числа заказов.
+        """
+        async with self._read() as db:
             cursor = await db.execute(
-                'SELECT * FROM orders WHERE id = ?',
-                (order_id,)
+                '''SELECT COALESCE(SUM(orders), 0), COALESCE(SUM(revenue), 0)
+                   FROM sales_daily WHERE day >= ? AND day < ?''',
+                (since_day, until_day)
             )
-            row = await cursor.fetchone()
-            if row:
-                return {
-                    'id': row[0],
-                    'user_id': row[1],
-                    'items': json.loads(row[2]),
-                    'total_amount': row[3],
-                    'status': row[4],
-                    'delivery_type': row[5],
-                    'scheduled_time': row[6],
-                    'address': row[7],
-                    'notes': row[8],
-                    'created_at': row[9]
-                }
+            orders, revenue = await cursor.fetchone()
+
+            cursor = await db.execute(
+                '''SELECT status, SUM(orders) FROM sales_status
+                   WHERE day >= ? AND day < ? GROUP BY status''',
+                (since_day, until_day)
+            )
+            statuses = {row[0]: row[1] for row in await cursor.fetchall() if row[1]}
+
+            cursor = await db.execute(
+                '''SELECT menu_item_id, MAX(name), SUM(quantity), SUM(revenue) FROM sales_items
+                   WHERE day >= ? AND day < ?
+                   GROUP BY menu_item_id HAVING SUM(quantity) > 0
+                   ORDER BY SUM(quantity) DESC LIMIT ?''',
+                (since_day, until_day, top)
+            )
+            top_items = [
+                {'menu_item_id': row[0], 'name': row[1], 'quantity': row[2], 'revenue': row[3]}
+                for row in await cursor.fetchall()
+            ]
+
+            cursor = await db.execute(
+                '''SELECT hour, orders FROM sales_hourly
+                   WHERE hour >= ? AND hour < ? AND orders > 0
+                   ORDER BY orders DESC, hour LIMIT 1''',
+                (since_day, until_day)
+            )
+            busiest_hour = await cursor.fetchone()
+
+        return {
+            'orders': orders,
+            'revenue': revenue,
+            'statuses': statuses,
+            'top_items': top_items,
+            'busiest_hour': busiest_hour
+        }
+
+    async def get_user_orders_page(self, user_id: int, limit: int = 10,
+                                   cursor: Optional[Tuple[str, int]] = None,
+                                   direction: str = 'next'
+                                   ) -> Tuple[List[Dict], Optional[Tuple[str, int]], Optional[Tuple[str, int]]]:
+        """Получить одну страницу истории заказов (keyset-пагинация)
+
+        cursor - ключ (created_at, id) граничного заказа уже показанной страницы.
+        direction='next' листает к более старым заказам, 'prev' - к более новым.
+        Возвращает (заказы, курсор следующей страницы, курсор предыдущей страницы).
+        """
+        # Живые и архивные заказы сливаются по индексам (user_id, created_at, id) обеих баз
+        if cursor is None:
+            condition, order, params = '', 'DESC', (user_id,)
+        elif direction == 'prev':
+            condition, order, params = 'AND (created_at, id) > (?, ?)', 'ASC', (user_id, *cursor)
+        else:
+            condition, order, params = 'AND (created_at, id) < (?, ?)', 'DESC', (user_id, *cursor)
+        query = ' UNION ALL '.join(
+            f'SELECT id, status, total_amount, created_at FROM {schema}.orders WHERE user_id = ? {condition}'
+            for schema in ('main', 'archive')
+        ) + f' ORDER BY created_at {order}, id {order} LIMIT ?'
+        params = params * 2 + (limit + 1,)
+
+        async with self._read() as db:
+            db_cursor = await db.execute(query, params)
+            rows = await db_cursor.fetchall()
+
+        backwards = cursor is not None and direction == 'prev'
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backwards:
+            rows.reverse()
+
+        orders = [
+            {
+                'id': row[0],
+                'status': row[1],
+                'total_amount': row[2],
+                'created_at': datetime.strptime(row[3], '%Y-%m-%d %H:%M:%S')
+            }
+            for row in rows
+        ]
+
+        if not rows:
+            return orders, None, None
+
+        first_key = (rows[0][3], rows[0][0])
+        last_key = (rows[-1][3], rows[-1][0])
+        if backwards:
+            return orders, last_key, first_key if has_more else None
+        return orders, last_key if has_more else None, first_key if cursor is not None else None
+
+    async def search_orders(self, query: str, limit: int = 10, offset: int = 0) -> Tuple[List[Dict], bool]:
+        """Поиск заказов по индексу order_search, лучшие совпадения первыми
+
+        Ищет и среди живых, и среди архивных заказов; ранжируются последние
+        SEARCH_CANDIDATES совпадений каждой базы. Возвращает одну страницу
+        результатов и признак того, что есть следующая.
+        """
+        match = match_query(query)
+        if match is None:
+            return [], False
+
+        # Сначала только id и bm25 (чем меньше, тем лучше совпадение): индекс отдает совпадения
+        # от новых к старым и останавливается на SEARCH_CANDIDATES. Индексы баз ранжируются
+        # каждый своей статистикой
+        ranking = ' UNION ALL '.join(
+            f'''SELECT * FROM (
+                    SELECT '{schema}', rowid AS id, bm25(order_search, {SEARCH_WEIGHTS}) AS score
+                    FROM {schema}.order_search WHERE order_search MATCH ?
+                    ORDER BY rowid DESC LIMIT {SEARCH_CANDIDATES}
+                )'''
+            for schema in ('main', 'archive')
+        ) + ' ORDER BY score, id DESC LIMIT ? OFFSET ?'
+
+        async with self._read() as db:
+            cursor = await db.execute(ranking, (match, match, limit + 1, offset))
+            ranked = await cursor.fetchall()
+            has_more = len(ranked) > limit
+            ranked = ranked[:limit]
+
+            # Заказы - только для показываемой страницы и по rowid: повторный MATCH (например,
+            # для snippet) снова прошел бы по всем совпадениям
+            found = {}
+            for schema in ('main', 'archive'):
+                order_ids = [order_id for order_schema, order_id, _ in ranked if order_schema == schema]
+                if not order_ids:
+                    continue
+                cursor = await db.execute(
+                    f'''SELECT o.id, o.status, o.total_amount, o.created_at, s.customer, s.items, s.notes
+                        FROM {schema}.orders o JOIN {schema}.order_search s ON s.rowid = o.id
+                        WHERE o.id IN ({', '.join('?' * len(order_ids))})''',
+                    order_ids
+                )
+                for row in await cursor.fetchall():
+                    found[row[0]] = row
+
+        orders = [
+            {
+                'id': row[0],
+                'status': row[1],
+                'total_amount': row[2],
+                'created_at': datetime.strptime(row[3], '%Y-%m-%d %H:%M:%S'),
+                'customer': ' '.join(row[4].split()),
+                'items': row[5],
+                'notes': row[6]
+            }
+            for row in (found.get(order_id) for _, order_id, _ in ranked) if row is not None
+        ]
+        return orders, has_more
+
+    async def update_order_status(self, order_id: int, status: str,
+                                  notification: Optional[str] = None) -> Optional[Dict]:
+        """Перевести заказ в новый статус по таблице STATUS_TRANSITIONS
+
+        Переход - один условный UPDATE: он проходит, только если текущий статус
+        допускает переход, и сразу возвращает то, что нужно для уведомления.
+        Из нескольких одновременных нажатий побеждает ровно одно, остальные
+        получают None. Уведомление клиенту кладется в outbox в той же
+        транзакции и только при смене статуса; историю пишет триггер.
+        """
+        sources = STATUS_SOURCES.get(status)
+        if not sources:
+            return None
+
+        placeholders = ', '.join('?' * len(sources))
+        statements = [(
+            f'''UPDATE orders SET status = ? WHERE id = ? AND status IN ({placeholders})
+                RETURNING user_id, total_amount''',
+            (status, order_id, *sources)
+        )]
+        if notification:
+            # Срабатывает только если UPDATE выше сменил статус: проигравший
+            # переход либо не находит заказ в этом статусе, либо упирается в dedup_key
+            statements.append((
+                '''INSERT OR IGNORE INTO outbox (chat_id, text, dedup_key)
+                   SELECT user_id, ?, ? FROM orders WHERE id = ? AND status = ?''',
+                (notification, f"order:{order_id}:{status}", order_id, status)
+            ))
+
+        _, rows = await self._submit_writes(statements)
+        if not rows:
             return None
 
-    async def get_user_orders(self, user_id: int) -> List[Dict]:
-        """Получить все заказы пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        # Доска кухни: завершенные заказы с нее убираются
+        self.active_orders.set_status(order_id, status)
+        self._changed('order', order_id)
+        user_id, total_amount = rows[0]
+        if status == 'cancelled':
+            # Баллы за отмененный заказ вернул триггер trg_loyalty_cancel
+            self.user_cache.invalidate(user_id)
+            self._changed('user', user_id)
+        return {'id': order_id, 'user_id': user_id, 'status': status, 'total_amount': total_amount}
+
+    async def archive_orders(self, older_than: str, batch_size: int = 500,
+                             vacuum_pages: int = 1000) -> int:
+        """Перенести завершенные и отмененные заказы старше older_than в архив
+
+        Заказы переносятся пачками по batch_size; блокировка записи держится
+        только на время одной пачки. Копия пачки в архив и удаление из живых
+        таблиц - одна транзакция: читатели не видят заказ сразу в обеих базах,
+        а ошибка на любом шаге откатывает пачку целиком. (В режиме WAL SQLite
+        не обещает атомарность между файлами при сбое питания посреди коммита.)
+        Освободившиеся страницы возвращаются файловой системе через
+        incremental_vacuum.
+        Возвращает число перенесенных заказов.
+        """
+        statuses = ', '.join(repr(status) for status in ARCHIVABLE_STATUSES)
+        moved = 0
+
+        while True:
+            async with self._write() as db:
+                cursor = await db.execute(
+                    f'''SELECT id FROM orders
+                        WHERE created_at < ? AND status IN ({statuses})
+                        ORDER BY created_at LIMIT ?''',
+                    (older_than, batch_size)
+                )
+                order_ids = tuple(row[0] for row in await cursor.fetchall())
+                if not order_ids:
+                    break
+
+                ids = ', '.join('?' * len(order_ids))
+                await db.execute(
+                    f'''INSERT OR REPLACE INTO archive.orders ({ORDER_COLUMNS}, points_redeemed, points_earned, items)
+                        SELECT {ORDER_COLUMNS}, points_redeemed, points_earned, items FROM main.orders
+                        WHERE id IN ({ids})''',
+                    order_ids
+                )
+                await db.execute(
+                    f'''INSERT OR REPLACE INTO archive.order_items
+                        SELECT * FROM main.order_items WHERE order_id IN ({ids})''',
+                    order_ids
+                )
+                await db.execute(
+                    f'''INSERT OR REPLACE INTO archive.order_status_history
+                        SELECT * FROM main.order_status_history WHERE order_id IN ({ids})''',
+                    order_ids
+                )
+                await db.execute(
+                    f'''INSERT OR REPLACE INTO archive.order_search (rowid, {SEARCH_COLUMNS})
+                        SELECT rowid, {SEARCH_COLUMNS} FROM main.order_search WHERE rowid IN ({ids})''',
+                    order_ids
+                )
+                await db.execute(f'DELETE FROM main.order_status_history WHERE order_id IN ({ids})', order_ids)
+                await db.execute(f'DELETE FROM main.order_items WHERE order_id IN ({ids})', order_ids)
+                await db.execute(f'DELETE FROM main.orders WHERE id IN ({ids})', order_ids)
+                await db.commit()
+            moved += len(order_ids)
+
+            # Даем пройти другим записям между пачками
+            await asyncio.sleep(0)
+
+        free_pages = None
+        while moved:
+            async with self._write() as db:
+                cursor = await db.execute('PRAGMA main.freelist_count')
+                remaining = (await cursor.fetchone())[0]
+                # Без auto_vacuum = INCREMENTAL список свободных страниц не уменьшается
+                if not remaining or remaining == free_pages:
+                    break
+                free_pages = remaining
+                # PRAGMA освобождает страницы по одной на шаг, поэтому дочитываем результат
+                cursor = await db.execute(f'PRAGMA main.incremental_vacuum({int(vacuum_pages)})')
+                await cursor.fetchall()
+                await db.commit()
+            await asyncio.sleep(0)
+
+        return moved
+
+    async def vacuum(self) -> Dict:
+        """Вернуть свободные страницы базы файловой системе (/vacuum)
+
+        Базу, созданную до режима auto_vacuum = INCREMENTAL, переводит в него
+        полным VACUUM: он переписывает весь файл и все это время держит
+        блокировку записи, поэтому выполняется только по команде. В режиме
+        incremental хватает incremental_vacuum без перезаписи файла.
+        Возвращает, был ли VACUUM полным, сколько страниц освобождено и за сколько секунд.
+        """
+        start = time.perf_counter()
+        async with self._write() as db:
+            cursor = await db.execute('PRAGMA main.auto_vacuum')
+            full = (await cursor.fetchone())[0] != 2
+            cursor = await db.execute('PRAGMA main.freelist_count')
+            free_pages = (await cursor.fetchone())[0]
+            if full:
+                await db.execute('PRAGMA main.auto_vacuum = INCREMENTAL')
+                await db.execute('VACUUM main')
+            elif free_pages:
+                cursor = await db.execute('PRAGMA main.incremental_vacuum')
+                await cursor.fetchall()
+                await db.commit()
+            cursor = await db.execute('PRAGMA main.freelist_count')
+            freed = free_pages - (await cursor.fetchone())[0]
+        return {'full': full, 'freed_pages': freed, 'seconds': time.perf_counter() - start}
+
+    async def enqueue_notifications(self, entries: List[Tuple[int, str, str]]):
+        """Положить в outbox уведомления (chat_id, текст, ключ дедупликации)
+
+        Запись с уже известным ключом пропускается, так что повторный вызов
+        не отправит уведомление второй раз.
+        """
+        if not entries:
+            return
+        await self._submit_writes([
+            ('INSERT OR IGNORE INTO outbox (chat_id, text, dedup_key) VALUES (?, ?, ?)', entry)
+            for entry in entries
+        ])
+
+    async def get_due_outbox(self, now: float, limit: int = 50) -> List[Dict]:
+        """Получить уведомления из outbox, которые пора отправить"""
+        async with self._read() as db:
             cursor = await db.execute(
-                'SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC',
-                (user_id,)
+                '''SELECT id, chat_id, text, attempts FROM outbox
+                   WHERE status = 'pending' AND next_attempt_at <= ?
+                   ORDER BY next_attempt_at, id LIMIT ?''',
+                (now, limit)
             )
             rows = await cursor.fetchall()
 
-            orders = []
-            for row in rows:
-                orders.append({
-                    'id': row[0],
-                    'user_id': row[1],
-                    'items': json.loads(row[2]),
-                    'total_amount': row[3],
-                    'status': row[4],
-                    'delivery_type': row[5],
-                    'scheduled_time': row[6],
-                    'address': row[7],
-                    'notes': row[8],
-                    'created_at': datetime.strptime(row[9], '%Y-%m-%d %H:%M:%S')
-                })
-            return orders
-
-    async def update_order_status(self, order_id: int, status: str):
-        """Обновить статус заказа"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                'UPDATE orders SET status = ? WHERE id = ?',
-                (status, order_id)
+        return [
+            {'id': row[0], 'chat_id': row[1], 'text': row[2], 'attempts': row[3]}
+            for row in rows
+        ]
+
+    async def get_next_outbox_time(self) -> Optional[float]:
+        """Время ближайшей запланированной попытки отправки"""
+        async with self._read() as db:
+            cursor = await db.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'"
             )
-            await db.commit()
\ No newline at end of file
+            row = await cursor.fetchone()
+        return row[0]
+
+    async def complete_outbox(self, entry_ids: List[int]):
+        """Отметить уведомления как отправленные"""
+        if not entry_ids:
+            return
+        async with self._write() as db:
+            await db.executemany(
+                "UPDATE outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP WHERE id = ?",
+                [(entry_id,) for entry_id in entry_ids]
+            )
+            await db.commit()
+
+    async def prune_outbox(self, older_than: str, batch_size: int = 1000) -> int:
+        """Удалить отправленные и брошенные уведомления старше older_than (UTC) пачками"""
+        removed = 0
+        while True:
+            _, count = await self._submit_writes([(
+                '''DELETE FROM outbox WHERE id IN (
+                       SELECT id FROM outbox
+                       WHERE status != 'pending' AND COALESCE(sent_at, created_at) < ? LIMIT ?
+                   )''',
+                (older_than, batch_size)
+            )])
+            removed += count
+            if count < batch_size:
+                return removed
+
+    async def fail_outbox(self, failures: List[Tuple[int, int, Optional[float], str]]):
+        """Записать неудачные попытки: (id, attempts, время следующей попытки, ошибка)
+
+        Если время следующей попытки None, уведомление больше не отправляется.
+        """
+        if not failures:
+            return
+        async with self._write() as db:
+            await db.executemany(
+                '''UPDATE outbox
+                   SET attempts = ?,
+                       next_attempt_at = COALESCE(?, next_attempt_at),
+                       status = CASE WHEN ? IS NULL THEN 'failed' ELSE 'pending' END,
+                       last_error = ?
+                   WHERE id = ?''',
+                [(attempts, next_at, next_at, error, entry_id)
+                 for entry_id, attempts, next_at, error in failures]
+            )
+            await db.commit()
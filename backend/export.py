@@ -0,0 +1,49 @@
+# backend/export.py
+import csv
+import io
+import json
+from typing import AsyncIterator, BinaryIO, Dict
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+CSV_COLUMNS = ('id', 'created_at', 'user_id', 'status', 'delivery_type', 'scheduled_time',
+               'address', 'notes', 'total_amount', 'items')
+
+
+def _items_summary(items) -> str:
+    return '; '.join(f"{item['name']} x{item['quantity']} по {item['price']}" for item in items)
+
+
+async def write_orders(orders: AsyncIterator[Dict], fmt: str, out: BinaryIO) -> int:
+    """Записать заказы в файл построчно и вернуть их количество
+
+    Строки кодируются по мере чтения, поэтому память не зависит от размера выгрузки.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt}")
+
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='')
+    count = 0
+    try:
+        if fmt == 'csv':
+            # BOM нужен, чтобы Excel открыл файл в UTF-8
+            text.write('\ufeff')
+            writer = csv.writer(text)
+            writer.writerow(CSV_COLUMNS)
+            async for order in orders:
+                writer.writerow([
+                    order['id'], order['created_at'], order['user_id'], order['status'],
+                    order['delivery_type'], order['scheduled_time'], order['address'],
+                    order['notes'], order['total_amount'], _items_summary(order['items'])
+                ])
+                count += 1
+        else:
+            async for order in orders:
+                # Записи заказов и позиций - отображения, json сериализует их через dict
+                text.write(json.dumps(order, ensure_ascii=False, default=dict))
+                text.write('\n')
+                count += 1
+    finally:
+        # Отвязываем обертку, чтобы она не закрыла файл вызывающего
+        text.detach()
+    return count
@@ -0,0 +1,80 @@
+# backend/http_server.py
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Ответ обработчика: (код, заголовки, тело)
+Response = Tuple[int, Dict[str, str], bytes]
+Handler = Callable[[Dict[str, str], Dict[str, str]], Awaitable[Response]]
+
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class HTTPServer:
+    """Минимальный HTTP-сервер на asyncio для локальных служебных эндпоинтов"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8080):
+        self.host = host
+        self.port = port
+        self.routes: Dict[str, Handler] = {}
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    def route(self, path: str, handler: Handler):
+        """Зарегистрировать обработчик GET-запросов для пути"""
+        self.routes[path] = handler
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"HTTP server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            parts = request_line.decode('latin-1').split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            if len(parts) != 3:
+                response = (400, {}, b'')
+            elif parts[0] not in ('GET', 'HEAD'):
+                response = (405, {}, b'')
+            else:
+                url = urlsplit(parts[1])
+                handler = self.routes.get(url.path)
+                if handler is None:
+                    response = (404, {}, b'')
+                else:
+                    query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                    try:
+                        response = await handler(headers, query)
+                    except Exception as e:
+                        logger.error(f"Error handling {url.path}: {e}")
+                        response = (500, {}, b'')
+
+            status, response_headers, body = response
+            head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                    f"Content-Length: {len(body)}", "Connection: close"]
+            head.extend(f"{name}: {value}" for name, value in response_headers.items())
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+            if parts and parts[0] != 'HEAD':
+                writer.write(body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
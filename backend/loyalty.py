@@ -0,0 +1,70 @@
+# backend/loyalty.py
+"""Бонусные баллы: начисление и списание в транзакции заказа
+
+Один балл - один рубль. Клиент может оплатить баллами не больше
+max_redeem_percent суммы заказа и не больше своего баланса; за оплаченную
+деньгами часть начисляется accrual_percent баллов (с округлением вниз).
+orders.total_amount остается суммой по меню, как и в агрегатах продаж
+(sales_daily и sales_items считают одну и ту же выручку); оплаченное
+баллами хранится отдельно в points_redeemed, к оплате - разность.
+Сколько баллов списано и начислено, считает сам INSERT заказа по балансу,
+прочитанному в той же транзакции, и запоминает в заказе; баланс меняется
+относительным UPDATE. Поэтому одновременные заказы одного клиента (в том
+числе из разных воркеров) не теряют начислений и не списывают баллы
+дважды. При отмене заказа триггер возвращает списанное и забирает
+начисленное.
+"""
+from config import LOYALTY_ACCRUAL_PERCENT, LOYALTY_MAX_REDEEM_PERCENT
+from records import USER_COLUMNS
+
+
+class LoyaltyRule:
+    """Правило начисления и списания баллов"""
+
+    def __init__(self, accrual_percent: float = LOYALTY_ACCRUAL_PERCENT,
+                 max_redeem_percent: float = LOYALTY_MAX_REDEEM_PERCENT):
+        self.accrual_percent = accrual_percent
+        self.max_redeem_percent = max_redeem_percent
+
+
+# Заказ вместе с расчетом баллов; именованные параметры: user_id, total (сумма по меню),
+# redeem (сколько баллов клиент хочет списать), accrual и max_redeem - проценты правила.
+# Подзапрос p - всегда ровно одна строка, поэтому заказ вставляется и без профиля клиента:
+# тогда баллы не списываются и не начисляются
+ORDER_INSERT = '''
+    INSERT INTO orders (user_id, total_amount, delivery_type, scheduled_time, address, notes, scheduled_at,
+                        points_redeemed, points_earned)
+    SELECT :user_id, :total, :delivery_type, :scheduled_time, :address, :notes, :scheduled_at,
+           p.redeemed, CASE WHEN p.member THEN CAST((:total - p.redeemed) * :accrual / 100 AS INTEGER) ELSE 0 END
+    FROM (
+        SELECT u.user_id IS NOT NULL AS member,
+               MAX(0, MIN(:redeem, COALESCE(u.bonus_points, 0), CAST(:total * :max_redeem / 100 AS INTEGER)))
+                   AS redeemed
+        FROM (SELECT :user_id AS user_id) n LEFT JOIN users u ON u.user_id = n.user_id
+    ) p
+    RETURNING id, total_amount - points_redeemed, points_redeemed, points_earned
+'''
+
+# Баланс клиента после заказа, вставленного последним (last_insert_rowid); параметр - user_id.
+# Возвращает профиль целиком: он нужен для сообщения администраторам
+BALANCE_UPDATE = f'''
+    UPDATE users
+    SET bonus_points = COALESCE(bonus_points, 0) + (
+        SELECT points_earned - points_redeemed FROM orders WHERE id = last_insert_rowid()
+    )
+    WHERE user_id = ?
+    RETURNING {USER_COLUMNS}
+'''
+
+LOYALTY_TRIGGERS = (
+    # Баланс не уходит в минус, если начисленное за заказ уже потрачено
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_loyalty_cancel AFTER UPDATE OF status ON orders
+    WHEN NEW.status = 'cancelled' AND OLD.status IS NOT 'cancelled'
+        AND (OLD.points_redeemed != 0 OR OLD.points_earned != 0)
+    BEGIN
+        UPDATE users SET bonus_points = MAX(0, COALESCE(bonus_points, 0) + OLD.points_redeemed - OLD.points_earned)
+        WHERE user_id = NEW.user_id;
+    END
+    ''',
+)
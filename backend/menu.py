@@ -0,0 +1,83 @@
+# backend/menu.py
+import json
+import os
+import time
+from typing import Dict, FrozenSet, Optional
+
+# Верхняя граница количества одной позиции в заказе
+MAX_QUANTITY = 50
+
+
+class MenuValidationError(ValueError):
+    """Заказ не соответствует текущему меню"""
+
+
+class MenuSnapshot:
+    """Неизменяемый снимок меню с индексами для поиска"""
+
+    __slots__ = ('data', 'mtime', 'items', 'categories', 'item_category', 'options', 'derived')
+
+    def __init__(self, data: Dict, mtime: float):
+        self.data = data
+        self.mtime = mtime
+        self.items: Dict[int, Dict] = {}
+        self.categories: Dict[int, Dict] = {}
+        self.item_category: Dict[int, int] = {}
+        self.options: Dict[int, Dict[str, FrozenSet[str]]] = {}
+        # Производные данные, которые потребители считают по снимку один раз (ключ - имя потребителя)
+        self.derived: Dict[str, object] = {}
+
+        for category in data.get('categories', []):
+            self.categories[category['id']] = category
+            for item in category.get('items', []):
+                self.items[item['id']] = item
+                self.item_category[item['id']] = category['id']
+                self.options[item['id']] = {
+                    option['name']: frozenset(option['choices'])
+                    for option in item.get('options', [])
+                }
+
+
+class MenuCatalog:
+    """Меню кофейни: индексы по id, проверка заказов и перезагрузка при изменении файла"""
+
+    def __init__(self, path: str = 'menu.json', check_interval: float = 1.0, clock=time.monotonic):
+        self.path = path
+        self.check_interval = check_interval
+        self.clock = clock
+        self._checked_at = clock()
+        self.snapshot = self._load()
+
+    def _load(self) -> MenuSnapshot:
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return MenuSnapshot(json.load(f), mtime)
+
+    def maybe_reload(self) -> bool:
+        """Перечитать menu.json, если он изменился; вернуть True при перезагрузке"""
+        now = self.clock()
+        if now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+
+        try:
+            if os.stat(self.path).st_mtime == self.snapshot.mtime:
+                return False
+            snapshot = self._load()
+        except (OSError, ValueError, KeyError):
+            # Недописанный или битый файл: продолжаем работать со старым меню
+            return False
+
+        # Замена одной ссылкой: читатели видят либо старое, либо новое меню целиком
+        self.snapshot = snapshot
+        return True
+
+    @property
+    def data(self) -> Dict:
+        return self.snapshot.data
+
+    def get_item(self, item_id: int) -> Optional[Dict]:
+        return self.snapshot.items.get(item_id)
+
+    def get_category(self, category_id: int) -> Optional[Dict]:
+        return self.snapshot.categories.get(category_id)
@@ -0,0 +1,104 @@
+# backend/menu_endpoint.py
+"""Отдача меню в Web App с версией, сжатием и кэшированием
+
+Для каждого снимка меню один раз собирается минифицированный JSON, его хэш
+(версия и ETag) и сжатые варианты: gzip всегда, brotli - если установлен
+пакет brotli. Версия попадает в URL Web App, и клиент запрашивает
+menu.json?v=<версия>: такой ответ кэшируется навсегда, а после правки меню
+у URL меняется версия. Запрос без версии (или со старой) всегда
+перепроверяется по ETag.
+"""
+import gzip
+import hashlib
+import json
+from typing import Dict, Optional, Tuple
+
+from http_server import Response
+from menu import MenuCatalog, MenuSnapshot
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+
+class PublishedMenu:
+    """Готовые к отдаче тела меню одной версии: кодировка -> байты"""
+
+    __slots__ = ('version', 'bodies')
+
+    def __init__(self, snapshot: MenuSnapshot):
+        payload = json.dumps(snapshot.data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.version = hashlib.sha256(payload).hexdigest()[:16]
+        self.bodies: Dict[str, bytes] = {'identity': payload}
+        # mtime=0: одинаковое меню всегда сжимается в одинаковые байты
+        self.bodies['gzip'] = gzip.compress(payload, compresslevel=9, mtime=0)
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(payload, quality=11)
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.version}"' if encoding == 'identity' else f'"{self.version}-{encoding}"'
+
+
+def choose_encoding(accept_encoding: str, available) -> str:
+    """Лучшая кодировка из Accept-Encoding, которую мы можем отдать"""
+    accepted = set()
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        params = params.strip().replace(' ', '')
+        try:
+            quality = float(params[2:]) if params.startswith('q=') else 1.0
+        except ValueError:
+            quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    for encoding in ('br', 'gzip'):
+        if encoding in available and (encoding in accepted or '*' in accepted):
+            return encoding
+    return 'identity'
+
+
+class MenuEndpoint:
+    """Обработчик GET /menu.json для HTTPServer"""
+
+    def __init__(self, catalog: MenuCatalog):
+        self.catalog = catalog
+        self._published: Optional[Tuple[MenuSnapshot, PublishedMenu]] = None
+
+    @property
+    def published(self) -> PublishedMenu:
+        """Меню текущей версии; пересобирается только после перезагрузки menu.json"""
+        self.catalog.maybe_reload()
+        snapshot = self.catalog.snapshot
+        if self._published is None or self._published[0] is not snapshot:
+            self._published = (snapshot, PublishedMenu(snapshot))
+        return self._published[1]
+
+    @property
+    def version(self) -> str:
+        return self.published.version
+
+    async def http_handler(self, headers: Dict[str, str], query: Dict[str, str]) -> Response:
+        menu = self.published
+        encoding = choose_encoding(headers.get('accept-encoding', ''), menu.bodies)
+        etag = menu.etag(encoding)
+        response_headers = {
+            'Content-Type': 'application/json; charset=utf-8',
+            'ETag': etag,
+            # Адрес с актуальной версией не меняется никогда, остальные - перепроверяются
+            'Cache-Control': IMMUTABLE_CACHE if query.get('v') == menu.version else REVALIDATE_CACHE,
+            'Vary': 'Accept-Encoding',
+            # Web App открывается с другого адреса, чем этот эндпоинт
+            'Access-Control-Allow-Origin': '*',
+        }
+        if encoding != 'identity':
+            response_headers['Content-Encoding'] = encoding
+
+        if_none_match = headers.get('if-none-match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in
+                              (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))):
+            return 304, response_headers, b''
+        return 200, response_headers, menu.bodies[encoding]
@@ -0,0 +1,165 @@
+# backend/metrics.py
+import functools
+import inspect
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами в формате Prometheus"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля сверху: граница корзины, в которую он попадает"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """Реестр метрик: гистограммы задержек, счетчики ошибок и датчики очередей
+
+    При enabled=False instrument() ничего не оборачивает, так что выключенный
+    сбор метрик не стоит ничего.
+    """
+
+    def __init__(self, enabled: bool = True, slow_threshold: float = 0.1, prefix: str = 'coffee'):
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self.prefix = prefix
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.counters: Dict[Tuple[str, str], int] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+
+    def inc(self, family: str, name: str, amount: int = 1):
+        if self.enabled:
+            key = (family, name)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name: str, func: Callable[[], float]):
+        """Зарегистрировать датчик, значение которого читается при выгрузке"""
+        if self.enabled:
+            self.gauges[name] = func
+
+    def _timed(self, kind: str, name: str, func: Callable, slow_log: bool) -> Callable:
+        histogram = self.histograms.setdefault((kind, name), Histogram())
+        threshold = self.slow_threshold
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                self.inc(f'{kind}_errors', name)
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                histogram.observe(elapsed)
+                if slow_log and elapsed >= threshold:
+                    logger.warning(f"Slow {kind} {name}: {elapsed * 1000:.1f} ms")
+
+        return wrapper
+
+    def wrap(self, kind: str, func: Callable, slow_log: bool = False) -> Callable:
+        """Обернуть одну корутину замером задержки под ее именем"""
+        if not self.enabled:
+            return func
+        return self._timed(kind, func.__name__, func, slow_log)
+
+    def instrument(self, obj, kind: str, names: Optional[Iterable[str]] = None,
+                   slow_log: bool = False, exclude: Iterable[str] = ()):
+        """Обернуть асинхронные методы объекта замером задержки
+
+        Без names оборачиваются все публичные корутины класса.
+        """
+        if not self.enabled:
+            return
+
+        if names is None:
+            names = [
+                name for name, member in inspect.getmembers(type(obj), inspect.iscoroutinefunction)
+                if not name.startswith('_')
+            ]
+        for name in names:
+            if name not in exclude:
+                setattr(obj, name, self._timed(kind, name, getattr(obj, name), slow_log))
+
+    def render_prometheus(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines: List[str] = []
+        seen_families = set()
+
+        for (kind, name), histogram in sorted(self.histograms.items()):
+            family = f'{self.prefix}_{kind}_latency_seconds'
+            if family not in seen_families:
+                seen_families.add(family)
+                lines.append(f'# TYPE {family} histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{family}_bucket{{name="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{family}_bucket{{name="{name}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{family}_sum{{name="{name}"}} {histogram.sum}')
+            lines.append(f'{family}_count{{name="{name}"}} {histogram.count}')
+
+        for (kind, name), value in sorted(self.counters.items()):
+            family = f'{self.prefix}_{kind}_total'
+            if family not in seen_families:
+                seen_families.add(family)
+                lines.append(f'# TYPE {family} counter')
+            lines.append(f'{family}{{name="{name}"}} {value}')
+
+        for name, func in sorted(self.gauges.items()):
+            family = f'{self.prefix}_{name}'
+            lines.append(f'# TYPE {family} gauge')
+            lines.append(f'{family} {func()}')
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """Короткая сводка для команды /metrics"""
+        lines = []
+        for (kind, name), histogram in sorted(self.histograms.items()):
+            if not histogram.count:
+                continue
+            average = histogram.sum / histogram.count * 1000
+            p95 = histogram.quantile(0.95) * 1000
+            errors = self.counters.get((f'{kind}_errors', name), 0)
+            lines.append(f"{kind}.{name}: n={histogram.count} avg={average:.1f}ms "
+                         f"p95≤{p95:.1f}ms err={errors}")
+        for (kind, name), value in sorted(self.counters.items()):
+            # Ошибки уже показаны рядом с задержками
+            if not kind.endswith('_errors'):
+                lines.append(f"{kind}.{name}: {value}")
+        for name, func in sorted(self.gauges.items()):
+            lines.append(f"{name}: {func()}")
+        return '\n'.join(lines) or 'Нет данных'
+
+    async def http_handler(self, headers: Dict[str, str], query: Dict[str, str]):
+        """Обработчик GET /metrics для HTTPServer"""
+        body = self.render_prometheus().encode()
+        return 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}, body
@@ -0,0 +1,431 @@
+# backend/migrations.py
+"""Версионированные миграции схемы
+
+Каждая миграция - асинхронная функция с номером версии, зарегистрированная
+декоратором migration. Примененные версии записываются в schema_version
+вместе с длительностью, поэтому при старте выполняются только новые шаги,
+а стоимость каждого видна в логе и в самой таблице. Шаги идемпотентны:
+база, созданная до появления schema_version, проходит их все без ошибок.
+
+Обычная миграция выполняется в одной транзакции вместе с записью версии.
+Миграции с transaction=False (переносы данных пачками) сами
+коммитят свою работу и должны уметь продолжить ее после сбоя.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Tuple
+from zoneinfo import ZoneInfo
+
+import aiosqlite
+
+from config import MIGRATION_BATCH_SIZE, SHOP_TIMEZONE
+from loyalty import LOYALTY_TRIGGERS
+from order_board import OPEN_STATUSES
+from rollups import ROLLUP_REBUILD, ROLLUP_SCHEMA
+from scheduler import parse_scheduled_time
+from search import SEARCH_TRIGGERS, register_search_functions, search_rebuild, search_schema
+
+logger = logging.getLogger(__name__)
+
+# Условие открытых заказов; частичный индекс idx_orders_open построен с тем же условием
+OPEN_ORDERS_WHERE = f"status IN ({', '.join(repr(status) for status in OPEN_STATUSES)})"
+
+Step = Callable[[aiosqlite.Connection, int], Awaitable[None]]
+
+# (версия, название, шаг, в одной транзакции)
+MIGRATIONS: List[Tuple[int, str, Step, bool]] = []
+
+
+def migration(version: int, name: str, transaction: bool = True):
+    """Зарегистрировать шаг миграции; версии должны идти по возрастанию"""
+    def register(step: Step) -> Step:
+        if MIGRATIONS and MIGRATIONS[-1][0] >= version:
+            raise ValueError(f"Migration {version} is out of order")
+        MIGRATIONS.append((version, name, step, transaction))
+        return step
+    return register
+
+
+async def migrate(db: aiosqlite.Connection, batch_size: int = MIGRATION_BATCH_SIZE) -> List[Tuple[int, str, float]]:
+    """Применить недостающие миграции; возвращает (версия, название, секунды) примененных"""
+    await db.execute('''
+                     CREATE TABLE IF NOT EXISTS schema_version
+                     (
+                         version INTEGER PRIMARY KEY,
+                         name TEXT NOT NULL,
+                         duration_ms REAL,
+                         applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                     )
+                     ''')
+    await db.commit()
+
+    cursor = await db.execute('SELECT version FROM schema_version')
+    applied = {row[0] for row in await cursor.fetchall()}
+
+    report = []
+    for version, name, step, transaction in MIGRATIONS:
+        if version in applied:
+            continue
+
+        start = time.perf_counter()
+        if transaction:
+            # IMMEDIATE: второй процесс, стартующий одновременно, дождется этой миграции
+            await db.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = await db.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,))
+                if await cursor.fetchone():
+                    await db.rollback()
+                    continue
+                await step(db, batch_size)
+                await _record(db, version, name, start)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        else:
+            await step(db, batch_size)
+            await _record(db, version, name, start)
+            await db.commit()
+
+        elapsed = time.perf_counter() - start
+        report.append((version, name, elapsed))
+        logger.info(f"Migration {version} ({name}) applied in {elapsed * 1000:.1f} ms")
+
+    if report:
+        logger.info(f"Schema migrated to version {MIGRATIONS[-1][0]}: {len(report)} migrations "
+                    f"in {sum(elapsed for _, _, elapsed in report) * 1000:.1f} ms")
+    return report
+
+
+async def _record(db: aiosqlite.Connection, version: int, name: str, start: float):
+    await db.execute(
+        'INSERT OR IGNORE INTO schema_version (version, name, duration_ms) VALUES (?, ?, ?)',
+        (version, name, (time.perf_counter() - start) * 1000)
+    )
+
+
+async def _column_exists(db: aiosqlite.Connection, schema: str, table: str, column: str) -> bool:
+    cursor = await db.execute(f'PRAGMA {schema}.table_info({table})')
+    return any(row[1] == column for row in await cursor.fetchall())
+
+
+@migration(1, 'initial schema')
+async def initial_schema(db: aiosqlite.Connection, batch_size: int):
+    await db.execute('''
+                     CREATE TABLE IF NOT EXISTS users
+                     (
+                         user_id INTEGER PRIMARY KEY,
+                         username TEXT,
+                         first_name TEXT,
+                         last_name TEXT,
+                         name TEXT,
+                         phone TEXT,
+                         address TEXT,
+                         bonus_points INTEGER DEFAULT 0,
+                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                     )
+                     ''')
+    # items - устаревшее JSON-поле, позиции хранятся в order_items
+    await db.execute('''
+                     CREATE TABLE IF NOT EXISTS orders
+                     (
+                         id INTEGER PRIMARY KEY AUTOINCREMENT,
+                         user_id INTEGER,
+                         items TEXT,
+                         total_amount REAL,
+                         status TEXT DEFAULT 'new',
+                         delivery_type TEXT,
+                         scheduled_time TEXT,
+                         address TEXT,
+                         notes TEXT,
+                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                         FOREIGN KEY (user_id) REFERENCES users (user_id)
+                     )
+                     ''')
+    await db.execute('''
+                     CREATE INDEX IF NOT EXISTS idx_orders_created
+                         ON orders (created_at)
+                     ''')
+
+    # Исходящие уведомления клиентам, отправляются фоновым воркером
+    await db.execute('''
+                     CREATE TABLE IF NOT EXISTS outbox
+                     (
+                         id INTEGER PRIMARY KEY AUTOINCREMENT,
+                         chat_id INTEGER NOT NULL,
+                         text TEXT NOT NULL,
+                         dedup_key TEXT UNIQUE,
+                         status TEXT DEFAULT 'pending',
+                         attempts INTEGER DEFAULT 0,
+                         next_attempt_at REAL DEFAULT 0,
+                         last_error TEXT,
+                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                         sent_at TIMESTAMP
+                     )
+                     ''')
+    await db.execute('''
+                     CREATE INDEX IF NOT EXISTS idx_outbox_pending
+                         ON outbox (next_attempt_at) WHERE status = 'pending'
+                     ''')
+
+    # Позиции заказов (нормализованная замена JSON-поля orders.items)
+    await db.execute('''
+                     CREATE TABLE IF NOT EXISTS order_items
+                     (
+                         order_id INTEGER NOT NULL REFERENCES orders (id),
+                         position INTEGER NOT NULL,
+                         menu_item_id INTEGER,
+                         name TEXT,
+                         quantity INTEGER NOT NULL DEFAULT 1,
+                         unit_price REAL,
+                         options TEXT,
+                         PRIMARY KEY (order_id, position)
+                     ) WITHOUT ROWID
+                     ''')
+    await db.execute('''
+                     CREATE INDEX IF NOT EXISTS idx_order_items_menu_item
+                         ON order_items (menu_item_id)
+                     ''')
+
+
+@migration(2, 'order items from legacy json', transaction=False)
+async def backfill_order_items(db: aiosqlite.Connection, batch_size: int):
+    """Перенести позиции из JSON-поля orders.items пачками
+
+    Само поле остается как есть до отдельной миграции очистки: по нему можно
+    сверить перенос и, если понадобится, повторить его. После сбоя перенос
+    продолжается с последнего перенесенного заказа; повтор пачки безвреден
+    благодаря INSERT OR IGNORE.
+    """
+    cursor = await db.execute('SELECT COALESCE(MAX(order_id), 0) FROM order_items')
+    last_id = (await cursor.fetchone())[0]
+    while True:
+        cursor = await db.execute(
+            'SELECT id FROM orders WHERE id > ? AND items IS NOT NULL ORDER BY id LIMIT ?',
+            (last_id, batch_size)
+        )
+        order_ids = tuple(row[0] for row in await cursor.fetchall())
+        if not order_ids:
+            return
+        last_id = order_ids[-1]
+
+        ids = ', '.join('?' * len(order_ids))
+        await db.execute(
+            f'''INSERT OR IGNORE INTO order_items
+                    (order_id, position, menu_item_id, name, quantity, unit_price, options)
+                SELECT o.id, j.key, json_extract(j.value, '$.id'), json_extract(j.value, '$.name'),
+                       COALESCE(json_extract(j.value, '$.quantity'), 1),
+                       json_extract(j.value, '$.price'), json_extract(j.value, '$.options')
+                FROM orders o, json_each(o.items) j
+                WHERE o.id IN ({ids}) AND json_valid(o.items)''',
+            order_ids
+        )
+        # Заказы с невалидным JSON пропускаются, их позиции восстановить нельзя
+        await db.commit()
+        await asyncio.sleep(0)
+
+
+@migration(3, 'order history paging index')
+async def history_paging_index(db: aiosqlite.Connection, batch_size: int):
+    await db.execute('''
+                     CREATE INDEX IF NOT EXISTS idx_orders_user_created
+                         ON orders (user_id, created_at DESC, id DESC)
+                     ''')
+
+
+@migration(4, 'archive tables')
+async def archive_tables(db: aiosqlite.Connection, batch_size: int):
+    # Архив завершенных заказов: те же колонки и позиции, плюс время переноса
+    await db.execute('''
+                     CREATE TABLE IF NOT EXISTS archive.orders
+                     (
+                         id INTEGER PRIMARY KEY,
+                         user_id INTEGER,
+                         total_amount REAL,
+                         status TEXT,
+                         delivery_type TEXT,
+                         scheduled_time TEXT,
+                         address TEXT,
+                         notes TEXT,
+                         created_at TIMESTAMP,
+                         archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                     )
+                     ''')
+    await db.execute('''
+                     CREATE INDEX IF NOT EXISTS archive.idx_archive_orders_user_created
+                         ON orders (user_id, created_at DESC, id DESC)
+                     ''')
+    await db.execute('''
+                     CREATE INDEX IF NOT EXISTS archive.idx_archive_orders_created
+                         ON orders (created_at)
+                     ''')
+    await db.execute('''
+                     CREATE TABLE IF NOT EXISTS archive.order_items
+                     (
+                         order_id INTEGER NOT NULL,
+                         position INTEGER NOT NULL,
+                         menu_item_id INTEGER,
+                         name TEXT,
+                         quantity INTEGER NOT NULL DEFAULT 1,
+                         unit_price REAL,
+                         options TEXT,
+                         PRIMARY KEY (order_id, position)
+                     ) WITHOUT ROWID
+                     ''')
+
+
+@migration(5, 'scheduled_at column')
+async def scheduled_at_column(db: aiosqlite.Connection, batch_size: int):
+    # Время заказа ко времени в Unix-времени (UTC), разобранное из текста scheduled_time
+    for schema in ('main', 'archive'):
+        if not await _column_exists(db, schema, 'orders', 'scheduled_at'):
+            await db.execute(f'ALTER TABLE {schema}.orders ADD COLUMN scheduled_at REAL')
+    # Заказы ко времени, которые ждут начала приготовления; по нему строится куча планировщика
+    await db.execute('''
+                     CREATE INDEX IF NOT EXISTS idx_orders_scheduled
+                         ON orders (scheduled_at) WHERE status = 'new' AND scheduled_at IS NOT NULL
+                     ''')
+
+
+@migration(6, 'scheduled_at backfill', transaction=False)
+async def backfill_scheduled_at(db: aiosqlite.Connection, batch_size: int):
+    """Заполнить scheduled_at у существующих заказов; относительное время - от created_at"""
+    tz = ZoneInfo(SHOP_TIMEZONE)
+    for schema in ('main', 'archive'):
+        last_id = 0
+        while True:
+            cursor = await db.execute(
+                f'''SELECT id, scheduled_time, created_at FROM {schema}.orders
+                    WHERE id > ? AND scheduled_at IS NULL AND scheduled_time IS NOT NULL
+                    ORDER BY id LIMIT ?''',
+                (last_id, batch_size)
+            )
+            rows = await cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            updates = []
+            for order_id, scheduled_time, created_at in rows:
+                created = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+                scheduled_at = parse_scheduled_time(scheduled_time, created, tz)
+                if scheduled_at is not None:
+                    updates.append((scheduled_at, order_id))
+            await db.executemany(f'UPDATE {schema}.orders SET scheduled_at = ? WHERE id = ?', updates)
+            await db.commit()
+            await asyncio.sleep(0)
+
+
+@migration(7, 'open orders index')
+async def open_orders_index(db: aiosqlite.Connection, batch_size: int):
+    # Частичный индекс только по открытым заказам: доска кухни читает его при старте
+    await db.execute(f'''
+                     CREATE INDEX IF NOT EXISTS idx_orders_open
+                         ON orders (created_at, id) WHERE {OPEN_ORDERS_WHERE}
+                     ''')
+
+
+@migration(8, 'order status history')
+async def order_status_history(db: aiosqlite.Connection, batch_size: int):
+    # Переходы ациклические, поэтому в каждый статус заказ попадает не больше одного раза;
+    # строки пишут триггеры, так что прежний статус фиксируется в той же операции, что и смена
+    for schema in ('main', 'archive'):
+        await db.execute(f'''
+                         CREATE TABLE IF NOT EXISTS {schema}.order_status_history
+                         (
+                             order_id INTEGER NOT NULL,
+                             to_status TEXT NOT NULL,
+                             from_status TEXT,
+                             changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                             PRIMARY KEY (order_id, to_status)
+                         ) WITHOUT ROWID
+                         ''')
+    await db.execute('''
+                     CREATE TRIGGER IF NOT EXISTS trg_order_status_history_insert AFTER INSERT ON orders
+                     BEGIN
+                         INSERT OR REPLACE INTO order_status_history (order_id, to_status, from_status)
+                         VALUES (NEW.id, NEW.status, NULL);
+                     END
+                     ''')
+    await db.execute('''
+                     CREATE TRIGGER IF NOT EXISTS trg_order_status_history_update AFTER UPDATE OF status ON orders
+                     WHEN OLD.status IS NOT NEW.status
+                     BEGIN
+                         INSERT OR REPLACE INTO order_status_history (order_id, to_status, from_status)
+                         VALUES (NEW.id, NEW.status, OLD.status);
+                     END
+                     ''')
+
+
+@migration(9, 'sales rollups')
+async def sales_rollups(db: aiosqlite.Connection, batch_size: int):
+    # При первом создании агрегаты заполняются по уже накопленным заказам
+    cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sales_status'")
+    rollups_exist = await cursor.fetchone()
+    for statement in ROLLUP_SCHEMA:
+        await db.execute(statement)
+    if not rollups_exist:
+        for statement in ROLLUP_REBUILD:
+            await db.execute(statement)
+
+
+@migration(10, 'incremental auto_vacuum')
+async def incremental_auto_vacuum(db: aiosqlite.Connection, batch_size: int):
+    """Существующую базу в режим incremental переводит только полный VACUUM
+
+    Он переписывает весь файл и на это время блокирует запись, поэтому при
+    старте не выполняется: администратор запускает его командой /vacuum
+    (Database.vacuum) в удобное время.
+    """
+    cursor = await db.execute('PRAGMA main.auto_vacuum')
+    if (await cursor.fetchone())[0] != 2:
+        logger.warning("Database is not in incremental auto_vacuum mode, "
+                       "archived orders will not shrink the file until /vacuum is run")
+
+
+@migration(11, 'order search index')
+async def order_search_index(db: aiosqlite.Connection, batch_size: int):
+    # Индекс создается и заполняется в одной транзакции, поэтому заказ не может в нем потеряться
+    await register_search_functions(db, ZoneInfo(SHOP_TIMEZONE))
+    for schema in ('main', 'archive'):
+        cursor = await db.execute(
+            f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = 'order_search'")
+        index_exists = await cursor.fetchone()
+        await db.execute(search_schema(schema))
+        if not index_exists:
+            await db.execute(search_rebuild(schema))
+    for statement in SEARCH_TRIGGERS:
+        await db.execute(statement)
+
+
+@migration(12, 'loyalty points')
+async def loyalty_points(db: aiosqlite.Connection, batch_size: int):
+    # Сколько баллов заказ списал и начислил: по ним отмена возвращает баланс клиента
+    for schema in ('main', 'archive'):
+        for column in ('points_redeemed', 'points_earned'):
+            if not await _column_exists(db, schema, 'orders', column):
+                await db.execute(f'ALTER TABLE {schema}.orders ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0')
+    for statement in LOYALTY_TRIGGERS:
+        await db.execute(statement)
+
+
+@migration(13, 'legacy items in archive')
+async def archive_legacy_items(db: aiosqlite.Connection, batch_size: int):
+    # Устаревшее JSON-поле переносится в архив вместе с заказом, пока его не удалит миграция очистки
+    if not await _column_exists(db, 'archive', 'orders', 'items'):
+        await db.execute('ALTER TABLE archive.orders ADD COLUMN items TEXT')
+
+
+@migration(14, 'search by local scheduled time')
+async def search_scheduled_time(db: aiosqlite.Connection, batch_size: int):
+    # Строки, записанные до scheduled_text, содержат время только в виде текста клиента
+    await register_search_functions(db, ZoneInfo(SHOP_TIMEZONE))
+    for schema in ('main', 'archive'):
+        await db.execute(f'''
+            UPDATE {schema}.order_search
+            SET scheduled_time = (SELECT scheduled_text(o.scheduled_time, o.scheduled_at)
+                                  FROM {schema}.orders o WHERE o.id = order_search.rowid)
+            WHERE rowid IN (SELECT id FROM {schema}.orders WHERE scheduled_at IS NOT NULL)
+        ''')
@@ -0,0 +1,124 @@
+# backend/notifier.py
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Dict, Iterable, Optional, Set
+
+from telegram import Bot
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram Bot API: ~30 сообщений в секунду всего и ~1 в секунду в один чат
+GLOBAL_RATE = 30.0
+PER_CHAT_RATE = 1.0
+MAX_RETRIES = 3
+
+
+class TokenBucket:
+    """Token bucket: не больше rate событий в секунду с запасом capacity"""
+
+    def __init__(self, rate: float, capacity: float = 1.0, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Занять токен и вернуть, сколько секунд нужно подождать до его появления"""
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def try_acquire(self) -> bool:
+        """Занять токен, только если он есть прямо сейчас"""
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def is_idle(self) -> bool:
+        """Ведро полное - значит давно не использовалось"""
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class NotificationDispatcher:
+    """Отправка уведомлений в фоне с учетом лимитов Telegram"""
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, per_chat_rate: float = PER_CHAT_RATE,
+                 max_concurrency: int = 16, max_chat_buckets: int = 10000):
+        self.bot: Optional[Bot] = None
+        self.per_chat_rate = per_chat_rate
+        self.max_chat_buckets = max_chat_buckets
+        self._global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending: Set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        """Количество уведомлений в процессе отправки"""
+        return len(self._pending)
+
+    def start(self, bot: Bot):
+        """Привязать диспетчер к боту приложения"""
+        self.bot = bot
+
+    async def stop(self):
+        """Дождаться отправки всех поставленных уведомлений"""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_chat_buckets:
+                # Выбрасываем простаивающие ведра, чтобы таблица не росла бесконечно
+                for idle_id in [cid for cid, b in self._chat_buckets.items() if b.is_idle()]:
+                    del self._chat_buckets[idle_id]
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate)
+        return bucket
+
+    async def send(self, chat_id: int, text: str, **kwargs):
+        """Отправить одно сообщение, соблюдая лимиты чата и общий лимит"""
+        await self._chat_bucket(chat_id).acquire()
+        async with self._semaphore:
+            for attempt in range(MAX_RETRIES):
+                await self._global_bucket.acquire()
+                try:
+                    return await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                except RetryAfter as e:
+                    delay = e.retry_after
+                    if isinstance(delay, timedelta):
+                        delay = delay.total_seconds()
+                    logger.warning(f"Flood control for chat {chat_id}, retry in {delay}s")
+                    if attempt == MAX_RETRIES - 1:
+                        raise
+                    await asyncio.sleep(delay)
+
+    async def _send_logged(self, chat_id: int, text: str, **kwargs):
+        try:
+            await self.send(chat_id, text, **kwargs)
+        except Exception as e:
+            logger.error(f"Error sending to {chat_id}: {e}")
+
+    def broadcast(self, chat_ids: Iterable[int], text: str, **kwargs):
+        """Разослать одно и то же сообщение в несколько чатов, не дожидаясь отправки"""
+        for chat_id in chat_ids:
+            task = asyncio.create_task(self._send_logged(chat_id, text, **kwargs))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
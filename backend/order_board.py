@@ -0,0 +1,92 @@
+# backend/order_board.py
+import calendar
+import time
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+# Статусы заказов, которые еще в работе у кухни
+OPEN_STATUSES = ('new', 'preparing', 'ready')
+
+# Допустимые переходы статусов; из выполненного и отмененного заказа переходов нет
+STATUS_TRANSITIONS: Dict[str, Tuple[str, ...]] = {
+    'new': ('preparing', 'ready', 'completed', 'cancelled'),
+    'preparing': ('ready', 'completed', 'cancelled'),
+    'ready': ('completed', 'cancelled'),
+    'completed': (),
+    'cancelled': (),
+}
+
+# Обратная таблица: из каких статусов можно попасть в данный
+STATUS_SOURCES: Dict[str, Tuple[str, ...]] = {
+    status: tuple(source for source, targets in STATUS_TRANSITIONS.items() if status in targets)
+    for status in STATUS_TRANSITIONS
+}
+
+
+class ActiveOrderBoard:
+    """Доска активных заказов в памяти процесса
+
+    Хранит только открытые заказы, отсортированные по времени, к которому
+    заказ нужен: по scheduled_at для заказов ко времени, иначе по created_at.
+    Выполненные и отмененные сразу удаляются, поэтому доска остается маленькой.
+    """
+
+    def __init__(self):
+        self._orders: Dict[int, Dict] = {}
+        self._keys: List[Tuple[float, int]] = []
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self._orders
+
+    @staticmethod
+    def _key(order: Dict) -> Tuple[float, int]:
+        due = order.get('scheduled_at')
+        if due is None:
+            due = calendar.timegm(time.strptime(order['created_at'], '%Y-%m-%d %H:%M:%S'))
+        return due, order['id']
+
+    def load(self, orders: List[Dict]):
+        """Заполнить доску заново (при старте)"""
+        self._orders = {order['id']: order for order in orders if order['status'] in OPEN_STATUSES}
+        self._keys = sorted(self._key(order) for order in self._orders.values())
+
+    def add(self, order: Dict):
+        if order['status'] not in OPEN_STATUSES:
+            return
+        self.remove(order['id'])
+        self._orders[order['id']] = order
+        insort(self._keys, self._key(order))
+
+    def remove(self, order_id: int) -> Optional[Dict]:
+        order = self._orders.pop(order_id, None)
+        if order is not None:
+            index = bisect_left(self._keys, self._key(order))
+            del self._keys[index]
+        return order
+
+    def set_status(self, order_id: int, status: str) -> bool:
+        """Обновить статус; завершенный заказ убирается с доски. False - заказа нет на доске"""
+        order = self._orders.get(order_id)
+        if order is None:
+            return False
+        if status in OPEN_STATUSES:
+            order['status'] = status
+        else:
+            self.remove(order_id)
+        return True
+
+    def orders(self, status: Optional[str] = None) -> List[Dict]:
+        """Открытые заказы по порядку, опционально только с указанным статусом"""
+        result = [self._orders[order_id] for _, order_id in self._keys]
+        if status is not None:
+            result = [order for order in result if order['status'] == status]
+        return result
+
+    def counts(self) -> Dict[str, int]:
+        counts = {status: 0 for status in OPEN_STATUSES}
+        for order in self._orders.values():
+            counts[order['status']] += 1
+        return counts
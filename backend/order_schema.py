@@ -0,0 +1,190 @@
+# backend/order_schema.py
+"""Типизированный заказ из Web App
+
+decode_order за один проход разбирает JSON, проверяет поля и позиции по
+снимку меню и пересчитывает цены. Результат - записи со слотами (доступ и
+как к атрибутам, и как к словарю) и готовый JSON позиций для
+ORDER_ITEMS_INSERT. Название и цена берутся из меню, поэтому их JSON
+собирается один раз на снимок меню, как и JSON каждой проверенной
+комбинации опций: позиции заказа склеиваются из готовых кусков без
+json.dumps. Ошибка указывает на конкретное поле: items[2].quantity.
+"""
+import json
+from typing import Dict, List, Optional, Tuple
+
+from menu import MAX_QUANTITY, MenuSnapshot, MenuValidationError
+from records import Record
+
+# Тип получения -> подпись для администратора
+DELIVERY_TYPES = {
+    'pickup': 'С собой',
+    'takeaway': 'С собой',
+    'dine_in': 'На месте',
+}
+DEFAULT_DELIVERY_TYPE = 'pickup'
+
+MAX_LINES = 50
+MAX_TEXT_LENGTH = 500
+
+
+class OrderPayloadError(MenuValidationError):
+    """Заказ из Web App не прошел проверку; path - поле, в котором ошибка"""
+
+    def __init__(self, path: str, message: str):
+        super().__init__(f"{path}: {message}")
+        self.path = path
+
+
+class OrderLine(Record):
+    """Позиция заказа с названием и ценой из меню"""
+
+    __slots__ = ('id', 'name', 'price', 'quantity', 'options')
+    FIELDS = __slots__
+
+    def __init__(self, item_id: int, name: str, price: float, quantity: int, options: Dict[str, str]):
+        self.id = item_id
+        self.name = name
+        self.price = price
+        self.quantity = quantity
+        self.options = options
+
+
+class OrderPayload(Record):
+    """Проверенный заказ; total посчитан по меню, а не взят у клиента
+
+    redeem_points - сколько баллов клиент готов списать; сколько спишется на
+    самом деле, решает правило loyalty по балансу в транзакции заказа.
+    """
+
+    __slots__ = ('line_items', 'total', 'delivery_type', 'scheduled_time', 'address', 'notes', 'redeem_points',
+                 'items_json')
+    FIELDS = ('items', 'total', 'delivery_type', 'scheduled_time', 'address', 'notes', 'redeem_points')
+    ALIASES = {'items': 'line_items'}
+
+    def __init__(self, line_items: List[OrderLine], items_json: str, total: float, delivery_type: str,
+                 scheduled_time: Optional[str], address: Optional[str], notes: str, redeem_points: int = 0):
+        self.line_items = line_items
+        # Позиции в формате хранения, см. encode_lines
+        self.items_json = items_json
+        self.total = total
+        self.delivery_type = delivery_type
+        self.scheduled_time = scheduled_time
+        self.address = address
+        self.notes = notes
+        self.redeem_points = redeem_points
+
+
+def encode_lines(items) -> str:
+    """Позиции в формате хранения: [[id, название, цена, количество, опции], ...]"""
+    return json.dumps(
+        [[item.get('id'), item.get('name'), item.get('price'), item.get('quantity', 1), item.get('options')]
+         for item in items],
+        ensure_ascii=False, separators=(',', ':')
+    )
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _fragments(snapshot: MenuSnapshot) -> Tuple[Dict[int, str], Dict[Tuple, str]]:
+    """Готовые куски JSON для снимка меню: начало позиции по id и опции по их набору"""
+    fragments = snapshot.derived.get('order_lines')
+    if fragments is None:
+        prefixes = {
+            item_id: f"[{item_id},{_dumps(item['name'])},{_dumps(item['price'])},"
+            for item_id, item in snapshot.items.items()
+        }
+        # Комбинаций опций в меню конечное число, а в кэш попадают только проверенные
+        fragments = snapshot.derived['order_lines'] = (prefixes, {})
+    return fragments
+
+
+def _text(data: Dict, field: str, default: Optional[str]) -> Optional[str]:
+    value = data.get(field)
+    if value is None:
+        return default
+    if type(value) is not str:
+        raise OrderPayloadError(field, "ожидается строка")
+    if len(value) > MAX_TEXT_LENGTH:
+        raise OrderPayloadError(field, f"длиннее {MAX_TEXT_LENGTH} символов")
+    return value
+
+
+def decode_order(raw: str, snapshot: MenuSnapshot) -> OrderPayload:
+    """Разобрать и проверить заказ из web_app_data.data по снимку меню"""
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        raise OrderPayloadError('payload', "некорректный JSON") from None
+    if type(data) is not dict:
+        raise OrderPayloadError('payload', "ожидается объект")
+
+    raw_items = data.get('items')
+    if type(raw_items) is not list or not raw_items:
+        raise OrderPayloadError('items', "заказ пуст")
+    if len(raw_items) > MAX_LINES:
+        raise OrderPayloadError('items', f"больше {MAX_LINES} позиций")
+
+    menu_items = snapshot.items
+    menu_options = snapshot.options
+    prefixes, encoded_options = _fragments(snapshot)
+    lines = []
+    parts = []
+    total = 0
+    for index, raw_item in enumerate(raw_items):
+        if type(raw_item) is not dict:
+            raise OrderPayloadError(f'items[{index}]', "ожидается объект")
+
+        item_id = raw_item.get('id')
+        # bool - подкласс int, поэтому сравнение типа, а не isinstance
+        item = menu_items.get(item_id) if type(item_id) is int else None
+        if item is None:
+            raise OrderPayloadError(f'items[{index}].id', f"позиции {item_id!r} нет в меню")
+
+        quantity = raw_item.get('quantity')
+        if type(quantity) is not int or not 1 <= quantity <= MAX_QUANTITY:
+            raise OrderPayloadError(f'items[{index}].quantity', f"ожидается целое от 1 до {MAX_QUANTITY}")
+
+        options = raw_item.get('options')
+        if options is None:
+            options = {}
+        elif type(options) is not dict:
+            raise OrderPayloadError(f'items[{index}].options', "ожидается объект")
+        allowed = menu_options[item['id']]
+        for name, choice in options.items():
+            choices = allowed.get(name)
+            if choices is None:
+                raise OrderPayloadError(f'items[{index}].options', f"у «{item['name']}» нет опции {name}")
+            if type(choice) is not str or choice not in choices:
+                raise OrderPayloadError(f'items[{index}].options.{name}', f"недопустимое значение {choice!r}")
+
+        options_key = (item_id, *options.items())
+        options_json = encoded_options.get(options_key) if options else '{}'
+        if options_json is None:
+            options_json = encoded_options[options_key] = _dumps(options)
+
+        lines.append(OrderLine(item_id, item['name'], item['price'], quantity, options))
+        parts.append(f"{prefixes[item_id]}{quantity},{options_json}]")
+        total += item['price'] * quantity
+
+    delivery_type = _text(data, 'delivery_type', DEFAULT_DELIVERY_TYPE)
+    if delivery_type not in DELIVERY_TYPES:
+        raise OrderPayloadError('delivery_type', f"неизвестный тип {delivery_type!r}")
+
+    redeem_points = data.get('redeem_points')
+    if redeem_points is None:
+        redeem_points = 0
+    elif type(redeem_points) is not int or redeem_points < 0:
+        raise OrderPayloadError('redeem_points', "ожидается неотрицательное целое")
+
+    return OrderPayload(
+        lines,
+        f"[{','.join(parts)}]",
+        total,
+        delivery_type,
+        _text(data, 'scheduled_time', None),
+        _text(data, 'address', None),
+        _text(data, 'notes', ''),
+        redeem_points
+    )
@@ -0,0 +1,135 @@
+# backend/outbox.py
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from telegram.error import BadRequest, Forbidden
+
+from config import OUTBOX_RETENTION_DAYS
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, при которых повторять отправку бессмысленно (бот заблокирован, чат не найден)
+PERMANENT_ERRORS = (Forbidden, BadRequest)
+
+
+class OutboxWorker:
+    """Фоновая отправка уведомлений из таблицы outbox с повторами
+
+    Раз в prune_interval секунд воркер удаляет отправленные и брошенные
+    записи старше retention секунд. Пока запись хранится, ее dedup_key
+    не дает отправить то же уведомление повторно.
+    """
+
+    def __init__(self, db: Database, send: Callable[[int, str], Awaitable],
+                 batch_size: int = 50, concurrency: int = 8, poll_interval: float = 30.0,
+                 base_delay: float = 2.0, max_delay: float = 600.0, max_attempts: int = 8,
+                 retention: float = OUTBOX_RETENTION_DAYS * 86400, prune_interval: float = 3600.0,
+                 clock=time.time):
+        self.db = db
+        self.send = send
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self.clock = clock
+        self._next_prune = 0.0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Запустить воркер; накопленное до перезапуска отправится сразу"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Сообщить воркеру о новых записях в outbox"""
+        self._wakeup.set()
+
+    def backoff(self, attempts: int) -> float:
+        """Экспоненциальная задержка перед следующей попыткой"""
+        return min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+
+    async def _deliver(self, entry: Dict):
+        async with self._semaphore:
+            try:
+                await self.send(entry['chat_id'], entry['text'])
+            except Exception as e:
+                return e
+            return None
+
+    async def run_once(self) -> int:
+        """Отправить одну пачку готовых уведомлений, вернуть их количество"""
+        now = self.clock()
+        entries = await self.db.get_due_outbox(now, self.batch_size)
+        if not entries:
+            return 0
+
+        errors = await asyncio.gather(*(self._deliver(entry) for entry in entries))
+
+        sent = []
+        failures = []
+        for entry, error in zip(entries, errors):
+            if error is None:
+                sent.append(entry['id'])
+                continue
+
+            attempts = entry['attempts'] + 1
+            if isinstance(error, PERMANENT_ERRORS) or attempts >= self.max_attempts:
+                next_at = None
+                logger.error(f"Giving up on outbox entry {entry['id']}: {error}")
+            else:
+                next_at = now + self.backoff(attempts)
+                logger.warning(f"Outbox entry {entry['id']} failed, attempt {attempts}: {error}")
+            failures.append((entry['id'], attempts, next_at, str(error)))
+
+        await self.db.complete_outbox(sent)
+        await self.db.fail_outbox(failures)
+        return len(entries)
+
+    async def prune(self) -> int:
+        """Удалить завершенные записи старше retention, вернуть их количество"""
+        cutoff = datetime.fromtimestamp(self.clock() - self.retention, timezone.utc)
+        removed = await self.db.prune_outbox(cutoff.strftime('%Y-%m-%d %H:%M:%S'))
+        if removed:
+            logger.info(f"Pruned {removed} delivered outbox entries")
+        return removed
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                if self.retention and self.clock() >= self._next_prune:
+                    self._next_prune = self.clock() + self.prune_interval
+                    await self.prune()
+                # Полная пачка - значит есть еще, разбираем без ожидания
+                if await self.run_once() >= self.batch_size:
+                    continue
+                next_at = await self.db.get_next_outbox_time()
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}")
+                next_at = None
+
+            timeout = self.poll_interval
+            if next_at is not None:
+                timeout = min(timeout, max(0.0, next_at - self.clock()))
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,136 @@
+# backend/records.py
+"""Записи строк БД со слотами вместо словарей
+
+Записи создаются фабрикой строк прямо из курсора. Они занимают меньше памяти,
+чем словари, и ничего не разбирают заранее: JSON опций позиции и дата заказа
+разбираются при первом обращении и кэшируются в слоте. Доступ как к словарю
+(record['name'], record.get('name'), dict(record)) продолжает работать.
+"""
+import json
+from collections.abc import MutableMapping
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Колонки пользователя в порядке слотов UserRecord
+USER_COLUMNS = 'user_id, username, first_name, last_name, name, phone, address, bonus_points, created_at'
+
+# Ленивое значение еще не вычислено
+_UNSET = object()
+
+
+class Record(MutableMapping):
+    """Базовая запись: FIELDS - ключи словаря, ALIASES - ключи, хранящиеся под другим атрибутом"""
+
+    __slots__ = ()
+    FIELDS: Tuple[str, ...] = ()
+    ALIASES: Dict[str, str] = {}
+    # Ключ -> атрибут, собирается для каждого класса один раз
+    _ATTRS: Dict[str, str] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._ATTRS = {key: cls.ALIASES.get(key, key) for key in cls.FIELDS}
+
+    def __getitem__(self, key: str):
+        return getattr(self, self._ATTRS[key])
+
+    def __setitem__(self, key: str, value):
+        setattr(self, self._ATTRS[key], value)
+
+    def __delitem__(self, key: str):
+        raise TypeError(f"{type(self).__name__} fields cannot be deleted")
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self) -> int:
+        return len(self.FIELDS)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+    def copy(self):
+        """Поверхностная копия со всеми слотами, включая уже вычисленные ленивые значения"""
+        clone = object.__new__(type(self))
+        for cls in type(self).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                setattr(clone, slot, getattr(self, slot))
+        return clone
+
+
+class UserRecord(Record):
+    __slots__ = ('user_id', 'username', 'first_name', 'last_name', 'name', 'phone',
+                 'address', 'bonus_points', 'created_at')
+    FIELDS = __slots__
+
+    def __init__(self, cursor, row):
+        (self.user_id, self.username, self.first_name, self.last_name, self.name,
+         self.phone, self.address, self.bonus_points, self.created_at) = row
+
+
+class ItemRecord(Record):
+    """Позиция заказа; options - JSON, разбирается при первом обращении"""
+
+    # order_id нужен только для группировки позиций по заказам и в словарь не входит
+    __slots__ = ('order_id', 'id', 'name', 'price', 'quantity', '_options')
+    FIELDS = ('id', 'name', 'price', 'quantity', 'options')
+
+    def __init__(self, cursor, row):
+        self.order_id, self.id, self.name, self.price, self.quantity, self._options = row
+
+    @property
+    def options(self) -> Dict:
+        if self._options is None or isinstance(self._options, str):
+            self._options = json.loads(self._options) if self._options else {}
+        return self._options
+
+    @options.setter
+    def options(self, value: Dict):
+        self._options = value
+
+
+class OrderRecord(Record):
+    """Заказ; created_at - строка из БД, created - ее datetime, вычисляется лениво"""
+
+    __slots__ = ('id', 'user_id', 'total_amount', 'status', 'delivery_type', 'scheduled_time',
+                 'address', 'notes', 'created_at', 'scheduled_at', 'line_items', '_created')
+    FIELDS = ('id', 'user_id', 'total_amount', 'status', 'delivery_type', 'scheduled_time',
+              'address', 'notes', 'created_at', 'scheduled_at', 'items')
+    # Имя items занято методом Mapping.items(), поэтому позиции лежат в line_items
+    ALIASES = {'items': 'line_items'}
+
+    def __init__(self, cursor, row):
+        (self.id, self.user_id, self.total_amount, self.status, self.delivery_type,
+         self.scheduled_time, self.address, self.notes, self.created_at, self.scheduled_at) = row
+        self.line_items: Optional[List[ItemRecord]] = None
+        self._created = _UNSET
+
+    @property
+    def created(self) -> datetime:
+        if self._created is _UNSET:
+            self._created = datetime.strptime(self.created_at, '%Y-%m-%d %H:%M:%S')
+        return self._created
+
+
+class HistoryOrderRecord(OrderRecord):
+    """Заказ из истории пользователя: по ключу created_at отдается datetime, как раньше"""
+
+    __slots__ = ()
+    ALIASES = {'items': 'line_items', 'created_at': 'created'}
+
+    def __setitem__(self, key: str, value):
+        if key == 'created_at':
+            self._created = value
+            return
+        super().__setitem__(key, value)
+
+
+class PlacedOrderRecord(Record):
+    """Только что оформленный заказ: сумма к оплате, баллы и профиль клиента после заказа"""
+
+    __slots__ = ('id', 'amount_due', 'points_redeemed', 'points_earned', 'customer')
+    FIELDS = __slots__
+
+    def __init__(self, cursor, row):
+        self.id, self.amount_due, self.points_redeemed, self.points_earned = row
+        self.customer: Optional[UserRecord] = None
@@ -0,0 +1,163 @@
+# backend/rollups.py
+"""Агрегаты продаж по дням, часам, статусам и позициям меню
+
+Таблицы обновляются триггерами в той же транзакции, что и заказ, поэтому
+create_order и update_order_status не делают лишних запросов, а статистика
+читается за время, не зависящее от размера таблицы orders. Отмененные заказы
+не входят в выручку и продажи позиций, но учитываются в разбивке по статусам.
+Дни и часы считаются по created_at (UTC).
+
+Перенос заказов в архив (archive.orders) агрегаты не меняет: триггеров на
+удаление нет, а полный пересчет читает и живые, и архивные заказы.
+"""
+
+# Живые и архивные заказы вместе, для полного пересчета
+ALL_ORDERS = '''(
+    SELECT created_at, status, total_amount FROM main.orders
+    UNION ALL
+    SELECT created_at, status, total_amount FROM archive.orders
+)'''
+
+# Строки проданных позиций из живых и архивных заказов; соединение - внутри каждой базы по индексу
+ALL_ORDER_LINES = ' UNION ALL '.join(
+    f'''SELECT date(o.created_at) AS day, oi.menu_item_id AS menu_item_id, oi.name AS name,
+               oi.quantity AS quantity, oi.quantity * oi.unit_price AS revenue
+        FROM {schema}.orders o JOIN {schema}.order_items oi ON oi.order_id = o.id
+        WHERE o.status != 'cancelled' AND oi.menu_item_id IS NOT NULL'''
+    for schema in ('main', 'archive')
+)
+
+ROLLUP_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS sales_daily
+    (
+        day TEXT PRIMARY KEY,
+        orders INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS sales_hourly
+    (
+        hour TEXT PRIMARY KEY,
+        orders INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS sales_status
+    (
+        day TEXT NOT NULL,
+        status TEXT NOT NULL,
+        orders INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, status)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS sales_items
+    (
+        day TEXT NOT NULL,
+        menu_item_id INTEGER NOT NULL,
+        name TEXT,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, menu_item_id)
+    ) WITHOUT ROWID
+    ''',
+    # Все агрегаты - WITHOUT ROWID таблицы: вставки в них не меняют last_insert_rowid(),
+    # на который опирается вставка позиций заказа
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_order_insert AFTER INSERT ON orders
+    BEGIN
+        INSERT INTO sales_status (day, status, orders)
+        VALUES (date(NEW.created_at), NEW.status, 1)
+        ON CONFLICT (day, status) DO UPDATE SET orders = orders + 1;
+
+        INSERT INTO sales_daily (day, orders, revenue)
+        SELECT date(NEW.created_at), 1, NEW.total_amount WHERE NEW.status != 'cancelled'
+        ON CONFLICT (day) DO UPDATE SET orders = orders + 1, revenue = revenue + excluded.revenue;
+
+        INSERT INTO sales_hourly (hour, orders, revenue)
+        SELECT strftime('%Y-%m-%d %H', NEW.created_at), 1, NEW.total_amount WHERE NEW.status != 'cancelled'
+        ON CONFLICT (hour) DO UPDATE SET orders = orders + 1, revenue = revenue + excluded.revenue;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_item_insert AFTER INSERT ON order_items
+    BEGIN
+        INSERT INTO sales_items (day, menu_item_id, name, quantity, revenue)
+        SELECT date(o.created_at), NEW.menu_item_id, NEW.name, NEW.quantity, NEW.quantity * NEW.unit_price
+        FROM orders o
+        WHERE o.id = NEW.order_id AND o.status != 'cancelled' AND NEW.menu_item_id IS NOT NULL
+        ON CONFLICT (day, menu_item_id) DO UPDATE SET
+            name = excluded.name,
+            quantity = quantity + excluded.quantity,
+            revenue = revenue + excluded.revenue;
+    END
+    ''',
+    # При отмене заказа (или ее откате) его сумма и позиции вычитаются (или возвращаются)
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_order_status AFTER UPDATE OF status ON orders
+    WHEN OLD.status IS NOT NEW.status
+    BEGIN
+        UPDATE sales_status SET orders = orders - 1
+        WHERE day = date(NEW.created_at) AND status = OLD.status;
+
+        INSERT INTO sales_status (day, status, orders)
+        VALUES (date(NEW.created_at), NEW.status, 1)
+        ON CONFLICT (day, status) DO UPDATE SET orders = orders + 1;
+
+        UPDATE sales_daily
+        SET orders = orders + (CASE WHEN NEW.status = 'cancelled' THEN -1 ELSE 1 END),
+            revenue = revenue + (CASE WHEN NEW.status = 'cancelled' THEN -1 ELSE 1 END) * NEW.total_amount
+        WHERE day = date(NEW.created_at) AND 'cancelled' IN (OLD.status, NEW.status);
+
+        UPDATE sales_hourly
+        SET orders = orders + (CASE WHEN NEW.status = 'cancelled' THEN -1 ELSE 1 END),
+            revenue = revenue + (CASE WHEN NEW.status = 'cancelled' THEN -1 ELSE 1 END) * NEW.total_amount
+        WHERE hour = strftime('%Y-%m-%d %H', NEW.created_at) AND 'cancelled' IN (OLD.status, NEW.status);
+
+        UPDATE sales_items
+        SET quantity = quantity + (CASE WHEN NEW.status = 'cancelled' THEN -1 ELSE 1 END) * (
+                SELECT SUM(oi.quantity) FROM order_items oi
+                WHERE oi.order_id = NEW.id AND oi.menu_item_id = sales_items.menu_item_id),
+            revenue = revenue + (CASE WHEN NEW.status = 'cancelled' THEN -1 ELSE 1 END) * (
+                SELECT SUM(oi.quantity * oi.unit_price) FROM order_items oi
+                WHERE oi.order_id = NEW.id AND oi.menu_item_id = sales_items.menu_item_id)
+        WHERE day = date(NEW.created_at) AND 'cancelled' IN (OLD.status, NEW.status)
+          AND menu_item_id IN (SELECT menu_item_id FROM order_items WHERE order_id = NEW.id);
+    END
+    ''',
+)
+
+# Полный пересчет агрегатов из orders и order_items (вместе с архивом)
+ROLLUP_REBUILD = (
+    'DELETE FROM sales_daily',
+    'DELETE FROM sales_hourly',
+    'DELETE FROM sales_status',
+    'DELETE FROM sales_items',
+    f'''
+    INSERT INTO sales_daily (day, orders, revenue)
+    SELECT date(created_at), COUNT(*), SUM(total_amount)
+    FROM {ALL_ORDERS} WHERE status != 'cancelled'
+    GROUP BY date(created_at)
+    ''',
+    f'''
+    INSERT INTO sales_hourly (hour, orders, revenue)
+    SELECT strftime('%Y-%m-%d %H', created_at), COUNT(*), SUM(total_amount)
+    FROM {ALL_ORDERS} WHERE status != 'cancelled'
+    GROUP BY strftime('%Y-%m-%d %H', created_at)
+    ''',
+    f'''
+    INSERT INTO sales_status (day, status, orders)
+    SELECT date(created_at), status, COUNT(*)
+    FROM {ALL_ORDERS}
+    GROUP BY date(created_at), status
+    ''',
+    f'''
+    INSERT INTO sales_items (day, menu_item_id, name, quantity, revenue)
+    SELECT day, menu_item_id, MAX(name), SUM(quantity), SUM(revenue)
+    FROM ({ALL_ORDER_LINES})
+    GROUP BY day, menu_item_id
+    ''',
+)
@@ -0,0 +1,156 @@
+# backend/scheduler.py
+import asyncio
+import heapq
+import itertools
+import logging
+import re
+import time
+from datetime import datetime, timedelta, tzinfo
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Варианты времени из Web App: "Через 30 минут", "Через 1 час", datetime-local "2024-05-01T14:30"
+RELATIVE_TIME = re.compile(r'^через\s+(\d+)\s*(мин|час)', re.IGNORECASE)
+CLOCK_TIME = re.compile(r'^(\d{1,2}):(\d{2})$')
+LOCAL_DATETIME_FORMATS = ('%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M')
+
+# Поля записи кучи PreorderScheduler
+ORDER_ID, REMOVED = 2, 3
+
+
+def parse_scheduled_time(text: Optional[str], now: datetime, tz: tzinfo) -> Optional[float]:
+    """Разобрать время заказа в Unix-время (UTC)
+
+    now - момент оформления заказа (aware datetime). Время без даты относится к
+    сегодняшнему дню кофейни, а если оно уже прошло - к завтрашнему. Для "Как можно
+    скорее" и нераспознанного текста возвращается None.
+    """
+    if not text:
+        return None
+    text = text.strip()
+
+    match = RELATIVE_TIME.match(text)
+    if match:
+        amount = int(match.group(1))
+        delta = timedelta(hours=amount) if match.group(2).lower() == 'час' else timedelta(minutes=amount)
+        return (now + delta).timestamp()
+
+    local_now = now.astimezone(tz)
+    match = CLOCK_TIME.match(text)
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2))
+        if hour > 23 or minute > 59:
+            return None
+        moment = local_now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if moment < local_now:
+            moment += timedelta(days=1)
+        return moment.timestamp()
+
+    for fmt in LOCAL_DATETIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).replace(tzinfo=tz).timestamp()
+        except ValueError:
+            continue
+    return None
+
+
+class PreorderScheduler:
+    """Будильник для заказов ко времени на min-куче
+
+    Каждый заказ лежит в куче со своим моментом срабатывания; фоновая задача
+    спит до ближайшего из них и будит on_due ровно один раз на заказ. Отмена
+    помечает запись удаленной, а куча перестраивается, когда таких записей
+    становится больше половины, поэтому вставка и отмена - O(log n).
+    Запись кучи - [момент, порядковый номер, order_id, удалена]: номер
+    уникален, поэтому при равных моментах сравнение до order_id и флага не
+    доходит.
+    """
+
+    def __init__(self, on_due: Callable[[int], Awaitable], clock=time.time):
+        self.on_due = on_due
+        self.clock = clock
+        self._heap: List[list] = []
+        self._entries: Dict[int, list] = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self._entries
+
+    def load(self, schedule: Iterable[Tuple[int, float]]):
+        """Заполнить кучу заново парами (order_id, момент срабатывания)"""
+        self._entries = {order_id: [due, next(self._counter), order_id, False] for order_id, due in schedule}
+        self._heap = list(self._entries.values())
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def schedule(self, order_id: int, due: float):
+        """Запланировать (или перенести) срабатывание для заказа"""
+        self.cancel(order_id)
+        entry = [due, next(self._counter), order_id, False]
+        self._entries[order_id] = entry
+        heapq.heappush(self._heap, entry)
+        # Будим фоновую задачу, только если новый заказ стал ближайшим
+        if self._heap[0] is entry:
+            self._wakeup.set()
+
+    def cancel(self, order_id: int) -> bool:
+        entry = self._entries.pop(order_id, None)
+        if entry is None:
+            return False
+        entry[REMOVED] = True
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [e for e in self._heap if not e[REMOVED]]
+            heapq.heapify(self._heap)
+        return True
+
+    def next_due(self) -> Optional[float]:
+        """Ближайший момент срабатывания"""
+        while self._heap and self._heap[0][REMOVED]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self) -> List[int]:
+        """Забрать заказы, момент которых уже наступил"""
+        now = self.clock()
+        due = []
+        while True:
+            moment = self.next_due()
+            if moment is None or moment > now:
+                return due
+            order_id = heapq.heappop(self._heap)[ORDER_ID]
+            del self._entries[order_id]
+            due.append(order_id)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            for order_id in self.pop_due():
+                try:
+                    await self.on_due(order_id)
+                except Exception as e:
+                    logger.error(f"Error handling scheduled order {order_id}: {e}")
+
+            moment = self.next_due()
+            timeout = None if moment is None else max(0.0, moment - self.clock())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
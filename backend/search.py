@@ -0,0 +1,171 @@
+# backend/search.py
+"""Полнотекстовый поиск заказов для администраторов (SQLite FTS5)
+
+В order_search на каждый заказ одна строка с rowid = id заказа: имя и
+телефон клиента, время, адрес, комментарий, названия позиций и выбранные
+опции. Время заказа индексируется и как его ввел клиент, и местным
+«ЧЧ ММ» из scheduled_at (scheduled_text): поле datetime-local Web App
+дает «2024-05-01T09:30», где нет отдельных токенов 09 и 30. Строку пишет _insert_order в той же транзакции, что и заказ;
+триггеры обновляют ее при правке заказа или профиля и удаляют вместе с
+заказом. У архива свой индекс archive.order_search: archive_orders
+переносит в него строки вместе с заказами, а имя и телефон в архивных
+строках обновляет update_user_profile - триггеры основной базы не могут
+писать в подключенную.
+"""
+import re
+from datetime import datetime, tzinfo
+from typing import Iterable, Optional
+
+import aiosqlite
+
+SEARCH_COLUMNS = 'customer, phone, scheduled_time, address, notes, items'
+
+# Веса колонок для bm25 в порядке SEARCH_COLUMNS: совпадение по клиенту важнее совпадения в комментарии
+SEARCH_WEIGHTS = '4.0, 4.0, 2.0, 1.0, 1.0, 1.0'
+
+# Ранжируются только столько последних совпадений в каждой базе: bm25 считается для каждой
+# ранжируемой строки, и частое слово («латте») иначе стоило бы обхода всего индекса
+SEARCH_CANDIDATES = 500
+
+# Символы, которые встречаются в записи телефона
+_PHONE_PUNCTUATION = ('+', ' ', '-', '(', ')', '.')
+
+_TIME = re.compile(r'(\d{1,2}):(\d{2})')
+_WORD = re.compile(r'\w+')
+
+
+def customer_text(alias: str) -> str:
+    """SQL-выражение: все имена клиента из строки users под псевдонимом alias"""
+    return ' || \' \' || '.join(
+        f"COALESCE({alias}.{column}, '')" for column in ('name', 'first_name', 'last_name', 'username')
+    )
+
+
+def phone_text(alias: str) -> str:
+    """SQL-выражение: телефон одними цифрами, он же без кода страны (10 цифр) и последние 4 цифры"""
+    digits = f'{alias}.phone'
+    for char in _PHONE_PUNCTUATION:
+        digits = f"replace({digits}, '{char}', '')"
+    return f"COALESCE({digits} || ' ' || substr({digits}, -10) || ' ' || substr({digits}, -4), '')"
+
+
+def scheduled_text(scheduled_time: Optional[str], scheduled_at: Optional[float], tz: tzinfo) -> Optional[str]:
+    """Время заказа для индекса: текст клиента и местное время из scheduled_at фразой «09 30»"""
+    if scheduled_at is None:
+        return scheduled_time
+    local = datetime.fromtimestamp(scheduled_at, tz).strftime('%H %M')
+    return f'{scheduled_time} {local}' if scheduled_time else local
+
+
+async def register_search_functions(db: aiosqlite.Connection, tz: tzinfo):
+    """SQL-функция scheduled_text(scheduled_time, scheduled_at) для search_rebuild"""
+    await db.create_function('scheduled_text', 2, lambda text, at: scheduled_text(text, at, tz), deterministic=True)
+
+
+def search_schema(schema: str) -> str:
+    return f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.order_search USING fts5(
+        {SEARCH_COLUMNS},
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    '''
+
+
+# Позиции заказа одной строкой: название и значения опций каждой позиции
+ORDER_ITEMS_TEXT = '''(
+    SELECT group_concat(oi.name || COALESCE(' ' || (
+        SELECT group_concat(value, ' ')
+        FROM json_each(CASE WHEN json_valid(oi.options) THEN oi.options END)
+    ), ''), ' ')
+    FROM {schema}.order_items oi WHERE oi.order_id = o.id
+)'''
+
+
+def search_rebuild(schema: str) -> str:
+    """Заполнить индекс по уже накопленным заказам базы schema
+
+    Нужна функция scheduled_text, см. register_search_functions.
+    """
+    return f'''
+    INSERT INTO {schema}.order_search (rowid, {SEARCH_COLUMNS})
+    SELECT o.id, {customer_text('u')}, {phone_text('u')}, scheduled_text(o.scheduled_time, o.scheduled_at),
+           o.address, o.notes,
+           {ORDER_ITEMS_TEXT.format(schema=schema)}
+    FROM {schema}.orders o LEFT JOIN main.users u ON u.user_id = o.user_id
+    '''
+
+
+# Строка индекса для только что вставленного заказа; параметры: время (scheduled_text), адрес, комментарий,
+# позиции (items_text) и user_id. Идет после вставки позиций: вставки в WITHOUT ROWID таблицы
+# и триггеры агрегатов не меняют last_insert_rowid()
+SEARCH_INSERT = f'''
+    INSERT INTO order_search (rowid, {SEARCH_COLUMNS})
+    SELECT last_insert_rowid(), {customer_text('u')}, {phone_text('u')}, ?, ?, ?, ?
+    FROM (SELECT ? AS user_id) n LEFT JOIN users u ON u.user_id = n.user_id
+'''
+
+SEARCH_TRIGGERS = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_order_search_delete AFTER DELETE ON orders
+    BEGIN
+        DELETE FROM order_search WHERE rowid = OLD.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_order_search_order AFTER UPDATE OF scheduled_time, address, notes ON orders
+    BEGIN
+        UPDATE order_search SET scheduled_time = NEW.scheduled_time, address = NEW.address, notes = NEW.notes
+        WHERE rowid = NEW.id;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_order_search_user AFTER UPDATE OF name, first_name, last_name, username, phone
+        ON users
+    WHEN OLD.name IS NOT NEW.name OR OLD.first_name IS NOT NEW.first_name OR OLD.last_name IS NOT NEW.last_name
+        OR OLD.username IS NOT NEW.username OR OLD.phone IS NOT NEW.phone
+    BEGIN
+        UPDATE order_search SET customer = {customer_text('NEW')}, phone = {phone_text('NEW')}
+        WHERE rowid IN (SELECT id FROM orders WHERE user_id = NEW.user_id);
+    END
+    ''',
+)
+
+# То же для архивных заказов клиента; параметры: user_id, user_id
+ARCHIVE_SEARCH_PROFILE_UPDATE = f'''
+    UPDATE archive.order_search
+    SET (customer, phone) = (SELECT {customer_text('u')}, {phone_text('u')} FROM main.users u WHERE u.user_id = ?)
+    WHERE rowid IN (SELECT id FROM archive.orders WHERE user_id = ?)
+'''
+
+
+def items_text(items: Iterable) -> str:
+    """Позиции заказа для индекса: как ORDER_ITEMS_TEXT, но из позиций в памяти"""
+    parts = []
+    for item in items:
+        parts.append(item.get('name') or '')
+        options = item.get('options')
+        if options:
+            parts.extend(str(value) for value in options.values())
+    return ' '.join(parts)
+
+
+def match_query(text: str) -> Optional[str]:
+    """Запрос администратора -> выражение FTS5 MATCH
+
+    Каждое слово ищется по префиксу, все слова должны встретиться в заказе.
+    Время 9:30 ищется фразой "09 30", телефон в любой записи - по цифрам.
+    Синтаксис FTS5 (кавычки, NEAR, OR) из ввода не пропускается.
+    """
+    terms = []
+    for hours, minutes in _TIME.findall(text):
+        terms.append(f'"{int(hours):02d} {minutes}"')
+    text = _TIME.sub(' ', text)
+
+    digits = ''.join(char for char in text if char.isdigit())
+    if len(digits) >= 4 and all(char.isdigit() or char in _PHONE_PUNCTUATION for char in text.strip()):
+        # +7 999 ... и 8 999 ... - один номер: в индексе есть его последние 10 цифр
+        terms.append(f'"{digits[-10:]}"*')
+    else:
+        terms.extend(f'"{word}"*' for word in _WORD.findall(text.lower()))
+    return ' '.join(terms) or None
@@ -0,0 +1,64 @@
+# backend/tests/conftest.py
+import asyncio
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Модули бота лежат плоско в backend/, поддельный Bot API - в benchmarks/fakes.py
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'benchmarks'))
+# Тесты не поднимают HTTP-эндпоинты метрик и меню
+os.environ.setdefault('METRICS_PORT', '0')
+os.environ.setdefault('MENU_PORT', '0')
+
+from database import Database  # noqa: E402
+
+# Позиция заказа для тестов, которым не важно, что именно заказано
+ITEMS = [{'id': 101, 'name': 'Эспрессо', 'price': 150, 'quantity': 1}]
+
+
+class FakeClock:
+    """Часы, которые идут только при присваивании now"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class DatabaseRunner:
+    """Запуск асинхронного сценария с открытыми Database на одном файле
+
+    runner(scenario) открывает базу, передает ее в scenario и закрывает после;
+    с count > 1 открываются несколько Database - как воркеры в многопроцессном
+    режиме. Параметры Database из вызова дополняют заданные при создании.
+    """
+
+    def __init__(self, path: str, **options):
+        self.path = path
+        self.options = options
+
+    def __call__(self, scenario, count: int = 1, **options):
+        async def run():
+            dbs = [Database(self.path, **{**self.options, **options}) for _ in range(count)]
+            for db in dbs:
+                await db.connect()
+            try:
+                return await scenario(*dbs)
+            finally:
+                for db in dbs:
+                    await db.close()
+        return asyncio.run(run())
+
+
+@pytest.fixture
+def db(tmp_path, request):
+    """DatabaseRunner на tmp_path/test.db
+
+    Оба режима записи проверяются через
+    @pytest.mark.parametrize('db', [True, False], indirect=True) - параметр становится batch_writes.
+    """
+    return DatabaseRunner(str(tmp_path / 'test.db'), batch_writes=getattr(request, 'param', True))
@@ -0,0 +1,109 @@
+# backend/tests/test_admission.py
+import asyncio
+
+from telegram import Update
+from telegram.ext import Application, MessageHandler, filters
+
+from admission import AdmissionController, REJECT_DUPLICATE, REJECT_RATE_LIMITED
+from conftest import FakeClock
+from fakes import FakeRequest, text_update, web_app_update
+from update_processor import PerUserUpdateProcessor
+
+ORDER = {'items': [{'id': 101, 'quantity': 1}]}
+
+
+def make_controller(clock: FakeClock, **kwargs) -> AdmissionController:
+    options = dict(rate=1, burst=1, max_in_flight=0, duplicate_window=10, clock=clock)
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+def order_update(update_id: int, user_id: int = 42) -> Update:
+    return Update.de_json(web_app_update(update_id, user_id, ORDER), None)
+
+
+def test_rate_limited_order_is_not_remembered_as_duplicate():
+    clock = FakeClock()
+    rejected = []
+    admission = make_controller(clock, on_reject=rejected.append)
+
+    # Ведро пусто после первого сообщения, заказ следом отклоняется по лимиту
+    assert admission.admit(Update.de_json(text_update(1, 42, 'привет'), None))
+    admission.release()
+    assert not admission.admit(order_update(2))
+    assert rejected == [REJECT_RATE_LIMITED]
+
+    clock.now += 3
+    assert admission.admit(order_update(3))
+
+
+def test_admitted_order_repeat_is_duplicate_until_window_expires():
+    clock = FakeClock()
+    rejected = []
+    admission = make_controller(clock, rate=0, on_reject=rejected.append)
+
+    assert admission.admit(order_update(1))
+    admission.release()
+    assert not admission.admit(order_update(2))
+    assert rejected == [REJECT_DUPLICATE]
+
+    clock.now += 11
+    assert admission.admit(order_update(3))
+
+
+def test_forget_lets_failed_order_be_retried():
+    admission = make_controller(FakeClock(), rate=0)
+    assert admission.admit(order_update(1))
+    admission.release()
+
+    admission.forget(order_update(1))
+    assert admission.admit(order_update(2))
+
+
+def test_notice_for_every_rejected_order_and_throttled_for_messages():
+    clock = FakeClock()
+    notices = []
+    admission = make_controller(clock, notice_interval=30,
+                                on_notice=lambda update, reason: notices.append((update.update_id, reason)))
+
+    for update_id in range(1, 5):
+        admission.admit(Update.de_json(text_update(update_id, 42, 'привет'), None))
+    admission.admit(order_update(5))
+    admission.admit(order_update(6))
+    assert notices == [(2, REJECT_RATE_LIMITED), (5, REJECT_RATE_LIMITED), (6, REJECT_RATE_LIMITED)]
+
+    clock.now += 31
+    admission.admit(Update.de_json(text_update(7, 42, 'привет'), None))
+    admission.admit(Update.de_json(text_update(8, 42, 'привет'), None))
+    assert notices[-1] == (8, REJECT_RATE_LIMITED)
+
+
+def test_handler_error_forgets_order_through_error_handler():
+    """Обработчик упал: ошибку ловит Application, отметку снимает обработчик ошибок"""
+    admission = make_controller(FakeClock(), rate=0)
+    attempts = []
+
+    async def handle_order(update, context):
+        attempts.append(update.update_id)
+        if len(attempts) == 1:
+            raise RuntimeError('database is locked')
+
+    async def handle_error(update, context):
+        admission.forget(update)
+
+    async def run():
+        application = (
+            Application.builder().token('123456:TEST').request(FakeRequest())
+            .concurrent_updates(PerUserUpdateProcessor(4, admission=admission)).updater(None).build()
+        )
+        application.add_handler(MessageHandler(filters.StatusUpdate.WEB_APP_DATA, handle_order))
+        application.add_error_handler(handle_error)
+        async with application:
+            for update_id in (1, 2, 3):
+                # Так обновления из очереди запускает сам Application
+                update = Update.de_json(web_app_update(update_id, 42, ORDER), application.bot)
+                await application.update_processor.process_update(update, application.process_update(update))
+
+    asyncio.run(run())
+    # Повтор после ошибки обработан, следующий повтор уже дубль
+    assert attempts == [1, 2]
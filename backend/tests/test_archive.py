@@ -0,0 +1,62 @@
+# backend/tests/test_archive.py
+import sqlite3
+
+import pytest
+
+from conftest import ITEMS
+
+CUTOFF = '2100-01-01 00:00:00'
+
+
+def counts(tmp_path):
+    """Число заказов, позиций и записей истории в живой базе и в архиве"""
+    result = {}
+    for name in ('test.db', 'test_archive.db'):
+        with sqlite3.connect(tmp_path / name) as conn:
+            result[name] = tuple(
+                conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('orders', 'order_items', 'order_status_history')
+            )
+    return result
+
+
+async def place_finished_orders(db, count: int):
+    await db.create_user(7)
+    for _ in range(count):
+        order_id = await db.create_order(7, ITEMS, 150)
+        await db.update_order_status(order_id, 'cancelled')
+    # Открытый заказ в архив не попадает
+    await db.create_order(7, ITEMS, 150)
+
+
+def test_archive_moves_finished_orders_in_batches(db, tmp_path):
+    async def scenario(db):
+        await place_finished_orders(db, 5)
+        moved = await db.archive_orders(CUTOFF, batch_size=2)
+        page, _, _ = await db.get_user_orders_page(7)
+        return moved, page
+
+    moved, page = db(scenario)
+    assert moved == 5
+    assert counts(tmp_path) == {'test.db': (1, 1, 1), 'test_archive.db': (5, 5, 10)}
+    # История пользователя видит каждый заказ ровно один раз
+    assert len(page) == len({order['id'] for order in page}) == 6
+
+
+def test_failed_delete_rolls_back_the_copy(db, tmp_path):
+    async def scenario(db):
+        await place_finished_orders(db, 3)
+        await db._submit_write(
+            '''CREATE TRIGGER fail_delete BEFORE DELETE ON main.orders
+               BEGIN SELECT RAISE(ABORT, 'delete failed'); END''', ())
+        with pytest.raises(sqlite3.IntegrityError):
+            await db.archive_orders(CUTOFF)
+        # Копия пачки откатилась вместе с удалением
+        assert counts(tmp_path) == {'test.db': (4, 4, 7), 'test_archive.db': (0, 0, 0)}
+        await db._submit_write('DROP TRIGGER fail_delete', ())
+        # После сбоя перенос повторяется с нуля
+        return await db.archive_orders(CUTOFF)
+
+    assert db(scenario) == 3
+    assert counts(tmp_path) == {'test.db': (1, 1, 1), 'test_archive.db': (3, 3, 6)}
+
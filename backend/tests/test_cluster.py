@@ -0,0 +1,97 @@
+# backend/tests/test_cluster.py
+import asyncio
+import json
+import sys
+import textwrap
+
+from telegram import Update
+
+import cluster
+from cluster import Supervisor
+from fakes import text_update
+
+# Минимальный воркер по протоколу cluster.py: записывает номера полученных обновлений
+# и один раз падает на обновлении CRASH_ON, не успев его записать
+WORKER = textwrap.dedent('''
+    import json, os, socket, sys
+
+    log_path, marker, crash_on = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    sock = socket.socket(socket.AF_UNIX)
+    sock.connect(os.environ['SUPERVISOR_SOCKET'])
+    stream = sock.makefile('rwb')
+    stream.write(json.dumps({'hello': int(os.environ['WORKER_INDEX'])}).encode() + b'\\n')
+    stream.flush()
+    for line in stream:
+        message = json.loads(line)
+        if 'update' in message:
+            update_id = message['update']['update_id']
+            if update_id == crash_on and not os.path.exists(marker):
+                open(marker, 'w').close()
+                os._exit(1)
+            with open(log_path, 'a') as log:
+                log.write(f'{update_id}\\n')
+        elif 'drain' in message:
+            stream.write(json.dumps({'drained': message['drain']}).encode() + b'\\n')
+            stream.flush()
+''')
+
+
+def message(update_id: int, user_id: int = 1) -> Update:
+    return Update.de_json(text_update(update_id, user_id, 'привет'), None)
+
+
+def test_dispatch_waits_for_room_instead_of_dropping(tmp_path, monkeypatch):
+    monkeypatch.setattr(cluster, 'MAX_PENDING_UPDATES', 2)
+
+    async def run():
+        supervisor = Supervisor(['true'], 1, str(tmp_path / 'test.sock'))
+        channel = supervisor.channels[0]
+        await supervisor.dispatch(message(1))
+        await supervisor.dispatch(message(2))
+        blocked = asyncio.create_task(supervisor.dispatch(message(3)))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        # События не ждут места и не вытесняют обновления
+        supervisor.broadcast(['user', 1])
+        assert channel.pending == 3
+
+        # Отправка одного обновления воркеру освобождает место
+        item = await channel.get()
+        channel.sent(item)
+        await asyncio.wait_for(blocked, 1)
+
+        lines = [item] + [await channel.get() for _ in range(3)]
+        return [json.loads(line) for line, _ in lines]
+
+    messages = asyncio.run(run())
+    assert [m['update']['update_id'] for m in messages if 'update' in m] == [1, 2, 3]
+    assert {'event': ['user', 1]} in messages
+
+
+def test_updates_survive_worker_restart(tmp_path, monkeypatch):
+    monkeypatch.setattr(cluster, 'RESTART_DELAY', 0.2)
+    script = tmp_path / 'worker.py'
+    script.write_text(WORKER)
+    log_path = tmp_path / 'received.log'
+    marker = tmp_path / 'crashed'
+
+    async def run():
+        supervisor = Supervisor([sys.executable, str(script), str(log_path), str(marker), '3'],
+                                1, str(tmp_path / 'test.sock'))
+        await supervisor.start(timeout=10)
+        try:
+            for update_id in (1, 2, 3):
+                await supervisor.dispatch(message(update_id))
+            # Пока воркер лежит, обновления копятся в очереди и не теряются
+            while not marker.exists() or supervisor.channels[0].connected.is_set():
+                await asyncio.sleep(0.01)
+            for update_id in (4, 5, 6):
+                await supervisor.dispatch(message(update_id))
+            await asyncio.wait_for(supervisor.drain(), 10)
+        finally:
+            await supervisor.stop()
+
+    asyncio.run(run())
+    # Обновление, на котором воркер упал, было уже записано в сокет - оно потеряно
+    assert log_path.read_text().split() == ['1', '2', '4', '5', '6']
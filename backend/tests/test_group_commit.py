@@ -0,0 +1,50 @@
+# backend/tests/test_group_commit.py
+import asyncio
+import time
+
+from conftest import ITEMS
+
+
+def count_flushes(db):
+    batches = []
+    flush = db._flush_writes
+
+    async def counting(batch):
+        batches.append(len(batch))
+        await flush(batch)
+
+    db._flush_writes = counting
+    return batches
+
+
+def test_lone_write_does_not_wait_for_company(db):
+    async def scenario(db):
+        await db.create_user(7)
+        start = time.perf_counter()
+        await db.create_order(7, ITEMS, 150)
+        return time.perf_counter() - start
+
+    # Срок ожидания пачки заведомо больше, чем должна занимать одиночная запись
+    assert db(scenario, batch_max_latency=5.0) < 1.0
+
+
+def test_concurrent_writes_share_a_commit(db):
+    async def scenario(db):
+        await db.create_user(7)
+        batches = count_flushes(db)
+        await asyncio.gather(*(db.create_order(7, ITEMS, 150) for _ in range(50)))
+        return batches
+
+    batches = db(scenario, batch_size=64)
+    assert sum(batches) == 50
+    assert len(batches) < 50
+
+
+def test_batch_size_limits_a_commit(db):
+    async def scenario(db):
+        await db.create_user(7)
+        batches = count_flushes(db)
+        await asyncio.gather(*(db.create_order(7, ITEMS, 150) for _ in range(50)))
+        return batches
+
+    assert max(db(scenario, batch_size=8)) <= 8
@@ -0,0 +1,117 @@
+# backend/tests/test_loyalty.py
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import ITEMS
+from loyalty import LoyaltyRule
+
+
+async def give_points(db, user_id: int, points: int):
+    await db.create_user(user_id)
+    await db._submit_write('UPDATE users SET bonus_points = ? WHERE user_id = ?', (points, user_id))
+    db.user_cache.invalidate(user_id)
+
+
+def fetch(db_path, query, params=()):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(query, params).fetchone()
+
+
+@pytest.mark.parametrize('db', [True, False], indirect=True)
+def test_concurrent_accrual_and_redemption_keep_the_ledger(db):
+    orders = 30
+
+    async def scenario(first, second):
+        await give_points(first, 7, 100)
+        await asyncio.gather(*(
+            (first, second)[i % 2].create_order(7, ITEMS, 300, redeem_points=40) for i in range(orders)
+        ))
+
+    # Две Database на одном файле - как воркеры в многопроцессном режиме
+    db(scenario, count=2)
+
+    balance, = fetch(db.path, 'SELECT bonus_points FROM users WHERE user_id = 7')
+    placed, redeemed, earned = fetch(
+        db.path, 'SELECT COUNT(*), SUM(points_redeemed), SUM(points_earned) FROM orders WHERE user_id = 7')
+    assert placed == orders
+    assert balance == 100 + earned - redeemed
+    assert balance >= 0
+    # Начисление считается от оплаченной деньгами части каждого заказа
+    assert fetch(db.path, '''SELECT COUNT(*) FROM orders
+                             WHERE points_earned != CAST((total_amount - points_redeemed) * 5 / 100 AS INTEGER)''') == (0,)
+
+
+def test_redemption_is_capped_by_balance_and_rule(db):
+    async def scenario(db):
+        await give_points(db, 7, 30)
+        by_balance = await db._insert_order(7, ITEMS, '[]', 300, 'pickup', None, None, '', None, 500)
+        await give_points(db, 8, 1000)
+        by_rule = await db._insert_order(8, ITEMS, '[]', 300, 'pickup', None, None, '', None, 500)
+        return by_balance, by_rule
+
+    by_balance, by_rule = db(scenario, loyalty=LoyaltyRule(accrual_percent=10, max_redeem_percent=50))
+    assert (by_balance.points_redeemed, by_balance.amount_due, by_balance.points_earned) == (30, 270, 27)
+    assert by_balance.customer.bonus_points == 27
+    assert (by_rule.points_redeemed, by_rule.amount_due, by_rule.points_earned) == (150, 150, 15)
+    assert by_rule.customer.bonus_points == 1000 - 150 + 15
+
+
+def test_order_keeps_menu_total_and_rollups_agree(db):
+    """Оплата баллами не меняет выручку: sales_daily и sales_items считают сумму по меню"""
+    async def scenario(db):
+        await give_points(db, 7, 100)
+        placed = await db._insert_order(7, ITEMS, '[[101, "Эспрессо", 150, 2, {}]]', 300,
+                                        'pickup', None, None, '', None, 100)
+        today = datetime.utcnow().date()
+        stats = await db.get_sales_stats(today.isoformat(), (today + timedelta(days=1)).isoformat())
+        return placed, stats
+
+    placed, stats = db(scenario)
+    assert placed.amount_due == 200
+    assert fetch(db.path, 'SELECT total_amount, points_redeemed FROM orders') == (300, 100)
+    assert stats['revenue'] == 300
+    assert stats['top_items'][0]['revenue'] == 300
+
+
+def test_cancel_restores_points(db):
+    async def scenario(db):
+        await give_points(db, 7, 100)
+        order_id = await db.create_order(7, ITEMS, 300, redeem_points=60)
+        after_order = (await db.get_user(7)).bonus_points
+        await db.update_order_status(order_id, 'cancelled')
+        after_cancel = (await db.get_user(7)).bonus_points
+        # Повторная отмена ничего не меняет
+        await db._submit_write("UPDATE orders SET status = 'cancelled' WHERE id = ?", (order_id,))
+        db.user_cache.invalidate(7)
+        return after_order, after_cancel, (await db.get_user(7)).bonus_points
+
+    after_order, after_cancel, after_repeat = db(scenario)
+    # Списано 60, начислено 5% от 240
+    assert after_order == 100 - 60 + 12
+    assert after_cancel == 100
+    assert after_repeat == 100
+
+
+def test_cancel_does_not_make_balance_negative(db):
+    async def scenario(db):
+        await give_points(db, 7, 0)
+        order_id = await db.create_order(7, ITEMS, 300)
+        # Начисленные 15 баллов уже потрачены
+        await db._submit_write('UPDATE users SET bonus_points = 5 WHERE user_id = 7', ())
+        await db.update_order_status(order_id, 'cancelled')
+        return (await db.get_user(7)).bonus_points
+
+    assert db(scenario) == 0
+
+
+def test_order_without_profile_gets_no_points(db):
+    async def scenario(db):
+        return await db._insert_order(42, ITEMS, '[]', 300, 'pickup', None, None, '', None, 100)
+
+    placed = db(scenario)
+    assert placed.id
+    assert (placed.amount_due, placed.points_redeemed, placed.points_earned) == (300, 0, 0)
+    assert placed.customer is None
@@ -0,0 +1,34 @@
+# backend/tests/test_metrics.py
+import os
+
+from telegram.ext import Application, ConversationHandler
+
+from bot import CoffeeShopBot
+from database import Database
+from fakes import FakeRequest
+from notifier import NotificationDispatcher
+
+# menu.json лежит в корне репозитория, бот читает его из рабочего каталога
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def registered_callbacks(handlers):
+    names = set()
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            names |= registered_callbacks(handler.entry_points + handler.fallbacks +
+                                          [step for steps in handler.states.values() for step in steps])
+        else:
+            names.add(handler.callback.__name__)
+    return names
+
+
+def test_every_registered_handler_is_timed(tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_DIR)
+    shop = CoffeeShopBot(db=Database(str(tmp_path / 'test.db')), notifier=NotificationDispatcher())
+    application = shop.build_application(Application.builder().token('123456:TEST').request(FakeRequest()))
+
+    callbacks = registered_callbacks(handler for group in application.handlers.values() for handler in group)
+    timed = {name for kind, name in shop.metrics.histograms if kind == 'handler'}
+    assert {'vacuum_database', 'get_profile_phone', 'cancel'} <= callbacks
+    assert timed == callbacks
@@ -0,0 +1,90 @@
+# backend/tests/test_migrations.py
+import asyncio
+import json
+import sqlite3
+
+from migrations import backfill_order_items
+
+LEGACY_ITEMS = [{'id': 101, 'name': 'Эспрессо', 'price': 150, 'quantity': 2, 'options': {}},
+                {'id': 203, 'name': 'Круассан', 'price': 120}]
+
+
+def legacy_database(path):
+    """База в том виде, как ее создавал прежний синхронный init_db"""
+    with sqlite3.connect(path) as conn:
+        conn.execute('''CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT,
+                        last_name TEXT, name TEXT, phone TEXT, address TEXT, bonus_points INTEGER DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        conn.execute('''CREATE TABLE orders (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, items TEXT,
+                        total_amount REAL, status TEXT DEFAULT 'new', delivery_type TEXT, scheduled_time TEXT,
+                        address TEXT, notes TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        conn.execute('INSERT INTO users (user_id) VALUES (7)')
+        for status in ('completed', 'new', 'cancelled'):
+            conn.execute("INSERT INTO orders (user_id, items, total_amount, status, created_at) "
+                         "VALUES (7, ?, 420, ?, '2020-01-01 10:00:00')",
+                         (json.dumps(LEGACY_ITEMS, ensure_ascii=False), status))
+        conn.execute("INSERT INTO orders (user_id, items, total_amount) VALUES (7, 'not json', 100)")
+
+
+def rows(path, query, params=()):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(query, params).fetchall()
+
+
+def test_backfill_keeps_legacy_json(db):
+    legacy_database(db.path)
+
+    async def scenario(db):
+        # Повторный проход (как после сбоя) ничего не дублирует
+        async with db._write() as conn:
+            await backfill_order_items(conn, 2)
+        return [(order.id, [(item.name, item.quantity) for item in order.line_items])
+                for order in await db.get_user_orders(7)]
+
+    orders = db(scenario)
+    assert sorted(orders)[:3] == [(i, [('Эспрессо', 2), ('Круассан', 1)]) for i in (1, 2, 3)]
+    assert rows(db.path, 'SELECT COUNT(*) FROM order_items') == [(6,)]
+    # Устаревшее поле не тронуто, включая невалидный JSON
+    assert [json.loads(items) for items, in rows(db.path, 'SELECT items FROM orders WHERE id <= 3')] == [LEGACY_ITEMS] * 3
+    assert rows(db.path, 'SELECT items FROM orders WHERE id = 4') == [('not json',)]
+
+
+def test_startup_does_not_rewrite_legacy_database(db):
+    legacy_database(db.path)
+
+    async def scenario(db):
+        async with db._read() as conn:
+            cursor = await conn.execute('PRAGMA main.auto_vacuum')
+            return (await cursor.fetchone())[0]
+
+    # Полный VACUUM при старте не выполняется: база остается в прежнем режиме
+    assert db(scenario) == 0
+
+
+def test_new_database_starts_incremental(db):
+    db(lambda db: asyncio.sleep(0))
+    assert rows(db.path, 'PRAGMA auto_vacuum') == [(2,)]
+
+
+def test_archive_keeps_legacy_json(db, tmp_path):
+    legacy_database(db.path)
+
+    assert db(lambda db: db.archive_orders('2021-01-01 00:00:00')) == 2
+    archived = rows(tmp_path / 'test_archive.db', 'SELECT id, items FROM orders ORDER BY id')
+    assert [(order_id, json.loads(items)) for order_id, items in archived] == [(1, LEGACY_ITEMS), (3, LEGACY_ITEMS)]
+
+
+def test_vacuum_converts_legacy_database_once(db):
+    legacy_database(db.path)
+
+    async def scenario(db):
+        return await db.vacuum(), await db.vacuum()
+
+    first, second = db(scenario)
+    assert first['full'] and not second['full']
+    assert rows(db.path, 'PRAGMA auto_vacuum') == [(2,)]
+
+
+def test_new_database_needs_no_full_vacuum(db):
+    result = db(lambda db: db.vacuum())
+    assert not result['full']
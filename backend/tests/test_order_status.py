@@ -0,0 +1,63 @@
+# backend/tests/test_order_status.py
+import asyncio
+import sqlite3
+
+import pytest
+
+from conftest import ITEMS
+
+
+def count(db_path, query, params=()):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(query, params).fetchone()[0]
+
+
+@pytest.mark.parametrize('db', [True, False], indirect=True)
+def test_concurrent_taps_have_exactly_one_winner(db):
+    taps = 20
+
+    async def scenario(db):
+        await db.create_user(7)
+        order_id = await db.create_order(7, ITEMS, 150)
+        results = await asyncio.gather(*(
+            db.update_order_status(order_id, 'preparing', notification='Заказ готовится') for _ in range(taps)
+        ))
+        return order_id, results
+
+    order_id, results = db(scenario)
+    winners = [result for result in results if result is not None]
+    assert len(winners) == 1
+    assert winners[0] == {'id': order_id, 'user_id': 7, 'status': 'preparing', 'total_amount': 150}
+
+    assert count(db.path, "SELECT COUNT(*) FROM order_status_history WHERE order_id = ? AND to_status = 'preparing'",
+                 (order_id,)) == 1
+    assert count(db.path, 'SELECT COUNT(*) FROM outbox WHERE dedup_key = ?', (f'order:{order_id}:preparing',)) == 1
+
+
+def test_concurrent_conflicting_transitions_pick_one(db):
+    """completed и cancelled - конечные статусы: из одновременных нажатий проходит одно"""
+    async def scenario(db):
+        await db.create_user(7)
+        order_id = await db.create_order(7, ITEMS, 150)
+        await db.update_order_status(order_id, 'preparing')
+        results = await asyncio.gather(*(
+            db.update_order_status(order_id, status, notification=status)
+            for status in ('completed', 'cancelled') * 5
+        ))
+        return order_id, results, (await db.get_order(order_id))['status']
+
+    order_id, results, final = db(scenario)
+    winners = [result for result in results if result is not None]
+    assert len(winners) == 1
+    assert winners[0]['status'] == final
+    assert count(db.path, 'SELECT COUNT(*) FROM outbox') == 1
+
+
+def test_transition_not_allowed_from_current_status(db):
+    async def scenario(db):
+        order_id = await db.create_order(7, ITEMS, 150)
+        await db.update_order_status(order_id, 'cancelled')
+        return await db.update_order_status(order_id, 'preparing', notification='x')
+
+    assert db(scenario) is None
+    assert count(db.path, 'SELECT COUNT(*) FROM outbox') == 0
@@ -0,0 +1,125 @@
+# backend/tests/test_outbox.py
+import sqlite3
+import time
+
+from telegram.error import Forbidden, NetworkError
+
+from conftest import FakeClock
+from outbox import OutboxWorker
+
+
+class FakeSend:
+    """Поддельная отправка: ошибки из errors по очереди, дальше успех"""
+
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.sent = []
+        self.attempts = 0
+
+    async def __call__(self, chat_id: int, text: str):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text))
+
+
+def outbox_rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute('SELECT dedup_key, status, attempts, next_attempt_at FROM outbox ORDER BY id').fetchall()
+
+
+def test_backoff_is_exponential_and_capped():
+    worker = OutboxWorker(None, FakeSend(), base_delay=2, max_delay=60)
+    assert [worker.backoff(attempts) for attempts in range(1, 7)] == [2, 4, 8, 16, 32, 60]
+
+
+def test_transient_error_is_retried_after_backoff(db):
+    clock = FakeClock()
+    send = FakeSend(NetworkError('timeout'), NetworkError('timeout'))
+
+    async def scenario(db):
+        worker = OutboxWorker(db, send, base_delay=2, clock=clock)
+        await db.enqueue_notifications([(7, 'Ваш заказ готов', 'order:1:ready')])
+
+        assert await worker.run_once() == 1
+        assert outbox_rows(db.db_path) == [('order:1:ready', 'pending', 1, clock.now + 2)]
+        # До истечения задержки запись не берется
+        clock.now += 1
+        assert await worker.run_once() == 0
+        clock.now += 1
+        assert await worker.run_once() == 1
+        assert outbox_rows(db.db_path)[0][2:] == (2, clock.now + 4)
+        clock.now += 4
+        assert await worker.run_once() == 1
+
+    db(scenario)
+    assert send.sent == [(7, 'Ваш заказ готов')]
+    assert outbox_rows(db.path)[0][1:3] == ('sent', 2)
+
+
+def test_permanent_error_is_not_retried(db):
+    clock = FakeClock()
+    send = FakeSend(Forbidden('bot was blocked by the user'))
+
+    async def scenario(db):
+        worker = OutboxWorker(db, send, clock=clock)
+        await db.enqueue_notifications([(7, 'Заказ отменен', 'order:1:cancelled')])
+        assert await worker.run_once() == 1
+        clock.now += 3600
+        assert await worker.run_once() == 0
+
+    db(scenario)
+    assert send.attempts == 1
+    assert outbox_rows(db.path)[0][1:3] == ('failed', 1)
+
+
+def test_gives_up_after_max_attempts(db):
+    clock = FakeClock()
+    send = FakeSend(*(NetworkError('timeout') for _ in range(5)))
+
+    async def scenario(db):
+        worker = OutboxWorker(db, send, max_attempts=3, clock=clock)
+        await db.enqueue_notifications([(7, 'text', 'key')])
+        for _ in range(5):
+            await worker.run_once()
+            clock.now += 3600
+
+    db(scenario)
+    assert send.attempts == 3
+    assert outbox_rows(db.path)[0][1:3] == ('failed', 3)
+
+
+def test_dedup_key_makes_enqueue_idempotent(db):
+    send = FakeSend()
+
+    async def scenario(db):
+        worker = OutboxWorker(db, send, clock=FakeClock())
+        entry = (7, 'Ваш заказ начали готовить', 'order:1:preparing')
+        await db.enqueue_notifications([entry, entry])
+        await worker.run_once()
+        # Повтор после отправки (например, после перезапуска) тоже ничего не добавляет
+        await db.enqueue_notifications([entry])
+        assert await worker.run_once() == 0
+
+    db(scenario)
+    assert send.sent == [(7, 'Ваш заказ начали готовить')]
+    assert len(outbox_rows(db.path)) == 1
+
+
+def test_prune_removes_only_old_finished_entries(db):
+    # Срок хранения отсчитывается от sent_at и created_at, а их ставит SQLite по настоящим часам
+    clock = FakeClock(time.time())
+    send = FakeSend(Forbidden('blocked'))
+
+    async def scenario(db):
+        worker = OutboxWorker(db, send, retention=7 * 86400, clock=clock)
+        await db.enqueue_notifications([(1, 'failed', 'a'), (2, 'sent', 'b')])
+        await worker.run_once()
+        await db.enqueue_notifications([(3, 'pending', 'c')])
+
+        assert await worker.prune() == 0
+        clock.now += 8 * 86400
+        assert await worker.prune() == 2
+
+    db(scenario)
+    assert [row[:2] for row in outbox_rows(db.path)] == [('c', 'pending')]
@@ -0,0 +1,166 @@
+# backend/tests/test_scheduler.py
+import asyncio
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from conftest import FakeClock, ITEMS
+from scheduler import PreorderScheduler, parse_scheduled_time
+
+MOSCOW = ZoneInfo('Europe/Moscow')
+
+
+async def never(order_id: int):
+    raise AssertionError('фоновая задача в этих тестах не запускается')
+
+
+def local(hour: int, minute: int) -> datetime:
+    """Момент оформления заказа: 1 мая, hour:minute по Москве"""
+    return datetime(2024, 5, 1, hour, minute, tzinfo=MOSCOW).astimezone(timezone.utc)
+
+
+def test_pop_due_returns_orders_in_due_order():
+    clock = FakeClock()
+    scheduler = PreorderScheduler(never, clock=clock)
+    for order_id, due in ((1, 1030), (2, 1010), (3, 1020), (4, 2000)):
+        scheduler.schedule(order_id, due)
+
+    assert scheduler.pop_due() == []
+    assert scheduler.next_due() == 1010
+    clock.now = 1030
+    assert scheduler.pop_due() == [2, 3, 1]
+    assert len(scheduler) == 1 and 4 in scheduler
+
+
+def test_reschedule_moves_order():
+    clock = FakeClock()
+    scheduler = PreorderScheduler(never, clock=clock)
+    scheduler.schedule(1, 1010)
+    scheduler.schedule(2, 1020)
+    scheduler.schedule(1, 1030)
+
+    clock.now = 1025
+    assert scheduler.pop_due() == [2]
+    clock.now = 1030
+    assert scheduler.pop_due() == [1]
+
+
+def test_cancel_is_lazy_and_heap_is_compacted():
+    clock = FakeClock()
+    scheduler = PreorderScheduler(never, clock=clock)
+    for order_id in range(200):
+        scheduler.schedule(order_id, 1000 + order_id)
+
+    assert scheduler.cancel(0)
+    assert not scheduler.cancel(0)
+    # Отмененная запись остается в куче до перестройки
+    assert len(scheduler._heap) == 200
+    assert scheduler.next_due() == 1001
+
+    for order_id in range(1, 150):
+        scheduler.cancel(order_id)
+    # Удаленных больше половины: куча перестроена, в ней только живые записи
+    assert len(scheduler) == 50
+    assert len(scheduler._heap) <= 2 * len(scheduler) + 64
+    clock.now = 5000
+    assert scheduler.pop_due() == list(range(150, 200))
+
+
+def test_equal_due_times_with_cancel_and_reschedule():
+    """Заказы ко времени с точностью до минуты часто совпадают по моменту"""
+    clock = FakeClock()
+    scheduler = PreorderScheduler(never, clock=clock)
+    scheduler.schedule(1, 1100)
+    scheduler.schedule(2, 1100)
+    scheduler.cancel(1)
+    scheduler.schedule(3, 1100)
+    scheduler.schedule(4, 1100)
+    scheduler.cancel(4)
+    scheduler.schedule(2, 1100)
+    scheduler.schedule(5, 1050)
+
+    clock.now = 1100
+    assert scheduler.pop_due() == [5, 3, 2]
+    assert len(scheduler) == 0 and scheduler.next_due() is None
+
+
+def test_reload_with_equal_due_times_then_cancel():
+    clock = FakeClock()
+    scheduler = PreorderScheduler(never, clock=clock)
+    scheduler.load([(1, 1100), (2, 1100), (3, 1100)])
+    scheduler.cancel(3)
+    scheduler.schedule(4, 1100)
+
+    clock.now = 1100
+    assert sorted(scheduler.pop_due()) == [1, 2, 4]
+
+
+def test_reload_after_restart_skips_stale_and_finished_orders(db):
+    async def place(db):
+        first = await db.create_order(7, ITEMS, 150, scheduled_time='12:00', scheduled_at=1200)
+        second = await db.create_order(7, ITEMS, 150, scheduled_time='11:00', scheduled_at=1100)
+        cancelled = await db.create_order(7, ITEMS, 150, scheduled_time='10:00', scheduled_at=1000)
+        # Давно прошедший заказ (например, заполненный миграцией) после рестарта не напоминает
+        await db.create_order(7, ITEMS, 150, scheduled_time='09:00', scheduled_at=900)
+        await db.create_order(7, ITEMS, 150, scheduled_time='Как можно скорее')
+        await db.update_order_status(cancelled, 'cancelled')
+        return first, second
+
+    first, second = db(place)
+    clock = FakeClock(now=1150)
+    scheduler = PreorderScheduler(never, clock=clock)
+    scheduler.load(db(lambda db: db.get_scheduled_orders(since=1000)))
+
+    # Просроченный за время простоя заказ срабатывает сразу
+    assert scheduler.pop_due() == [second]
+    clock.now = 1200
+    assert scheduler.pop_due() == [first]
+
+
+def test_scheduler_task_calls_on_due_once():
+    async def run():
+        fired = []
+
+        async def on_due(order_id: int):
+            fired.append(order_id)
+
+        scheduler = PreorderScheduler(on_due)
+        scheduler.start()
+        now = scheduler.clock()
+        scheduler.schedule(1, now + 0.05)
+        scheduler.schedule(2, now + 0.02)
+        scheduler.schedule(3, now + 0.03)
+        scheduler.cancel(3)
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+        return fired
+
+    assert asyncio.run(run()) == [2, 1]
+
+
+@pytest.mark.parametrize('text', ['9:30', '09:30', ' 09:30 '])
+def test_clock_time_with_and_without_leading_zero(text):
+    expected = datetime(2024, 5, 1, 9, 30, tzinfo=MOSCOW).timestamp()
+    assert parse_scheduled_time(text, local(8, 0), MOSCOW) == expected
+
+
+def test_past_clock_time_means_tomorrow():
+    expected = datetime(2024, 5, 2, 9, 30, tzinfo=MOSCOW).timestamp()
+    assert parse_scheduled_time('9:30', local(10, 0), MOSCOW) == expected
+
+
+def test_relative_time():
+    now = local(8, 0)
+    assert parse_scheduled_time('Через 30 минут', now, MOSCOW) == now.timestamp() + 1800
+    assert parse_scheduled_time('через 1 час', now, MOSCOW) == now.timestamp() + 3600
+
+
+def test_datetime_local_is_in_shop_timezone():
+    expected = datetime(2024, 5, 3, 14, 30, tzinfo=MOSCOW).timestamp()
+    assert parse_scheduled_time('2024-05-03T14:30', local(8, 0), MOSCOW) == expected
+
+
+@pytest.mark.parametrize('text', [None, '', 'Как можно скорее', '24:00', '9:60', 'завтра утром'])
+def test_unparsable_time_is_none(text):
+    assert parse_scheduled_time(text, local(8, 0), MOSCOW) is None
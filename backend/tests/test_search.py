@@ -0,0 +1,82 @@
+# backend/tests/test_search.py
+import sqlite3
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from config import SHOP_TIMEZONE
+from conftest import ITEMS
+
+CUTOFF = '2100-01-01 00:00:00'
+
+# Время из поля datetime-local Web App и соответствующий ему момент
+SCHEDULED_TIME = '2030-05-01T09:30'
+SCHEDULED_AT = datetime(2030, 5, 1, 9, 30, tzinfo=ZoneInfo(SHOP_TIMEZONE)).timestamp()
+
+
+async def found_ids(db, query: str):
+    orders, _ = await db.search_orders(query)
+    return [order['id'] for order in orders]
+
+
+def test_search_by_scheduled_time(db):
+    async def scenario(db):
+        await db.create_user(7)
+        order_id = await db.create_order(7, ITEMS, 150, scheduled_time=SCHEDULED_TIME, scheduled_at=SCHEDULED_AT)
+        await db.create_order(7, ITEMS, 150)
+        return order_id, [await found_ids(db, query) for query in ('9:30', '09:30', '9:45')]
+
+    order_id, results = db(scenario)
+    assert results == [[order_id], [order_id], []]
+
+
+def test_search_by_phone_in_any_notation(db):
+    async def scenario(db):
+        await db.create_user(7)
+        await db.update_user_profile(7, phone='+7 (999) 123-45-67')
+        order_id = await db.create_order(7, ITEMS, 150)
+        await db.create_user(8)
+        await db.create_order(8, ITEMS, 150)
+        return order_id, [await found_ids(db, query) for query in ('8 999 123-45-67', '9991234567', '4567')]
+
+    order_id, results = db(scenario)
+    assert results == [[order_id]] * 3
+
+
+def test_search_by_word_prefix(db):
+    async def scenario(db):
+        await db.create_user(7)
+        order_id = await db.create_order(7, [{**ITEMS[0], 'options': {'milk': 'овсяное'}}], 150, notes='без сахара')
+        return order_id, [await found_ids(db, query) for query in ('эсп', 'овся', 'эсп сах', 'круассан')]
+
+    order_id, results = db(scenario)
+    assert results == [[order_id], [order_id], [order_id], []]
+
+
+def test_search_finds_archived_orders(db):
+    async def scenario(db):
+        await db.create_user(7)
+        archived = await db.create_order(7, ITEMS, 150, scheduled_time=SCHEDULED_TIME, scheduled_at=SCHEDULED_AT)
+        await db.update_order_status(archived, 'completed')
+        live = await db.create_order(7, ITEMS, 150)
+        assert await db.archive_orders(CUTOFF) == 1
+        # Профиль, измененный после переноса, виден и в архивной строке индекса
+        await db.update_user_profile(7, phone='+7 999 123 45 67')
+        return archived, live, [await found_ids(db, query) for query in ('9:30', '4567')]
+
+    archived, live, (by_time, by_phone) = db(scenario)
+    assert by_time == [archived]
+    assert sorted(by_phone) == sorted([archived, live])
+
+
+def test_migration_indexes_local_time_of_existing_orders(db):
+    async def place(db):
+        await db.create_user(7)
+        return await db.create_order(7, ITEMS, 150, scheduled_time=SCHEDULED_TIME, scheduled_at=SCHEDULED_AT)
+
+    order_id = db(place)
+    # Строка индекса в том виде, как ее писали до scheduled_text
+    with sqlite3.connect(db.path) as conn:
+        conn.execute('UPDATE order_search SET scheduled_time = ? WHERE rowid = ?', (SCHEDULED_TIME, order_id))
+        conn.execute('DELETE FROM schema_version WHERE version = 14')
+
+    assert db(lambda db: found_ids(db, '9:30')) == [order_id]
@@ -0,0 +1,79 @@
+# backend/tests/test_update_processor.py
+import asyncio
+
+from telegram import Update
+
+from fakes import text_update
+from update_processor import PerUserUpdateProcessor
+
+
+def message(update_id: int, user_id: int) -> Update:
+    return Update.de_json(text_update(update_id, user_id, 'привет'), None)
+
+
+def test_busy_user_does_not_hold_slots_of_others():
+    """Серия обновлений одного пользователя ждет в своей очереди, а не в семафоре"""
+    async def run():
+        processor = PerUserUpdateProcessor(2)
+        release = asyncio.Event()
+        done = []
+
+        async def handle(update_id: int, blocking: bool = False):
+            if blocking:
+                await release.wait()
+            done.append(update_id)
+
+        busy = [asyncio.create_task(processor.process_update(message(i, 1), handle(i, blocking=i == 1)))
+                for i in range(1, 6)]
+        await asyncio.sleep(0)
+        await asyncio.wait_for(processor.process_update(message(10, 2), handle(10)), 1)
+        assert done == [10]
+
+        release.set()
+        await asyncio.gather(*busy)
+        return done, processor
+
+    done, processor = asyncio.run(run())
+    # Обновления одного пользователя - строго в порядке поступления
+    assert done == [10, 1, 2, 3, 4, 5]
+    assert not processor._locks and not processor._waiting
+
+
+def test_concurrency_limit_still_applies():
+    async def run():
+        processor = PerUserUpdateProcessor(3)
+        running = 0
+        peak = 0
+
+        async def handle():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(processor.process_update(message(i, i), handle()) for i in range(10)))
+        return peak
+
+    assert asyncio.run(run()) == 3
+
+
+def test_failed_update_frees_the_user_queue():
+    async def run():
+        processor = PerUserUpdateProcessor(2)
+
+        async def fail():
+            raise RuntimeError('handler failed')
+
+        async def handle():
+            return 'ok'
+
+        results = await asyncio.gather(processor.process_update(message(1, 1), fail()),
+                                       processor.process_update(message(2, 1), handle()),
+                                       return_exceptions=True)
+        return results, processor
+
+    results, processor = asyncio.run(run())
+    assert isinstance(results[0], RuntimeError)
+    assert results[1] is None
+    assert not processor._locks and not processor._waiting
@@ -0,0 +1,75 @@
+# backend/update_processor.py
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from admission import AdmissionController
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка для каждого пользователя
+
+    Обновления разных пользователей обрабатываются одновременно, а обновления
+    одного пользователя - строго по очереди, поэтому ConversationHandler и
+    user_data не видят гонок. Слот из max_concurrent_updates обновление
+    занимает только в свою очередь, поэтому серия обновлений одного
+    пользователя не блокирует остальных. Если задан admission, обновление
+    проходит его до ожидания очереди, так что отброшенные ее не занимают.
+    """
+
+    def __init__(self, max_concurrent_updates: int,
+                 admission: Optional[AdmissionController] = None):
+        super().__init__(max_concurrent_updates)
+        self.admission = admission
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._waiting: Dict[int, int] = {}
+
+    async def process_update(self, update: object, coroutine: Awaitable) -> None:
+        # В PTB метод помечен @final, но только здесь обновление еще не ждет семафор
+        if self.admission is not None and not self.admission.admit(update):
+            # Корутина обработки так и не запускается
+            coroutine.close()
+            return
+        try:
+            # Сначала очередь пользователя, потом семафор: обновление, ждущее предыдущее
+            # обновление того же пользователя, не держит слот, нужный другим пользователям
+            async with self._user_turn(update):
+                await super().process_update(update, coroutine)
+        finally:
+            if self.admission is not None:
+                self.admission.release()
+
+    @asynccontextmanager
+    async def _user_turn(self, update: object):
+        """Дождаться, пока закончатся предыдущие обновления того же пользователя"""
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            yield
+            return
+
+        lock = self._locks.get(user.id)
+        if lock is None:
+            lock = self._locks[user.id] = asyncio.Lock()
+        self._waiting[user.id] = self._waiting.get(user.id, 0) + 1
+
+        try:
+            async with lock:
+                yield
+        finally:
+            # Блокировка нужна, только пока у пользователя есть обновления в работе
+            self._waiting[user.id] -= 1
+            if not self._waiting[user.id]:
+                del self._waiting[user.id]
+                del self._locks[user.id]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
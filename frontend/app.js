@@ -36,7 +36,14 @@ class CoffeeShopApp {
 
     async loadMenu() {
         try {
-            const response = await fetch('menu.json');
+            // Версия меню приходит от бота в адресе Web App: ответ по адресу с версией
+            // кэшируется браузером, а после изменения меню меняется и адрес
+            const menuVersion = new URLSearchParams(window.location.search).get('menu_version');
+            const menuUrl = menuVersion ? `menu.json?v=${encodeURIComponent(menuVersion)}` : 'menu.json';
+            const response = await fetch(menuUrl);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
             this.menu = await response.json();
             this.renderProducts();
         } catch (error) {
@@ -425,7 +432,11 @@ class CoffeeShopApp {
             delivery_type: deliveryType,
             scheduled_time: scheduledTime,
             address: address,
-            notes: notes
+            notes: notes,
+            // Сколько баллов можно списать, бот решает по балансу; просим не больше суммы заказа
+            redeem_points: document.getElementById('usePoints').checked
+                ? Math.floor(this.cart.reduce((sum, item) => sum + (item.price * item.quantity), 0))
+                : 0
         };
 
         try {